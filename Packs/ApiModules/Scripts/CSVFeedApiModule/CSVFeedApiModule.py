@@ -3,16 +3,25 @@ from CommonServerPython import *
 from CommonServerUserPython import *
 
 ''' IMPORTS '''
+import codecs
 import csv
-import gzip
+import tempfile
 import urllib3
-from typing import Optional, Pattern, Dict, Any, Tuple, Union, List
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Pattern, Dict, Any, Tuple, Union, List, IO
 
 # disable insecure warnings
 urllib3.disable_warnings()
 
 # Globals
 DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+FETCH_MAX_WORKERS = 8
+FEED_CHUNK_SIZE = 64 * 1024
+# the zlib wbits value of gzip data
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+# the integration context key of the ETag and Last-Modified of each feed URL
+URL_VALIDATORS_KEY = 'url_validators'
 
 
 class Client(BaseClient):
@@ -105,74 +114,120 @@ class Client(BaseClient):
             'quotechar': quotechar,
             'skipinitialspace': skipinitialspace
         }
+        self.url_to_validators: Dict[str, dict] = {}
 
-    def _build_request(self, url):
-        r = requests.Request(
-            'GET',
-            url,
-            auth=self._auth
-        )
+    def get_url_response(self, url: str, **kwargs) -> requests.Response:
+        """Sends a GET request to the feed URL over the client session.
 
-        return r.prepare()
+        Args:
+            url: The feed's URL.
+            kwargs: Arguments to send to the request.
 
-    def build_iterator(self, **kwargs):
+        Returns:
+            Response. The feed response.
+        """
+        try:
+            r = self._session.get(url, **kwargs)
+        except requests.exceptions.ConnectTimeout as exception:
+            err_msg = 'Connection Timeout Error - potential reasons might be that the Server URL parameter' \
+                      ' is incorrect or that the Server is not accessible from your host.'
+            raise DemistoException(err_msg, exception)
+        except requests.exceptions.SSLError as exception:
+            # in case the "Trust any certificate" is already checked
+            if not self._verify:
+                raise
+            err_msg = 'SSL Certificate Verification Failed - try selecting \'Trust any certificate\' checkbox in' \
+                      ' the integration configuration.'
+            raise DemistoException(err_msg, exception)
+        except requests.exceptions.ProxyError as exception:
+            err_msg = 'Proxy Error - if the \'Use system proxy\' checkbox in the integration configuration is' \
+                      ' selected, try clearing the checkbox.'
+            raise DemistoException(err_msg, exception)
+        except requests.exceptions.ConnectionError as exception:
+            # Get originating Exception in Exception chain
+            error_class = str(exception.__class__)
+            err_type = '<' + error_class[error_class.find('\'') + 1: error_class.rfind('\'')] + '>'
+            err_msg = 'Verify that the server URL parameter' \
+                      ' is correct and that you have access to the server from your host.' \
+                      '\nError Type: {}\nError Number: [{}]\nMessage: {}\n' \
+                .format(err_type, exception.errno, exception.strerror)
+            raise DemistoException(err_msg, exception)
+        try:
+            r.raise_for_status()
+        except Exception as exception:
+            # this runs in the fetch workers, so the error is returned once by the main thread
+            raise DemistoException('Exception in request: {} {}'.format(r.status_code, r.content), exception)
+        return r
+
+    def get_url_responses(self, urls: List[str], url_to_validators: Dict[str, dict],
+                          **kwargs) -> Dict[str, Tuple[requests.Response, IO[bytes]]]:
+        """Sends the requests to the feed URLs, and downloads their content, concurrently.
+
+        Args:
+            urls: The feeds' URLs.
+            url_to_validators: The ETag and Last-Modified of each URL, sent as If-None-Match and If-Modified-Since.
+            kwargs: Arguments to send to the requests.
+
+        Returns:
+            Dict. The response of each URL, and its downloaded content, see download_feed_content.
+        """
+        def get_response(url: str) -> Tuple[requests.Response, IO[bytes]]:
+            validators = url_to_validators.get(url) or {}
+            conditional_headers = assign_params(**{'If-None-Match': validators.get('etag'),
+                                                   'If-Modified-Since': validators.get('last_modified')})
+            if not conditional_headers:
+                r = self.get_url_response(url, **kwargs)
+            else:
+                r = self.get_url_response(url, **{**kwargs, 'headers': {**(kwargs.get('headers') or {}),
+                                                                        **conditional_headers}})
+            return r, download_feed_content(r)
+
+        if len(urls) == 1:
+            return {urls[0]: get_response(urls[0])}
+        with ThreadPoolExecutor(max_workers=min(len(urls), FETCH_MAX_WORKERS)) as executor:
+            return dict(zip(urls, executor.map(get_response, urls)))
+
+    def build_iterator(self, conditional: bool = False, **kwargs):
+        """Requests and downloads the feed URLs concurrently over the client session, and returns a CSV reader for
+        each one, which parses the downloaded content while it is read.
+
+        Args:
+            conditional: Whether to send the ETag and Last-Modified stored for each URL, so the feed is skipped if
+                none of the URLs was modified.
+            kwargs: Arguments to send to the requests.
+
+        Returns:
+            List. The URL to reader dictionaries, empty if none of the URLs was modified.
+        """
         results = []
         urls = self._base_url
         if not isinstance(urls, list):
             urls = [urls]
-        for url in urls:
-            _session = requests.Session()
 
-            prepreq = self._build_request(url)
+        kwargs['stream'] = True
+        kwargs['verify'] = self._verify
+        kwargs['timeout'] = self.polling_timeout
+        kwargs['auth'] = self._auth
 
-            # this is to honour the proxy environment variables
-            kwargs.update(_session.merge_environment_settings(
-                prepreq.url,
-                {}, None, None, None  # defaults
-            ))
-            kwargs['stream'] = True
-            kwargs['verify'] = self._verify
-            kwargs['timeout'] = self.polling_timeout
-
-            if self.headers:
-                if 'headers' in kwargs:
-                    kwargs['headers'].update(self.headers)
-                else:
-                    kwargs['headers'] = self.headers
-
-            try:
-                r = _session.send(prepreq, **kwargs)
-            except requests.exceptions.ConnectTimeout as exception:
-                err_msg = 'Connection Timeout Error - potential reasons might be that the Server URL parameter' \
-                          ' is incorrect or that the Server is not accessible from your host.'
-                raise DemistoException(err_msg, exception)
-            except requests.exceptions.SSLError as exception:
-                # in case the "Trust any certificate" is already checked
-                if not self._verify:
-                    raise
-                err_msg = 'SSL Certificate Verification Failed - try selecting \'Trust any certificate\' checkbox in' \
-                          ' the integration configuration.'
-                raise DemistoException(err_msg, exception)
-            except requests.exceptions.ProxyError as exception:
-                err_msg = 'Proxy Error - if the \'Use system proxy\' checkbox in the integration configuration is' \
-                          ' selected, try clearing the checkbox.'
-                raise DemistoException(err_msg, exception)
-            except requests.exceptions.ConnectionError as exception:
-                # Get originating Exception in Exception chain
-                error_class = str(exception.__class__)
-                err_type = '<' + error_class[error_class.find('\'') + 1: error_class.rfind('\'')] + '>'
-                err_msg = 'Verify that the server URL parameter' \
-                          ' is correct and that you have access to the server from your host.' \
-                          '\nError Type: {}\nError Number: [{}]\nMessage: {}\n' \
-                    .format(err_type, exception.errno, exception.strerror)
-                raise DemistoException(err_msg, exception)
-            try:
-                r.raise_for_status()
-            except Exception:
-                return_error('Exception in request: {} {}'.format(r.status_code, r.content))
-                raise
+        if self.headers:
+            if 'headers' in kwargs:
+                kwargs['headers'].update(self.headers)
+            else:
+                kwargs['headers'] = self.headers
+
+        url_to_response = self.get_url_responses(urls, get_saved_url_validators() if conditional else {}, **kwargs)
+        not_modified_urls = [url for url, (r, _) in url_to_response.items() if r.status_code == 304]
+        if not_modified_urls:
+            if len(not_modified_urls) == len(urls):
+                demisto.debug('None of the feed URLs was modified, skipping the fetch.')
+                return []
+            # the indicators of all the URLs are created together, so the URLs which were not modified are needed too
+            url_to_response.update(self.get_url_responses(not_modified_urls, {}, **kwargs))
+        self.url_to_validators = {url: get_url_validators(r) for url, (r, _) in url_to_response.items()}
 
-            response = self.get_feed_content_divided_to_lines(url, r)
+        for url in urls:
+            _, feed_content = url_to_response[url]
+            response = self.get_feed_content_divided_to_lines(url, feed_content)
             if self.feed_url_to_config:
                 fieldnames = self.feed_url_to_config.get(url, {}).get('fieldnames', [])
                 skip_first_line = self.feed_url_to_config.get(url, {}).get('skip_first_line', False)
@@ -198,22 +253,109 @@ class Client(BaseClient):
 
         return results
 
-    def get_feed_content_divided_to_lines(self, url, raw_response):
-        """Fetch feed data and divides its content to lines
+    def get_feed_content_divided_to_lines(self, url, feed_content):
+        """Divides the downloaded feed content to lines, while it is read. The file is closed once it was read.
 
         Args:
             url: Current feed's url.
-            raw_response: The raw response from the feed's url.
+            feed_content: The file of the feed content, as returned from download_feed_content.
 
         Returns:
-            List. List of lines from the feed content.
+            Generator. The lines of the feed content.
         """
-        if self.feed_url_to_config and self.feed_url_to_config.get(url).get('is_zipped_file'):  # type: ignore
-            response_content = gzip.decompress(raw_response.content)
-        else:
-            response_content = raw_response.content
+        with feed_content:
+            chunks = iter(lambda: feed_content.read(FEED_CHUNK_SIZE), b'')
+            if self.feed_url_to_config and self.feed_url_to_config.get(url).get('is_zipped_file'):  # type: ignore
+                chunks = gunzip_chunks(chunks)
+            decoder = codecs.getincrementaldecoder(self.encoding)()
+            line_start = ''
+            for chunk in chunks:
+                lines = (line_start + decoder.decode(chunk)).split('\n')
+                line_start = lines.pop()
+                yield from lines
+            yield line_start + decoder.decode(b'', final=True)
+
+
+def gunzip_chunks(chunks):
+    """Decompresses gzip data while it is read, including data of several concatenated gzip members.
 
-        return response_content.decode(self.encoding).split('\n')
+    Args:
+        chunks: The compressed data chunks.
+
+    Returns:
+        Generator. The decompressed data chunks.
+    """
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    is_empty = True
+    for chunk in chunks:
+        while chunk:
+            if decompressor.eof:
+                if not chunk.strip(b'\x00'):
+                    # padding after the last gzip member is ignored, as done by gzip.decompress
+                    break
+                # the rest of the data belongs to the next gzip member
+                decompressor = zlib.decompressobj(GZIP_WBITS)
+            is_empty = False
+            yield decompressor.decompress(chunk)
+            chunk = decompressor.unused_data
+    if not (is_empty or decompressor.eof):
+        raise EOFError('Compressed file ended before the end-of-stream marker was reached')
+
+
+def download_feed_content(response: requests.Response) -> IO[bytes]:
+    """Downloads the feed content of the response to a temporary file, which is removed once it is closed.
+    The content is downloaded in chunks, so it is not kept in memory.
+
+    Args:
+        response: The streamed feed response.
+
+    Returns:
+        IO. The file of the feed content, at its start.
+    """
+    feed_content = tempfile.TemporaryFile()
+    try:
+        for chunk in response.iter_content(chunk_size=FEED_CHUNK_SIZE):
+            feed_content.write(chunk)
+    except Exception:
+        feed_content.close()
+        raise
+    finally:
+        response.close()
+    feed_content.seek(0)
+    return feed_content
+
+
+def get_url_validators(response: requests.Response) -> dict:
+    """Gets the ETag and Last-Modified headers of the feed response, used to request the URL conditionally.
+
+    Args:
+        response: The feed response.
+
+    Returns:
+        Dict. The 'etag' and 'last_modified' of the response.
+    """
+    return assign_params(etag=response.headers.get('ETag'), last_modified=response.headers.get('Last-Modified'))
+
+
+def get_saved_url_validators() -> Dict[str, dict]:
+    """Gets the ETag and Last-Modified of each URL, stored in the integration context by the previous fetch.
+
+    Returns:
+        Dict. The validators of each URL, as returned from get_url_validators.
+    """
+    return get_integration_context().get(URL_VALIDATORS_KEY) or {}
+
+
+def save_url_validators(url_to_validators: Dict[str, dict]):
+    """Stores the ETag and Last-Modified of each fetched URL in the integration context, to be sent in the next fetch.
+    The rest of the integration context is kept.
+
+    Args:
+        url_to_validators: The validators of each URL, as returned from get_url_validators.
+    """
+    integration_context = get_integration_context()
+    integration_context[URL_VALIDATORS_KEY] = url_to_validators
+    set_integration_context(integration_context)
 
 
 def determine_indicator_type(indicator_type, default_indicator_type, auto_detect, value):
@@ -289,8 +431,27 @@ def create_fields_mapping(raw_json: Dict[str, Any], mapping: Dict[str, Union[Tup
 def fetch_indicators_command(client: Client, default_indicator_type: str, auto_detect: bool, limit: int = 0,
                              create_relationships: bool = False, **kwargs):
     iterator = client.build_iterator(**kwargs)
+    return list(generate_indicators(client, iterator, default_indicator_type, auto_detect, limit,
+                                    create_relationships))
+
+
+def generate_indicators(client: Client, iterator: list, default_indicator_type: str, auto_detect: bool,
+                        limit: int = 0, create_relationships: bool = False):
+    """Lazily parses the indicators from the feeds readers, one row at a time.
+
+    Args:
+        client: The feed client.
+        iterator: The URL to reader dictionaries, as returned from client.build_iterator.
+        default_indicator_type: The indicator type to use if it is not configured for the URL.
+        auto_detect: Whether to detect the indicator type automatically.
+        limit: The maximal number of indicators to generate, 0 for no limit.
+        create_relationships: Whether to create the indicators relationships.
+
+    Returns:
+        Generator. The indicators.
+    """
     relationships_of_indicator = []
-    indicators = []
+    indicators_count = 0
     config = client.feed_url_to_config or {}
     for url_to_reader in iterator:
         for url, reader in url_to_reader.items():
@@ -332,12 +493,11 @@ def fetch_indicators_command(client: Client, default_indicator_type: str, auto_d
                     if client.tlp_color:
                         indicator['fields']['trafficlightprotocol'] = client.tlp_color
 
-                    indicators.append(indicator)
+                    yield indicator
+                    indicators_count += 1
                     # exit the loop if we have more indicators than the limit
-                    if limit and len(indicators) >= limit:
-                        return indicators
-
-    return indicators
+                    if limit and indicators_count >= limit:
+                        return
 
 
 def get_indicators_command(client, args: dict, tags: Optional[List[str]] = None):
@@ -373,16 +533,25 @@ def feed_main(feed_name, params=None, prefix=''):
     }
     try:
         if command == 'fetch-indicators':
-            indicators = fetch_indicators_command(
+            # unmodified feeds can only be skipped if the version supports the noUpdate argument of createIndicators
+            use_no_update = is_demisto_version_ge('6.5.0')
+            iterator = client.build_iterator(conditional=use_no_update)
+            if not iterator:
+                # none of the URLs was modified since the last fetch, so the previous indicators are kept
+                demisto.createIndicators([], noUpdate=True)
+                return
+            indicators = generate_indicators(
                 client,
+                iterator,
                 params.get('indicator_type'),
                 params.get('auto_detect_type'),
                 params.get('limit'),
                 params.get('create_relationships')
             )
-            # we submit the indicators in batches
-            for b in batch(indicators, batch_size=2000):
-                demisto.createIndicators(b)  # type: ignore
+            # we submit the indicators in batches while they are parsed, so only one batch is kept in memory
+            create_indicators_in_batches(indicators, batch_size=2000)
+            # the validators are stored only once the indicators were created, so a failed fetch is retried in full
+            save_url_validators(client.url_to_validators)
         else:
             args = demisto.args()
             args['feed_name'] = feed_name
@@ -146,9 +146,52 @@ def test_get_feed_content():
             )
 
             m.get(url, content=feed_url_to_config.get(url).get('content'))
-            raw_response = requests.get(url)
+            feed_content = download_feed_content(requests.get(url, stream=True))
 
-            assert client.get_feed_content_divided_to_lines(url, raw_response) == expected_output
+            assert list(client.get_feed_content_divided_to_lines(url, feed_content)) == expected_output
+            assert feed_content.closed
+
+
+@pytest.mark.parametrize('is_zipped_file', [False, True])
+def test_get_feed_content_streamed(mocker, is_zipped_file):
+    """
+    Given
+    - A feed content with multi-byte characters, which is read in chunks of 5 bytes.
+    - The zipped content is made of 2 gzip members, padded with zeros.
+
+    When
+    - Dividing the feed content to lines.
+
+    Then
+    - Ensure the lines are the same as of the whole content, when characters and lines are split between chunks.
+    """
+    import gzip
+    lines = ['1.1.1.1,ä€', '2.2.2.2,ö', '', '3.3.3.3,€€€']
+    content = '\n'.join(lines).encode('utf8')
+    if is_zipped_file:
+        content = gzip.compress(content[:13]) + gzip.compress(content[13:]) + b'\x00' * 8
+    client = Client(url='https://ipstack.com', encoding='utf8',
+                    feed_url_to_config={'https://ipstack.com': {'is_zipped_file': is_zipped_file}})
+    mocker.patch('CSVFeedApiModule.FEED_CHUNK_SIZE', 5)
+
+    assert list(client.get_feed_content_divided_to_lines('https://ipstack.com', io.BytesIO(content))) == lines
+
+
+def test_get_feed_content_truncated_gzip():
+    """
+    Given
+    - A zipped feed content which is truncated.
+
+    When
+    - Dividing the feed content to lines.
+
+    Then
+    - Ensure an error is raised.
+    """
+    import gzip
+    content = gzip.compress(b'1.1.1.1\n2.2.2.2')
+    with pytest.raises(EOFError):
+        list(gunzip_chunks([content[:-4]]))
 
 
 @pytest.mark.parametrize('date_string,expected_result', [
@@ -369,3 +412,81 @@ def test_get_indicators_without_relations():
         indicators = fetch_indicators_command(client, default_indicator_type=itype, auto_detect=False,
                                               limit=35, create_relationships=False)
         assert indicators == expected_res
+
+
+def test_feed_main_fetch_indicators_failed_urls(mocker):
+    """
+    Given
+    - A feed with 2 URLs, which both fail.
+
+    When
+    - Fetching indicators, while the URLs are requested by the fetch workers.
+
+    Then
+    - Ensure the workers raise the request error, and a single error is returned by the main thread.
+    """
+    import CSVFeedApiModule
+    urls = ['https://ipstack.com/1', 'https://ipstack.com/2']
+    feed_url_to_config = {url: {'fieldnames': ['value'], 'indicator_type': 'IP'} for url in urls}
+    mocker.patch.object(demisto, 'params', return_value={'url': urls, 'feed_url_to_config': feed_url_to_config})
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'getIntegrationContext', return_value={})
+    mocker.patch('CSVFeedApiModule.is_demisto_version_ge', return_value=True)
+    return_error = mocker.patch.object(CSVFeedApiModule, 'return_error')
+
+    with requests_mock.Mocker() as m:
+        for url in urls:
+            m.get(url, status_code=500, content=b'error')
+        feed_main('great_feed_name')
+
+    return_error.assert_called_once_with("Error in great_feed_name Integration [Exception in request: 500 b'error']")
+
+
+def test_feed_main_fetch_indicators_conditional(mocker):
+    """
+    Given
+    - A feed with 2 URLs, and the ETag of each URL stored by the previous fetch.
+
+    When
+    - Fetching indicators when none of the URLs was modified, and when one of them was modified.
+
+    Then
+    - Ensure the stored ETags are sent, and the fetch is skipped with noUpdate if no URL was modified.
+    - Ensure the URL which was not modified is requested again if the other one was modified,
+      and the new ETags are stored, keeping the rest of the integration context.
+    """
+    urls = ['https://ipstack.com/1', 'https://ipstack.com/2']
+    feed_url_to_config = {url: {'fieldnames': ['value'], 'indicator_type': 'IP'} for url in urls}
+    context = {'other': 'value', 'url_validators': {url: {'etag': f'"{i}"'} for i, url in enumerate(urls)}}
+    mocker.patch.object(demisto, 'params', return_value={'url': urls, 'feed_url_to_config': feed_url_to_config})
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'createIndicators')
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: context)
+    set_integration_context = mocker.patch.object(demisto, 'setIntegrationContext')
+    mocker.patch('CSVFeedApiModule.is_demisto_version_ge', return_value=True)
+
+    def response_callback(etag, content):
+        def callback(request, context):
+            if request.headers.get('If-None-Match') == etag:
+                context.status_code = 304
+                return b''
+            context.headers['ETag'] = etag
+            return content
+        return callback
+
+    with requests_mock.Mocker() as m:
+        m.get(urls[0], content=response_callback('"0"', b'1.1.1.1'))
+        m.get(urls[1], content=response_callback('"1"', b'2.2.2.2'))
+        feed_main('great_feed_name')
+        assert [request.headers.get('If-None-Match') for request in m.request_history] == ['"0"', '"1"']
+        demisto.createIndicators.assert_called_once_with([], noUpdate=True)
+        assert set_integration_context.call_count == 0
+
+        m.get(urls[1], content=response_callback('"2"', b'2.2.2.2'))
+        feed_main('great_feed_name')
+        assert sorted(request.headers.get('If-None-Match', '') for request in m.request_history[2:]) == \
+            ['', '"0"', '"1"']
+        indicators = demisto.createIndicators.call_args[0][0]
+        assert [indicator['value'] for indicator in indicators] == ['1.1.1.1', '2.2.2.2']
+        assert set_integration_context.call_args[0][0] == {
+            'other': 'value', 'url_validators': {urls[0]: {'etag': '"0"'}, urls[1]: {'etag': '"2"'}}}
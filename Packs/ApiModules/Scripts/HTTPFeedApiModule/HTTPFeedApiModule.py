@@ -5,7 +5,9 @@ from CommonServerUserPython import *
 ''' IMPORTS '''
 import urllib3
 import requests
-from typing import Optional, Pattern, List
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Pattern, List, Dict, Tuple, Callable, Match, IO, Iterator
 
 # disable insecure warnings
 urllib3.disable_warnings()
@@ -14,6 +16,11 @@ urllib3.disable_warnings()
 TAGS = 'tags'
 TLP_COLOR = 'trafficlightprotocol'
 DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+TRANSFORM_GROUP_REFERENCE_REGEX = re.compile(r'\\(?:g<(\w+)>|([1-9])(?![0-9]))')
+FETCH_MAX_WORKERS = 8
+FEED_CHUNK_SIZE = 64 * 1024
+# the integration context key of the ETag and Last-Modified of each feed URL
+URL_VALIDATORS_KEY = 'url_validators'
 
 
 class Client(BaseClient):
@@ -137,6 +144,9 @@ class Client(BaseClient):
         if custom_fields_mapping is None:
             custom_fields_mapping = {}
         self.custom_fields_mapping = custom_fields_mapping
+        self.url_to_extraction_plan: Dict[str, dict] = {}
+        # the ETag and Last-Modified of the URLs fetched by the last build_iterator call
+        self.url_to_validators: Dict[str, dict] = {}
 
     def get_feed_config(self, fields_json: str = '', indicator_json: str = ''):
         """
@@ -189,38 +199,74 @@ class Client(BaseClient):
 
         return config
 
-    def build_iterator(self, **kwargs):
+    def get_extraction_plan(self, url: str) -> dict:
         """
-        For each URL (service), send an HTTP request to get indicators and return them after filtering by Regex
-        :param kwargs: Arguments to send to the HTTP API endpoint
-        :return: List of indicators
+        Get the compiled extraction plan of a feed URL, building it on first use.
+        The plan holds the compiled indicator and field regexes of the URL's feed configuration, so that parsing a
+        line only runs the regexes. Fields that share a regex are grouped together so the regex is searched once
+        per line, and a field regex identical to the indicator regex reuses the indicator match.
+        :param url: The feed URL.
+        :return: The extraction plan, for example:
+            {
+                'indicator': (re.compile('^AS[0-9]+'), <expand function of r'\g<0>'>),
+                'fields': [(re.compile(r'^.*;\W([a-zA-Z]+)\W+'), False, [('asndrop_country', <expand function of r'\1'>)])],
+                'indicator_type': 'ASN'
+            }
         """
-        kwargs['stream'] = True
-        kwargs['verify'] = self._verify
-        kwargs['timeout'] = self.polling_timeout
+        plan = self.url_to_extraction_plan.get(url)
+        if plan is None:
+            plan = self.url_to_extraction_plan[url] = self.build_extraction_plan(url)
+        return plan
 
-        if self.headers is not None:
-            kwargs['headers'] = self.headers
+    def build_extraction_plan(self, url: str) -> dict:
+        """
+        Compile the feed configuration of a URL into an extraction plan, see ``get_extraction_plan``.
+        :param url: The feed URL.
+        :return: The extraction plan.
+        """
+        feed_config = self.feed_url_to_config.get(url, {})
+        indicator: Optional[Tuple[Pattern, Callable[[Match], str]]] = None
+        if 'indicator' in feed_config:
+            indicator_config = feed_config['indicator']
+            if 'regex' not in indicator_config:
+                raise ValueError(f'{self.feed_name} - indicator stanza should have a regex')
+            indicator = (re.compile(indicator_config['regex']),
+                         compile_transform(indicator_config.get('transform', r'\g<0>')))
 
-        if self.username is not None and self.password is not None:
-            kwargs['auth'] = (self.username, self.password)
+        regex_to_fields: Dict[Pattern, List[Tuple[str, Callable[[Match], str]]]] = {}
+        for field in feed_config.get('fields', []):
+            for f, fattrs in field.items():
+                if 'regex' not in fattrs:
+                    raise ValueError(f'{self.feed_name} - {f} field does not have a regex')
+                regex = re.compile(fattrs['regex'])
+                regex_to_fields.setdefault(regex, []).append((f, compile_transform(fattrs.get('transform', r'\g<0>'))))
+
+        return {
+            'indicator': indicator,
+            'fields': [(regex, bool(indicator) and regex == indicator[0], field_transforms)  # type: ignore[index]
+                       for regex, field_transforms in regex_to_fields.items()],
+            'indicator_type': feed_config.get('indicator_type', self.indicator_type)
+        }
+
+    def get_url_response(self, url: str, **kwargs) -> requests.Response:
+        """
+        Send an HTTP request to the URL over the client session
+        :param url: The URL to request
+        :param kwargs: Arguments to send to the HTTP API endpoint
+        :return: The response
+        """
         try:
-            urls = self._base_url
-            url_to_response_list: List[dict] = []
-            if not isinstance(urls, list):
-                urls = [urls]
-            for url in urls:
-                r = requests.get(
-                    url,
-                    **kwargs
-                )
-                try:
-                    r.raise_for_status()
-                except Exception:
-                    LOG(f'{self.feed_name!r} - exception in request:'
-                        f' {r.status_code!r} {r.content!r}')
-                    raise
-                url_to_response_list.append({url: r})
+            r = self._session.get(
+                url,
+                **kwargs
+            )
+            try:
+                r.raise_for_status()
+            except Exception:
+                LOG(f'{self.feed_name!r} - exception in request:'
+                    f' {r.status_code!r} {r.content!r}')
+                raise
+            return r
         except requests.exceptions.ConnectTimeout as exception:
             err_msg = 'Connection Timeout Error - potential reasons might be that the Server URL parameter' \
                       ' is incorrect or that the Server is not accessible from your host.'
@@ -246,27 +292,84 @@ class Client(BaseClient):
                 .format(err_type, exception.errno, exception.strerror)
             raise DemistoException(err_msg, exception)
 
+    def get_url_responses(self, urls: List[str], url_to_validators: Dict[str, dict],
+                          **kwargs) -> Dict[str, Tuple[requests.Response, IO[bytes]]]:
+        """
+        Send the HTTP requests to the URLs concurrently, and download their content concurrently as well
+        :param urls: The URLs to request
+        :param url_to_validators: The ETag and Last-Modified of the URLs, sent as If-None-Match and If-Modified-Since
+        :param kwargs: Arguments to send to the HTTP API endpoint
+        :return: The response of each URL, and its downloaded content, see download_feed_content
+        """
+        def get_response(url: str) -> Tuple[requests.Response, IO[bytes]]:
+            validators = url_to_validators.get(url) or {}
+            conditional_headers = assign_params(**{'If-None-Match': validators.get('etag'),
+                                                   'If-Modified-Since': validators.get('last_modified')})
+            if not conditional_headers:
+                r = self.get_url_response(url, **kwargs)
+            else:
+                r = self.get_url_response(url, **{**kwargs, 'headers': {**(kwargs.get('headers') or {}),
+                                                                        **conditional_headers}})
+            return r, download_feed_content(r)
+
+        if len(urls) == 1:
+            return {urls[0]: get_response(urls[0])}
+        with ThreadPoolExecutor(max_workers=min(len(urls), FETCH_MAX_WORKERS)) as executor:
+            return dict(zip(urls, executor.map(get_response, urls)))
+
+    def build_iterator(self, conditional: bool = False, **kwargs):
+        """
+        For each URL (service), send an HTTP request to get indicators and return them after filtering by Regex.
+        The URLs are requested and downloaded concurrently, over the client session, and are parsed from the downloaded
+        files while the indicators are iterated.
+        :param conditional: Whether to send the ETag and Last-Modified stored for each URL, so the feed is skipped if
+            none of the URLs was modified
+        :param kwargs: Arguments to send to the HTTP API endpoint
+        :return: List of indicators, and the value for the noUpdate argument
+        """
+        kwargs['stream'] = True
+        kwargs['verify'] = self._verify
+        kwargs['timeout'] = self.polling_timeout
+
+        if self.headers is not None:
+            kwargs['headers'] = self.headers
+
+        if self.username is not None and self.password is not None:
+            kwargs['auth'] = (self.username, self.password)
+
+        urls = self._base_url
+        if not isinstance(urls, list):
+            urls = [urls]
+        url_to_response = self.get_url_responses(urls, get_saved_url_validators() if conditional else {}, **kwargs)
+        not_modified_urls = [url for url, (r, _) in url_to_response.items() if r.status_code == 304]
+        if not_modified_urls:
+            if len(not_modified_urls) == len(urls):
+                demisto.debug(f'{self.feed_name!r} - none of the feed URLs was modified, skipping the fetch.')
+                return [], True
+            # the indicators of all the URLs are created together, so the URLs which were not modified are needed too
+            url_to_response.update(self.get_url_responses(not_modified_urls, {}, **kwargs))
+        self.url_to_validators = {url: get_url_validators(r) for url, (r, _) in url_to_response.items()}
+
         results = []
-        for url_to_response in url_to_response_list:
-            for url, lines in url_to_response.items():
-                result = lines.iter_lines()
-                if self.encoding is not None:
-                    result = map(
-                        lambda x: x.decode(self.encoding).encode('utf_8'),
-                        result
-                    )
-                else:
-                    result = map(
-                        lambda x: x.decode('utf_8'),
-                        result
-                    )
-                if self.ignore_regex is not None:
-                    result = filter(
-                        lambda x: self.ignore_regex.match(x) is None,  # type: ignore[union-attr]
-                        result
-                    )
-                results.append({url: result})
-        return results, get_no_update_value(r)
+        for url in urls:
+            result = iter_feed_content_lines(url_to_response[url][1])
+            if self.encoding is not None:
+                result = map(
+                    lambda x: x.decode(self.encoding).encode('utf_8'),
+                    result
+                )
+            else:
+                result = map(
+                    lambda x: x.decode('utf_8'),
+                    result
+                )
+            if self.ignore_regex is not None:
+                result = filter(
+                    lambda x: self.ignore_regex.match(x) is None,  # type: ignore[union-attr]
+                    result
+                )
+            results.append({url: result})
+        return results, all(get_no_update_value(r, url) for url, (r, _) in url_to_response.items())
 
     def custom_fields_creator(self, attributes: dict):
         created_custom_fields = {}
@@ -280,7 +383,75 @@ class Client(BaseClient):
         return created_custom_fields
 
 
-def get_no_update_value(response: requests.Response) -> bool:
+def download_feed_content(response: requests.Response) -> IO[bytes]:
+    """
+    Download the feed content of the response to a temporary file, which is removed once it is closed.
+    The content is downloaded in chunks, so it is not kept in memory.
+    Args:
+        response: (requests.Response) The streamed feed response.
+    Returns:
+        The file of the feed content, at its start.
+    """
+    feed_content = tempfile.TemporaryFile()
+    try:
+        for chunk in response.iter_content(chunk_size=FEED_CHUNK_SIZE):
+            feed_content.write(chunk)
+    except Exception:
+        feed_content.close()
+        raise
+    finally:
+        response.close()
+    feed_content.seek(0)
+    return feed_content
+
+
+def iter_feed_content_lines(feed_content: IO[bytes]) -> Iterator[bytes]:
+    """
+    Iterate the lines of the downloaded feed content, as requests.Response.iter_lines does, while it is read.
+    The file is closed once all of its lines were read.
+    Args:
+        feed_content: The file of the feed content, as returned from download_feed_content.
+    Returns:
+        The lines of the feed content.
+    """
+    with feed_content:
+        for line in feed_content:
+            yield from line.splitlines()
+
+
+def get_url_validators(response: requests.Response) -> dict:
+    """
+    Get the ETag and Last-Modified headers of the feed response, used to request the URL conditionally.
+    Args:
+        response: (requests.Response) The feed response.
+    Returns:
+        dict with the 'etag' and 'last_modified' of the response.
+    """
+    return assign_params(etag=response.headers.get('ETag'), last_modified=response.headers.get('Last-Modified'))
+
+
+def get_saved_url_validators() -> Dict[str, dict]:
+    """
+    Get the ETag and Last-Modified of each URL, stored in the integration context by the previous fetch.
+    Returns:
+        dict with the validators of each URL, as returned from get_url_validators.
+    """
+    return get_integration_context().get(URL_VALIDATORS_KEY) or {}
+
+
+def save_url_validators(url_to_validators: Dict[str, dict]):
+    """
+    Store the ETag and Last-Modified of each fetched URL in the integration context, to be sent in the next fetch.
+    The rest of the integration context is kept.
+    Args:
+        url_to_validators: (dict) The validators of each URL, as returned from get_url_validators.
+    """
+    integration_context = get_integration_context()
+    integration_context[URL_VALIDATORS_KEY] = url_to_validators
+    set_integration_context(integration_context)
+
+
+def get_no_update_value(response: requests.Response, url: str) -> bool:
     """
     detect if the feed response has been modified according to the headers etag and last_modified.
     For more information, see this:
@@ -288,20 +459,19 @@ def get_no_update_value(response: requests.Response) -> bool:
     https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/ETag
     Args:
         response: (requests.Response) The feed response.
+        url: (str) The feed URL, by which the previous values are stored in the integration context.
     Returns:
         boolean with the value for noUpdate argument.
         The value should be False if the response was modified.
     """
 
-    context = get_integration_context()
+    context = get_saved_url_validators().get(url) or {}
     old_etag = context.get('etag')
     old_last_modified = context.get('last_modified')
 
     etag = response.headers.get('ETag')
     last_modified = response.headers.get('Last-Modified')
 
-    set_integration_context({'last_modified': last_modified, 'etag': etag})
-
     if old_etag and old_etag != etag:
         demisto.debug('New indicators fetched - the ETag value has been updated,'
                       ' createIndicators will be executed with noUpdate=False.')
@@ -316,6 +486,33 @@ def get_no_update_value(response: requests.Response) -> bool:
     return True
 
 
+def compile_transform(transform: str) -> Callable[[Match], str]:
+    """
+    Compile the transform template of an extraction dictionary into a function that expands it for a regex match.
+    Templates made of literal text and group references (e.g. \\1, \\g<0>, \\g<name>) are expanded by joining
+    the match groups directly, as ``Match.expand`` parses the template again on every call.
+    Any other template falls back to ``Match.expand``.
+    :param transform: The transform template, for example: '\\1/\\2'
+    :return: A function getting a regex match and returning the expanded template.
+    """
+    parts = TRANSFORM_GROUP_REFERENCE_REGEX.split(transform)
+    literals = parts[::3]
+    if any('\\' in literal for literal in literals):
+        return lambda match: match.expand(transform)
+
+    groups = [int(number) if number else int(name) if name.isdigit() else name
+              for name, number in zip(parts[1::3], parts[2::3])]
+    if len(groups) == 1 and not literals[0] and not literals[1]:
+        group = groups[0]
+        return lambda match: match.group(group) or ''
+
+    def expand(match: Match) -> str:
+        values = [match.group(group) or '' for group in groups]
+        return ''.join(literal + value for literal, value in zip(literals, values)) + literals[-1]
+
+    return expand
+
+
 def datestring_to_server_format(date_string: str) -> str:
     """
     formats a datestring to the ISO-8601 format which the server expects to recieve
@@ -338,48 +535,28 @@ def get_indicator_fields(line, url, feed_tags: list, tlp_color: Optional[str], c
     """
     attributes = None
     value: str = ''
-    indicator = None
-    fields_to_extract = []
-    feed_config = client.feed_url_to_config.get(url, {})
-    if feed_config:
-        if 'indicator' in feed_config:
-            indicator = feed_config['indicator']
-            if 'regex' in indicator:
-                indicator['regex'] = re.compile(indicator['regex'])
-            if 'transform' not in indicator:
-                indicator['transform'] = r'\g<0>'
-
-    if 'fields' in feed_config:
-        fields = feed_config['fields']
-        for field in fields:
-            for f, fattrs in field.items():
-                field = {f: {}}
-                if 'regex' in fattrs:
-                    field[f]['regex'] = re.compile(fattrs['regex'])
-                if 'transform' not in fattrs:
-                    field[f]['transform'] = r'\g<0>'
-                else:
-                    field[f]['transform'] = fattrs['transform']
-                fields_to_extract.append(field)
+    plan = client.get_extraction_plan(url)
+    indicator = plan['indicator']
 
     line = line.strip()
     if line:
-        extracted_indicator = line.split()[0]
+        indicator_match = None
         if indicator:
-            extracted_indicator = indicator['regex'].search(line)
-            if extracted_indicator is None:
+            indicator_match = indicator[0].search(line)
+            if indicator_match is None:
                 return attributes, value
-            if 'transform' in indicator:
-                extracted_indicator = extracted_indicator.expand(indicator['transform'])
+            extracted_indicator = indicator[1](indicator_match)
+        else:
+            extracted_indicator = line.split()[0]
         attributes = {}
-        for field in fields_to_extract:
-            for f, fattrs in field.items():
-                m = fattrs['regex'].search(line)
+        for regex, is_indicator_regex, field_transforms in plan['fields']:
+            m = indicator_match if is_indicator_regex else regex.search(line)
 
-                if m is None:
-                    continue
+            if m is None:
+                continue
 
-                attributes[f] = m.expand(fattrs['transform'])
+            for f, expand in field_transforms:
+                attributes[f] = expand(m)
 
                 try:
                     i = int(attributes[f])
@@ -388,7 +565,7 @@ def get_indicator_fields(line, url, feed_tags: list, tlp_color: Optional[str], c
                 else:
                     attributes[f] = i
         attributes['value'] = value = extracted_indicator
-        attributes['type'] = feed_config.get('indicator_type', client.indicator_type)
+        attributes['type'] = plan['indicator_type']
         attributes['tags'] = feed_tags
 
         if tlp_color:
@@ -399,7 +576,23 @@ def get_indicator_fields(line, url, feed_tags: list, tlp_color: Optional[str], c
 
 def fetch_indicators_command(client, feed_tags, tlp_color, itype, auto_detect, create_relationships=False, **kwargs):
     iterators, no_update = client.build_iterator(**kwargs)
-    indicators = []
+    indicators = list(generate_indicators(client, iterators, feed_tags, tlp_color, itype, auto_detect,
+                                          create_relationships))
+    return indicators, no_update
+
+
+def generate_indicators(client, iterators, feed_tags, tlp_color, itype, auto_detect, create_relationships=False):
+    """
+    Lazily parse the indicators from the feed responses, one line at a time.
+    :param client: The client
+    :param iterators: The URL to lines iterators, as returned from client.build_iterator
+    :param feed_tags: The indicator tags.
+    :param tlp_color: Traffic Light Protocol color.
+    :param itype: The default indicator type.
+    :param auto_detect: Whether to detect the indicator type automatically.
+    :param create_relationships: Whether to create the indicators relationships.
+    :return: A generator of the indicators.
+    """
     for iterator in iterators:
         for url, lines in iterator.items():
             for line in lines:
@@ -434,8 +627,7 @@ def fetch_indicators_command(client, feed_tags, tlp_color, itype, auto_detect, c
                         custom_fields = client.custom_fields_creator(attributes)
                         indicator_data["fields"] = custom_fields
 
-                    indicators.append(indicator_data)
-    return indicators, no_update
+                    yield indicator_data
 
 
 def determine_indicator_type(indicator_type, default_indicator_type, auto_detect, value):
@@ -504,20 +696,22 @@ def feed_main(feed_name, params=None, prefix=''):
     }
     try:
         if command == 'fetch-indicators':
-            indicators, no_update = fetch_indicators_command(client, feed_tags, tlp_color,
-                                                             params.get('indicator_type'),
-                                                             params.get('auto_detect_type'),
-                                                             params.get('create_relationships'))
-
-            # check if the version is higher than 6.5.0 so we can use noUpdate parameter
-            if is_demisto_version_ge('6.5.0'):
-                # we submit the indicators in batches
-                for b in batch(indicators, batch_size=2000):
-                    demisto.createIndicators(b, noUpdate=no_update)
-            else:
-                # call createIndicators without noUpdate arg
-                for b in batch(indicators, batch_size=2000):
-                    demisto.createIndicators(b)
+            # check if the version is higher than 6.5.0 so we can use noUpdate parameter, and skip unmodified feeds
+            use_no_update = is_demisto_version_ge('6.5.0')
+            iterators, no_update = client.build_iterator(conditional=use_no_update)
+            if not iterators:
+                # none of the URLs was modified since the last fetch, so the previous indicators are kept
+                demisto.createIndicators([], noUpdate=True)
+                return
+            indicators = generate_indicators(client, iterators, feed_tags, tlp_color,
+                                             params.get('indicator_type'),
+                                             params.get('auto_detect_type'),
+                                             params.get('create_relationships'))
+
+            # the indicators are parsed while being submitted in batches, so only one batch is kept in memory.
+            create_indicators_in_batches(indicators, batch_size=2000,
+                                         no_update=no_update if use_no_update else None)
+            save_url_validators(client.url_to_validators)
 
         else:
             args = demisto.args()
@@ -1,5 +1,8 @@
 from HTTPFeedApiModule import get_indicators_command, Client, datestring_to_server_format, feed_main,\
-    fetch_indicators_command, get_no_update_value
+    fetch_indicators_command, get_no_update_value, get_indicator_fields, compile_transform
+from HTTPFeedApiModule import download_feed_content, iter_feed_content_lines
+import re
+import pytest
 import requests_mock
 import demistomock as demisto
 
@@ -455,29 +458,197 @@ def test_get_no_update_value_empty_context():
     - Ensure that the response is True.
     """
     class MockResponse:
-        headers = {'last_modified': 'Fri, 30 Jul 2021 00:24:13 GMT',  # guardrails-disable-line
-                   'etag': 'd309ab6e51ed310cf869dab0dfd0d34b'}  # guardrails-disable-line
-    no_update = get_no_update_value(MockResponse())
+        headers = {'Last-Modified': 'Fri, 30 Jul 2021 00:24:13 GMT',  # guardrails-disable-line
+                   'ETag': 'd309ab6e51ed310cf869dab0dfd0d34b'}  # guardrails-disable-line
+    no_update = get_no_update_value(MockResponse(), 'https://test.com')
     assert no_update
 
 
-def test_get_no_update_value(mocker):
+@pytest.mark.parametrize('headers, expected_no_update', [
+    ({'Last-Modified': 'Fri, 30 Jul 2021 00:24:13 GMT', 'ETag': 'd309ab6e51ed310cf869dab0dfd0d34b'}, True),
+    ({'Last-Modified': 'Fri, 30 Jul 2021 00:24:13 GMT', 'ETag': 'e309ab6e51ed310cf869dab0dfd0d34b'}, False),
+    ({'Last-Modified': 'Sat, 31 Jul 2021 00:24:13 GMT', 'ETag': 'd309ab6e51ed310cf869dab0dfd0d34b'}, False),
+])
+def test_get_no_update_value(mocker, headers, expected_no_update):
     """
     Given
-    - response with last_modified and etag headers with the same values like in the integration context.
+    - response with last_modified and etag headers, compared to the values of the URL in the integration context.
 
     When
     - Running get_no_update_value method.
 
     Then
-    - Ensure that the response is False
+    - Ensure that the response is True only if both values are the same
     """
     mocker.patch.object(demisto, 'getIntegrationContext',
-                        return_value={'last_modified': 'Fri, 30 Jul 2021 00:24:13 GMT',  # guardrails-disable-line
-                                      'etag': 'd309ab6e51ed310cf869dab0dfd0d34b'})  # guardrails-disable-line
+                        return_value={'url_validators': {'https://test.com': {
+                            'last_modified': 'Fri, 30 Jul 2021 00:24:13 GMT',  # guardrails-disable-line
+                            'etag': 'd309ab6e51ed310cf869dab0dfd0d34b'}}})  # guardrails-disable-line
 
     class MockResponse:
-        headers = {'last_modified': 'Fri, 30 Jul 2021 00:24:13 GMT',  # guardrails-disable-line
-                   'etag': 'd309ab6e51ed310cf869dab0dfd0d34b'}  # guardrails-disable-line
-    no_update = get_no_update_value(MockResponse())
-    assert not no_update
+        pass
+    MockResponse.headers = headers
+    assert get_no_update_value(MockResponse(), 'https://test.com') is expected_no_update
+    assert get_no_update_value(MockResponse(), 'https://other.com')
+
+
+@pytest.mark.parametrize('content', [b'1.1.1.1\n2.2.2.2\n', b'1.1.1.1\r\n\r\n2.2.2.2', b'', b'\n'])
+def test_iter_feed_content_lines(requests_mock, content):
+    """
+    Given
+    - A feed content with different line endings.
+
+    When
+    - Downloading the feed content, and iterating its lines.
+
+    Then
+    - Ensure the lines are the same as of requests.Response.iter_lines, and the downloaded file is closed.
+    """
+    import requests
+    requests_mock.get('https://test.com', content=content)
+    feed_content = download_feed_content(requests.get('https://test.com', stream=True))
+    assert list(iter_feed_content_lines(feed_content)) == list(requests.get('https://test.com').iter_lines())
+    assert feed_content.closed
+
+
+def test_build_iterator_downloads_concurrently(mocker, requests_mock):
+    """
+    Given
+    - A feed with 2 URLs.
+
+    When
+    - Building the iterator of the feed.
+
+    Then
+    - Ensure the content of each URL is downloaded by the worker which requested it, and not while it is parsed.
+    """
+    import threading
+    import HTTPFeedApiModule
+    urls = ['https://test.com/1', 'https://test.com/2']
+    for i, url in enumerate(urls):
+        requests_mock.get(url, content=f'{i}.{i}.{i}.{i}'.encode())
+    download_threads = []
+
+    def download(response):
+        download_threads.append(threading.current_thread())
+        return download_feed_content(response)
+
+    mocker.patch.object(HTTPFeedApiModule, 'download_feed_content', side_effect=download)
+    client = Client(url=urls, feed_url_to_config={url: {'indicator_type': 'IP'} for url in urls})
+    results, _ = client.build_iterator()
+    assert len(download_threads) == 2
+    assert threading.current_thread() not in download_threads
+    assert [list(result[url]) for result, url in zip(results, urls)] == [['0.0.0.0'], ['1.1.1.1']]
+
+
+def test_feed_main_fetch_indicators_conditional(mocker, requests_mock):
+    """
+    Given
+    - A feed with 2 URLs, and the ETag of each URL stored by the previous fetch.
+
+    When
+    - Fetching indicators when none of the URLs was modified, and when one of them was modified.
+
+    Then
+    - Ensure the stored ETags are sent, and the fetch is skipped with noUpdate if no URL was modified.
+    - Ensure the URL which was not modified is requested again if the other one was modified,
+      and the new ETags are stored, keeping the rest of the integration context.
+    """
+    urls = ['https://test.com/1', 'https://test.com/2']
+    context = {'other': 'value', 'url_validators': {url: {'etag': f'"{i}"'} for i, url in enumerate(urls)}}
+    feed_url_to_config = {url: {'indicator_type': 'IP', 'indicator': {'regex': r'^.+$'}} for url in urls}
+    mocker.patch.object(demisto, 'params', return_value={'url': urls, 'feed_url_to_config': feed_url_to_config})
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'createIndicators')
+    mocker.patch.object(demisto, 'getIntegrationContext', side_effect=lambda: context)
+    set_integration_context = mocker.patch.object(demisto, 'setIntegrationContext')
+    mocker.patch('HTTPFeedApiModule.is_demisto_version_ge', return_value=True)
+
+    def response_callback(url, etag, content):
+        def callback(request, context):
+            if request.headers.get('If-None-Match') == etag:
+                context.status_code = 304
+                return b''
+            context.headers['ETag'] = etag
+            return content
+        return callback
+
+    requests_mock.get(urls[0], content=response_callback(urls[0], '"0"', b'1.1.1.1'))
+    requests_mock.get(urls[1], content=response_callback(urls[1], '"1"', b'2.2.2.2'))
+    feed_main('great_feed_name')
+    assert [request.headers.get('If-None-Match') for request in requests_mock.request_history] == ['"0"', '"1"']
+    demisto.createIndicators.assert_called_once_with([], noUpdate=True)
+    assert set_integration_context.call_count == 0
+
+    requests_mock.get(urls[1], content=response_callback(urls[1], '"2"', b'2.2.2.2'))
+    feed_main('great_feed_name')
+    assert sorted(request.headers.get('If-None-Match', '') for request in requests_mock.request_history[2:]) == \
+        ['', '"0"', '"1"']
+    indicators = demisto.createIndicators.call_args[0][0]
+    assert [indicator['value'] for indicator in indicators] == ['1.1.1.1', '2.2.2.2']
+    assert demisto.createIndicators.call_args[1] == {'noUpdate': False}
+    assert set_integration_context.call_args[0][0] == {
+        'other': 'value', 'url_validators': {urls[0]: {'etag': '"0"'}, urls[1]: {'etag': '"2"'}}}
+
+
+@pytest.mark.parametrize('regex, transform', [
+    (r'^(\d+)\.(\d+)', r'\g<0>'),
+    (r'^(\d+)\.(\d+)', r'\1'),
+    (r'^(\d+)\.(\d+)', r'\1/\2'),
+    (r'^(\d+)\.(\d+)', r'prefix-\g<2>-suffix'),
+    (r'^(?P<first>\d+)\.(\d+)', r'\g<first>:\2'),
+    (r'^(\d+)\.(\d+)(x)?', r'\1\3'),
+    (r'^(\d+)\.(\d+)', r'\1\t\2'),
+])
+def test_compile_transform(regex, transform):
+    """
+    Given
+    - A regex and a transform template of an extraction dictionary.
+
+    When
+    - Compiling the transform and expanding it for a match.
+
+    Then
+    - Ensure the result is the same as the one of Match.expand.
+    """
+    match = re.search(regex, '1234.5678 rest of line')
+    assert compile_transform(transform)(match) == match.expand(transform)
+
+
+def test_get_indicator_fields_extraction_plan(mocker):
+    """
+    Given
+    - A feed configuration where a field shares its regex with the indicator.
+
+    When
+    - Extracting the indicator fields of several lines.
+
+    Then
+    - Ensure the extraction plan is compiled once for all lines.
+    - Ensure the indicator and the fields are extracted as expected.
+    """
+    url = 'https://www.spamhaus.org/drop/asndrop.txt'
+    client = Client(
+        url=url,
+        indicator_type='CIDR',
+        indicator=r'{"regex": "^(\\d+\\.\\d+\\.\\d+\\.\\d+)\\t(\\d+)\\t(\\w+)", "transform": "\\1/\\2"}',
+        fields=r'{"geocountry": {"regex": "^(\\d+\\.\\d+\\.\\d+\\.\\d+)\\t(\\d+)\\t(\\w+)", "transform": "\\3"},'
+               r' "numberofattacks": {"regex": "\\t(\\d+)$", "transform": "\\1"}}'
+    )
+    build_extraction_plan = mocker.spy(client, 'build_extraction_plan')
+
+    attributes, value = get_indicator_fields('1.1.1.0\t24\tUS\t17', url, ['tag'], 'RED', client)
+    get_indicator_fields('2.2.2.0\t24\tIL\t5', url, ['tag'], 'RED', client)
+    _, no_value = get_indicator_fields('# comment', url, ['tag'], 'RED', client)
+
+    assert build_extraction_plan.call_count == 1
+    assert value == '1.1.1.0/24'
+    assert not no_value
+    assert attributes == {
+        'geocountry': 'US',
+        'numberofattacks': 17,
+        'value': '1.1.1.0/24',
+        'type': 'CIDR',
+        'tags': ['tag'],
+        'trafficlightprotocol': 'RED'
+    }
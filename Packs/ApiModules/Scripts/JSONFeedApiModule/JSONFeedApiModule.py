@@ -3,7 +3,7 @@ from CommonServerPython import *
 ''' IMPORTS '''
 import urllib3
 import jmespath
-from typing import List, Dict, Union, Optional, Callable, Tuple
+from typing import List, Dict, Union, Optional, Callable, Tuple, Iterator
 
 # disable insecure warnings
 urllib3.disable_warnings()
@@ -196,7 +196,19 @@ def fetch_indicators_command(client: Client, indicator_type: str, feedTags: list
     :param limit: given only when get-indicators command is running. function will return number indicators as the limit
     :param create_relationships: whether to add connected indicators
     """
-    indicators: List[dict] = []
+    indicators, no_update = stream_indicators(client, indicator_type, feedTags, auto_detect, create_relationships,
+                                              limit, **kwargs)
+    return list(indicators), no_update
+
+
+def stream_indicators(client: Client, indicator_type: str, feedTags: list, auto_detect: bool,
+                      create_relationships: bool = False, limit: int = 0,
+                      **kwargs) -> Tuple[Iterator[dict], bool]:
+    """
+    Requests the feeds from client, and returns a generator which handles their items into indicators lazily,
+    so the indicators can be created in batches without keeping all of them in memory.
+    See fetch_indicators_command for the arguments.
+    """
     feeds_results = {}
     no_update = False
     for feed_name, feed in client.feed_name_to_config.items():
@@ -209,6 +221,18 @@ def fetch_indicators_command(client: Client, indicator_type: str, feedTags: list
         else:
             feeds_results[feed_name], no_update = client.build_iterator(feed, **kwargs)
 
+    return generate_indicators(client, feeds_results, indicator_type, feedTags, auto_detect, create_relationships,
+                               limit), no_update
+
+
+def generate_indicators(client: Client, feeds_results: dict, indicator_type: str, feedTags: list, auto_detect: bool,
+                        create_relationships: bool = False, limit: int = 0) -> Iterator[dict]:
+    """
+    Lazily handles the items of the feeds results into indicators, one item at a time.
+    :param feeds_results: a dictionary of the feed name to its items
+    See fetch_indicators_command for the rest of the arguments.
+    """
+    indicators_count = 0
     for service_name, items in feeds_results.items():
         feed_config = client.feed_name_to_config.get(service_name, {})
         indicator_field = str(feed_config.get('indicator') if feed_config.get('indicator') else 'indicator')
@@ -222,15 +246,16 @@ def fetch_indicators_command(client: Client, indicator_type: str, feedTags: list
             if isinstance(item, str):
                 item = {indicator_field: item}
 
-            indicators.extend(
-                handle_indicator_function(client, item, feed_config, service_name, indicator_type, indicator_field,
-                                          use_prefix_flat, feedTags, auto_detect, mapping_function,
-                                          create_relationships, create_relationships_function))
+            for indicator in handle_indicator_function(client, item, feed_config, service_name, indicator_type,
+                                                       indicator_field, use_prefix_flat, feedTags, auto_detect,
+                                                       mapping_function, create_relationships,
+                                                       create_relationships_function):
+                yield indicator
+                indicators_count += 1
 
-            if limit and len(indicators) >= limit:  # We have a limitation only when get-indicators command is
+            if limit and indicators_count >= limit:  # We have a limitation only when get-indicators command is
                 # called, and then we return for each service_name "limit" of indicators
                 break
-    return indicators, no_update
 
 
 def indicator_mapping(mapping: Dict, indicator: Dict, attributes: Dict):
@@ -373,24 +398,18 @@ def feed_main(params, feed_name, prefix):
 
         elif command == 'fetch-indicators':
             create_relationships = params.get('create_relationships')
-            indicators, no_update = fetch_indicators_command(client, indicator_type, feedTags, auto_detect,
-                                                             create_relationships)
+            indicators, no_update = stream_indicators(client, indicator_type, feedTags, auto_detect,
+                                                      create_relationships)
 
             # check if the version is higher than 6.5.0 so we can use noUpdate parameter
             if is_demisto_version_ge('6.5.0'):
-                if not indicators:
-                    demisto.createIndicators(indicators, noUpdate=no_update)
-                else:
-                    for b in batch(indicators, batch_size=2000):
-                        demisto.createIndicators(b, noUpdate=no_update)
+                if not create_indicators_in_batches(indicators, batch_size=2000, no_update=no_update):
+                    demisto.createIndicators([], noUpdate=no_update)
 
             else:
                 # call createIndicators without noUpdate arg
-                if not indicators:
-                    demisto.createIndicators(indicators)
-                else:
-                    for b in batch(indicators, batch_size=2000):
-                        demisto.createIndicators(b)
+                if not create_indicators_in_batches(indicators, batch_size=2000):
+                    demisto.createIndicators([])
 
         elif command == f'{prefix}get-indicators':
             # dummy command for testing
@@ -1,4 +1,4 @@
-from JSONFeedApiModule import Client, fetch_indicators_command, jmespath, get_no_update_value
+from JSONFeedApiModule import Client, fetch_indicators_command, jmespath, get_no_update_value, feed_main
 from CommonServerPython import *
 import requests_mock
 import demistomock as demisto
@@ -152,6 +152,68 @@ def test_post_of_indicators_with_no_json_object():
         assert indicators[1].get('rawJSON') == {'indicator': '2.2.2.2'}
 
 
+def test_feed_main_fetch_indicators_in_batches(mocker):
+    """
+    Given
+    - A feed with 1117 indicators.
+
+    When
+    - Fetching indicators.
+
+    Then
+    - Ensure createIndicators is called with batches of 2000 indicators at most, holding all the indicators.
+    """
+    with open('test_data/amazon_ip_ranges.json') as ip_ranges_json:
+        ip_ranges = json.load(ip_ranges_json)
+    ip_ranges['prefixes'] = ip_ranges['prefixes'] * 2
+
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'createIndicators')
+    mocker.patch('JSONFeedApiModule.is_demisto_version_ge', return_value=True)
+    params = {
+        'url': 'https://ip-ranges.amazonaws.com/ip-ranges.json',
+        'extractor': "prefixes[?service=='AMAZON']",
+        'indicator': 'ip_prefix',
+        'indicator_type': 'CIDR'
+    }
+
+    with requests_mock.Mocker() as m:
+        m.get('https://ip-ranges.amazonaws.com/ip-ranges.json', json=ip_ranges)
+        feed_main(params, 'AMAZON', 'amazon')
+
+    batches = [call_args[0][0] for call_args in demisto.createIndicators.call_args_list]
+    assert [len(b) for b in batches] == [2000, 234]
+
+
+def test_feed_main_fetch_no_indicators(mocker):
+    """
+    Given
+    - A feed with no indicators.
+
+    When
+    - Fetching indicators.
+
+    Then
+    - Ensure createIndicators is called once with an empty list.
+    """
+    mocker.patch.object(demisto, 'command', return_value='fetch-indicators')
+    mocker.patch.object(demisto, 'createIndicators')
+    mocker.patch('JSONFeedApiModule.is_demisto_version_ge', return_value=True)
+    params = {
+        'url': 'https://ip-ranges.amazonaws.com/ip-ranges.json',
+        'extractor': "prefixes[?service=='AMAZON']",
+        'indicator': 'ip_prefix',
+        'indicator_type': 'CIDR'
+    }
+
+    with requests_mock.Mocker() as m:
+        m.get('https://ip-ranges.amazonaws.com/ip-ranges.json', json={'prefixes': []})
+        feed_main(params, 'AMAZON', 'amazon')
+
+    assert demisto.createIndicators.call_count == 1
+    assert demisto.createIndicators.call_args[0][0] == []
+
+
 def test_parse_headers():
     headers = """Authorization: Bearer X
 User-Agent:test
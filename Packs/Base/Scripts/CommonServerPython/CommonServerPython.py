@@ -16,11 +16,16 @@ import time
 import traceback
 from random import randint
 import xml.etree.cElementTree as ET
-from collections import OrderedDict
+from collections import OrderedDict, deque
+from itertools import islice
 from datetime import datetime, timedelta
 from abc import abstractmethod
-from distutils.version import LooseVersion
-from threading import Lock
+from threading import Lock, Thread
+
+try:
+    from queue import Full, Queue
+except ImportError:  # python2
+    from Queue import Full, Queue  # type: ignore[no-redef]
 
 import demistomock as demisto
 import warnings
@@ -50,6 +55,48 @@ _warnings_handler = WarningsHandler()
 # ignore warnings from logging as a result of not being setup
 logging.raiseExceptions = False
 
+
+class _LazyModule(object):
+    """
+    Stands in for a module which is slow to import, and imports it only when one of its attributes is first used.
+    Getting, setting and deleting attributes (e.g. when mocking) are passed to the real module.
+
+    :type name: ``str``
+    :param name: The full name of the module to import, for example: dateparser.
+
+    :return: No data returned
+    :rtype: ``None``
+    """
+
+    def __init__(self, name):
+        object.__setattr__(self, '_lazy_module_name', name)
+        object.__setattr__(self, '_lazy_module', None)
+
+    def _lazy_load(self):
+        module = object.__getattribute__(self, '_lazy_module')
+        if module is None:
+            name = object.__getattribute__(self, '_lazy_module_name')
+            __import__(name)
+            module = sys.modules[name]
+            object.__setattr__(self, '_lazy_module', module)
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self._lazy_load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._lazy_load(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._lazy_load(), name)
+
+    def __dir__(self):
+        return dir(self._lazy_load())
+
+    def __repr__(self):
+        return '<lazy module {!r}>'.format(object.__getattribute__(self, '_lazy_module_name'))
+
+
 # imports something that can be missed from docker image
 try:
     import requests
@@ -57,7 +104,8 @@ try:
     from urllib3.util import Retry
     from typing import Optional, Dict, List, Any, Union, Set
 
-    import dateparser
+    # dateparser takes longer to import than the rest of the script, so it is imported on first use
+    dateparser = _LazyModule('dateparser')
     from datetime import timezone  # type: ignore
 except Exception:
     if sys.version_info[0] < 3:
@@ -528,9 +576,37 @@ def get_schedule_metadata(context):
     return schedule_metadata
 
 
-def auto_detect_indicator_type(indicator_value):
+AUTO_DETECT_CACHE_SIZE = 10000
+# the detected types of the most recently detected indicator values, from least to most recently used
+_auto_detect_cache = OrderedDict()  # type: ignore
+_auto_detect_not_cached = object()
+_tld_extractor = None
+_hex_chars = frozenset('0123456789abcdefABCDEF')
+
+
+def _get_tld_extractor():
     """
-      Infer the type of the indicator.
+      Gets the TLD extractor used to detect domains. It is created once, with no cache files and no suffix list download.
+
+      :return: The TLD extractor.
+      :rtype: ``tldextract.TLDExtract``
+    """
+    global _tld_extractor
+    if _tld_extractor is None:
+        import tldextract
+        from distutils.version import LooseVersion
+        if LooseVersion(tldextract.__version__) < '3.0.0':
+            _tld_extractor = tldextract.TLDExtract(cache_file=False, suffix_list_urls=None)
+        else:
+            _tld_extractor = tldextract.TLDExtract(cache_dir=False, suffix_list_urls=None)
+    return _tld_extractor
+
+
+def _detect_indicator_type(indicator_value):
+    """
+      Infer the type of the indicator by the regexes, then by its TLD.
+      Each regex is matched only if the value passes the cheap checks it requires (first character, length and
+      mandatory characters), so most values are matched against a few regexes only.
 
       :type indicator_value: ``str``
       :param indicator_value: The indicator whose type we want to check. (required)
@@ -538,53 +614,47 @@ def auto_detect_indicator_type(indicator_value):
       :return: The type of the indicator.
       :rtype: ``str``
     """
-    try:
-        import tldextract
-    except Exception:
-        raise Exception("Missing tldextract module, In order to use the auto detect function please use a docker"
-                        " image with it installed such as: demisto/jmespath")
+    first_char = indicator_value[:1]
+    length = len(indicator_value)
+    starts_with_digit = '0' <= first_char <= '9'
+    starts_with_hex = first_char in _hex_chars
+    maybe_ipv6 = (starts_with_hex or first_char == ':') and ':' in indicator_value
 
-    if re.match(ipv4cidrRegex, indicator_value):
+    if starts_with_digit and '/' in indicator_value and re.match(ipv4cidrRegex, indicator_value):
         return FeedIndicatorType.CIDR
 
-    if re.match(ipv6cidrRegex, indicator_value):
+    if maybe_ipv6 and '/' in indicator_value and re.match(ipv6cidrRegex, indicator_value):
         return FeedIndicatorType.IPv6CIDR
 
-    if re.match(ipv4Regex, indicator_value):
+    if starts_with_digit and '.' in indicator_value and re.match(ipv4Regex, indicator_value):
         return FeedIndicatorType.IP
 
-    if re.match(ipv6Regex, indicator_value):
+    if maybe_ipv6 and re.match(ipv6Regex, indicator_value):
         return FeedIndicatorType.IPv6
 
-    if re.match(sha256Regex, indicator_value):
+    if starts_with_hex and length >= 64 and re.match(sha256Regex, indicator_value):
         return FeedIndicatorType.File
 
-    if re.match(urlRegex, indicator_value):
+    if first_char in ('h', 'f', 'w') and re.match(urlRegex, indicator_value):
         return FeedIndicatorType.URL
 
-    if re.match(md5Regex, indicator_value):
+    if starts_with_hex and length >= 32 and re.match(md5Regex, indicator_value):
         return FeedIndicatorType.File
 
-    if re.match(sha1Regex, indicator_value):
+    if starts_with_hex and length >= 40 and re.match(sha1Regex, indicator_value):
         return FeedIndicatorType.File
 
-    if re.match(emailRegex, indicator_value):
+    if '@' in indicator_value and re.match(emailRegex, indicator_value):
         return FeedIndicatorType.Email
 
-    if re.match(cveRegex, indicator_value):
+    if first_char in ('c', 'C') and re.match(cveRegex, indicator_value):
         return FeedIndicatorType.CVE
 
-    if re.match(sha512Regex, indicator_value):
+    if starts_with_hex and length >= 128 and re.match(sha512Regex, indicator_value):
         return FeedIndicatorType.File
 
     try:
-        tldextract_version = tldextract.__version__
-        if LooseVersion(tldextract_version) < '3.0.0':
-            no_cache_extract = tldextract.TLDExtract(cache_file=False, suffix_list_urls=None)
-        else:
-            no_cache_extract = tldextract.TLDExtract(cache_dir=False, suffix_list_urls=None)
-
-        if no_cache_extract(indicator_value).suffix:
+        if _get_tld_extractor()(indicator_value).suffix:
             if '*' in indicator_value:
                 return FeedIndicatorType.DomainGlob
             return FeedIndicatorType.Domain
@@ -596,6 +666,49 @@ def auto_detect_indicator_type(indicator_value):
     return None
 
 
+def auto_detect_indicator_types(indicator_values):
+    """
+      Infer the types of the indicators.
+      The types of the last AUTO_DETECT_CACHE_SIZE detected values are kept, so repeated values are detected once.
+
+      :type indicator_values: ``Iterable[str]``
+      :param indicator_values: The indicators whose types we want to check. (required)
+
+      :return: The types of the indicators, by the order of the values (None for an undetected type).
+      :rtype: ``List[Optional[str]]``
+    """
+    try:
+        import tldextract  # noqa: F401
+    except Exception:
+        raise Exception("Missing tldextract module, In order to use the auto detect function please use a docker"
+                        " image with it installed such as: demisto/jmespath")
+
+    indicator_types = []
+    for indicator_value in indicator_values:
+        indicator_type = _auto_detect_cache.pop(indicator_value, _auto_detect_not_cached)
+        if indicator_type is _auto_detect_not_cached:
+            indicator_type = _detect_indicator_type(indicator_value)
+            if len(_auto_detect_cache) >= AUTO_DETECT_CACHE_SIZE:
+                # evict the least recently used value
+                _auto_detect_cache.popitem(last=False)
+        _auto_detect_cache[indicator_value] = indicator_type
+        indicator_types.append(indicator_type)
+    return indicator_types
+
+
+def auto_detect_indicator_type(indicator_value):
+    """
+      Infer the type of the indicator.
+
+      :type indicator_value: ``str``
+      :param indicator_value: The indicator whose type we want to check. (required)
+
+      :return: The type of the indicator.
+      :rtype: ``str``
+    """
+    return auto_detect_indicator_types([indicator_value])[0]
+
+
 def add_http_prefix_if_missing(address=''):
     """
         This function adds `http://` prefix to the proxy address in case it is missing.
@@ -1333,6 +1446,7 @@ class IntegrationLogger(object):
       use LOG(<message>) to add a record to the logger (message can be any object with __str__)
       use LOG.print_log(verbose=True/False) to display all records in War-Room (if verbose) and server log.
       use add_replace_strs to add sensitive strings that should be replaced before going to the log.
+      only the last max_messages records are kept until the log is printed.
 
       :type message: ``str``
       :param message: The message to be logged
@@ -1341,10 +1455,15 @@ class IntegrationLogger(object):
       :rtype: ``None``
     """
 
-    def __init__(self, debug_logging=False):
-        self.messages = []  # type: list
+    def __init__(self, debug_logging=False, max_messages=10000):
+        self.messages = deque(maxlen=max_messages)  # type: deque
+        self.dropped_messages = 0
         self.write_buf = []  # type: list
         self.replace_strs = []  # type: list
+        # the unique replace strings, rebuilt only when replace_strs changes
+        self._unique_replace_strs = ()  # type: tuple
+        self._unique_replace_strs_source = None  # type: Optional[list]
+        self._unique_replace_strs_count = 0
         self.curl = []  # type: list
         self.buffering = True
         self.debug_logging = debug_logging
@@ -1382,14 +1501,36 @@ class IntegrationLogger(object):
                 res = message.encode('utf-8', 'replace')  # type: ignore
             else:
                 res = "Failed encoding message with error: {}".format(exception)
-        for s in self.replace_strs:
-            res = res.replace(s, '<XX_REPLACED>')
+        for s in self._get_unique_replace_strs():
+            # most messages contain none of the strings, and searching is cheaper than replacing
+            if s in res:
+                res = res.replace(s, '<XX_REPLACED>')
         return res
 
+    def _get_unique_replace_strs(self):
+        """
+        Gets the replace strings without duplicates, in the order they were added.
+        add_replace_strs adds up to three variants of every string, which are usually the same.
+
+        :return: The unique replace strings.
+        :rtype: ``tuple``
+        """
+        if self._unique_replace_strs_source is not self.replace_strs or \
+                self._unique_replace_strs_count != len(self.replace_strs):
+            self._unique_replace_strs = tuple(OrderedDict.fromkeys(self.replace_strs))
+            self._unique_replace_strs_source = self.replace_strs
+            self._unique_replace_strs_count = len(self.replace_strs)
+        return self._unique_replace_strs
+
+    def _add_message(self, text):
+        if len(self.messages) == self.messages.maxlen:
+            self.dropped_messages += 1
+        self.messages.append(text)
+
     def __call__(self, message):
         text = self.encode(message)
         if self.buffering:
-            self.messages.append(text)
+            self._add_message(text)
             if self.debug_logging:
                 demisto.debug(text)
         else:
@@ -1426,14 +1567,18 @@ class IntegrationLogger(object):
 
     def print_log(self, verbose=False):
         if self.write_buf:
-            self.messages.append("".join(self.write_buf))
+            self._add_message("".join(self.write_buf))
         if self.messages:
-            text = 'Full Integration Log:\n' + '\n'.join(self.messages)
+            text = 'Full Integration Log:\n'
+            if self.dropped_messages:
+                text += '({} earlier messages were dropped)\n'.format(self.dropped_messages)
+            text += '\n'.join(self.messages)
             if verbose:
                 demisto.log(text)
             if not self.debug_logging:  # we don't print out if in debug_logging as already all message where printed
                 demisto.info(text)
-            self.messages = []
+            self.messages.clear()
+            self.dropped_messages = 0
 
     def build_curl(self, text):
         """
@@ -1496,7 +1641,7 @@ class IntegrationLogger(object):
         if has_newline:
             text = "".join(self.write_buf)
             if self.buffering:
-                self.messages.append(text)
+                self._add_message(text)
             else:
                 demisto.info(text)
                 if is_debug_mode() and text.startswith('send:'):
@@ -1700,36 +1845,126 @@ def appendContext(key, data, dedup=False):
     if data is None:
         return
     existing = demisto.get(demisto.context(), key)
+    demisto.setContext(key, _append_to_context_value(existing, data, dedup))
 
-    if existing:
-        if isinstance(existing, STRING_TYPES):
-            if isinstance(data, STRING_TYPES):
-                new_val = data + ',' + existing
-            else:
-                new_val = data + existing  # will raise a self explanatory TypeError
 
-        elif isinstance(existing, dict):
-            if isinstance(data, dict):
-                new_val = [existing, data]  # type: ignore[assignment]
-            else:
-                new_val = data + existing  # will raise a self explanatory TypeError
+def _append_to_context_value(existing, data, dedup=False):
+    """
+       Appends data to an existing context value, the same way for appendContext and BufferedContextWriter.
 
-        elif isinstance(existing, list):
-            if isinstance(data, list):
-                existing.extend(data)
-            else:
-                existing.append(data)
-            new_val = existing  # type: ignore[assignment]
+       :type existing: ``any``
+       :param existing: The existing context value, a list value is extended in place.
+
+       :type data: ``any``
+       :param data: Data to be added to the context value (required)
 
+       :type dedup: ``bool``
+       :param dedup: True if de-duplication is required. Default is False.
+
+       :return: The new context value
+       :rtype: ``any``
+    """
+    if not existing:
+        return data
+
+    if isinstance(existing, STRING_TYPES):
+        if isinstance(data, STRING_TYPES):
+            new_val = data + ',' + existing
         else:
+            new_val = data + existing  # will raise a self explanatory TypeError
+
+    elif isinstance(existing, dict):
+        if isinstance(data, dict):
             new_val = [existing, data]  # type: ignore[assignment]
+        else:
+            new_val = data + existing  # will raise a self explanatory TypeError
 
-        if dedup and isinstance(new_val, list):
-            new_val = list(set(new_val))
+    elif isinstance(existing, list):
+        if isinstance(data, list):
+            existing.extend(data)
+        else:
+            existing.append(data)
+        new_val = existing  # type: ignore[assignment]
 
-        demisto.setContext(key, new_val)
     else:
-        demisto.setContext(key, data)
+        new_val = [existing, data]  # type: ignore[assignment]
+
+    if dedup and isinstance(new_val, list):
+        new_val = list(set(new_val))
+
+    return new_val
+
+
+class BufferedContextWriter(object):
+    """
+       Collects data to append to the investigation context and sets it once per context key when flushed,
+       instead of getting and setting the whole context for every appended data as appendContext does.
+       The data is appended the same as with appendContext, including de-duplication.
+       The context is read once, on the first append after creation or flush, and appended keys should not be
+       changed by other means until the writer is flushed.
+       The appended data is copied, so changing it after it is appended does not change the context.
+
+       Can be used as a context manager, which flushes the writer on exit:
+
+       >>> with BufferedContextWriter() as writer:
+       ...     for item in items:
+       ...         writer.append('Path.To.Key', item, dedup=True)
+
+       :return: No data returned
+       :rtype: ``None``
+    """
+
+    def __init__(self):
+        self._context = None  # type: Optional[dict]
+        self._values = OrderedDict()  # type: OrderedDict
+
+    def append(self, key, data, dedup=False):
+        """
+           Appends data to a context key, it is set in the context on the next flush.
+
+           :type key: ``str``
+           :param key: The context path (required)
+
+           :type data: ``any``
+           :param data: Data to be added to the context (required)
+
+           :type dedup: ``bool``
+           :param dedup: True if de-duplication is required. Default is False.
+
+           :return: No data returned
+           :rtype: ``None``
+        """
+        if data is None:
+            return
+        from copy import deepcopy
+        # appendContext sends the data to the server right away, keep it as it is now the same way
+        data = deepcopy(data)
+        if key in self._values:
+            existing = self._values[key]
+        else:
+            if self._context is None:
+                self._context = demisto.context()
+            existing = demisto.get(self._context, key)
+        self._values[key] = _append_to_context_value(existing, data, dedup)
+
+    def flush(self):
+        """
+           Sets the appended data in the context, with one setContext call per appended key.
+
+           :return: No data returned
+           :rtype: ``None``
+        """
+        values = self._values
+        self._context = None
+        self._values = OrderedDict()
+        for key, value in values.items():
+            demisto.setContext(key, value)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
 
 
 def url_to_clickable_markdown(data, url_keys):
@@ -1775,7 +2010,7 @@ def create_clickable_url(url):
 
 
 def tableToMarkdown(name, t, headers=None, headerTransform=None, removeNull=False, metadata=None, url_keys=None,
-                    date_fields=None):
+                    date_fields=None, writer=None):
     """
        Converts a demisto table in JSON form to a Markdown table
 
@@ -1804,9 +2039,29 @@ def tableToMarkdown(name, t, headers=None, headerTransform=None, removeNull=Fals
        :type date_fields: ``list``
        :param date_fields: A list of date fields to format the value to human-readable output.
 
-       :return: A string representation of the markdown table
+       :type writer: ``file``
+       :param writer: A file like object to write the table to, row by row, instead of returning it.
+            Useful for large tables which are returned as a file (optional)
+
+       :return: A string representation of the markdown table, or None if a writer was given
        :rtype: ``str``
     """
+    md_parts = _table_to_markdown_parts(name, t, headers, headerTransform, removeNull, metadata, url_keys, date_fields)
+    if writer is None:
+        return ''.join(md_parts)
+    for md_part in md_parts:
+        writer.write(md_part)
+    return None
+
+
+def _table_to_markdown_parts(name, t, headers, headerTransform, removeNull, metadata, url_keys, date_fields):
+    """
+       Generates the parts of the markdown table of tableToMarkdown, see its arguments.
+       Every table row is a separate part.
+
+       :return: The markdown table parts
+       :rtype: ``Iterator[str]``
+    """
     # Turning the urls in the table to clickable
     if url_keys:
         t = url_to_clickable_markdown(t, url_keys)
@@ -1820,7 +2075,8 @@ def tableToMarkdown(name, t, headers=None, headerTransform=None, removeNull=Fals
 
     if not t or len(t) == 0:
         mdResult += '**No entries.**\n'
-        return mdResult
+        yield mdResult
+        return
 
     if not headers and isinstance(t, dict) and len(t.keys()) == 1:
         # in case of a single key, create a column table where each element is in a different row.
@@ -1854,45 +2110,79 @@ def tableToMarkdown(name, t, headers=None, headerTransform=None, removeNull=Fals
                 headers_aux.remove(header)
         headers = headers_aux
 
-    if t and len(headers) > 0:
-        newHeaders = []
-        if headerTransform is None:  # noqa
-            def headerTransform(s): return stringEscapeMD(s, True, True)  # noqa
-        for header in headers:
-            newHeaders.append(headerTransform(header))
-        mdResult += '|'
-        if len(newHeaders) == 1:
-            mdResult += newHeaders[0]
-        else:
-            mdResult += '|'.join(newHeaders)
-        mdResult += '|\n'
-        sep = '---'
-        mdResult += '|' + '|'.join([sep] * len(headers)) + '|\n'
-        for entry in t:
-            entry_copy = entry.copy()
-            if date_fields:
-                for field in date_fields:
-                    try:
-                        entry_copy[field] = datetime.fromtimestamp(int(entry_copy[field]) / 1000).strftime('%Y-%m-%d %H:%M:%S')
-                    except Exception:
-                        pass
+    if not (t and len(headers) > 0):
+        mdResult += '**No entries.**\n'
+        yield mdResult
+        return
+
+    if headerTransform is None:  # noqa
+        def headerTransform(s): return stringEscapeMD(s, True, True)  # noqa
+    newHeaders = [headerTransform(header) for header in headers]
+    mdResult += '|'
+    if len(newHeaders) == 1:
+        mdResult += newHeaders[0]
+    else:
+        mdResult += '|'.join(newHeaders)
+    mdResult += '|\n'
+    sep = '---'
+    mdResult += '|' + '|'.join([sep] * len(headers)) + '|\n'
+    yield mdResult
+    md_sample = _py2_string_sample(mdResult) if not IS_PY3 else ''
+
+    # the columns which hold dates, so the rows are not copied to format them
+    date_headers = [header in date_fields for header in headers] if date_fields else [False] * len(headers)
+    columns = list(zip(headers, date_headers))
+    for entry in t:
+        vals = []
+        for header, is_date in columns:
+            val = entry.get(header)
+            if is_date:
+                try:
+                    val = datetime.fromtimestamp(int(val) / 1000).strftime('%Y-%m-%d %H:%M:%S')
+                except Exception:
+                    pass
+            if val is None:
+                val = ''
+            elif not isinstance(val, STRING_TYPES):
+                val = formatCell(val, False)
+            # same as stringEscapeMD(val, True, True), skipping the replacements which are not needed
+            if '\r' in val or '\n' in val:
+                val = val.replace('\r\n', '<br>').replace('\r', '<br>').replace('\n', '<br>')
+            if '|' in val:
+                val = val.replace('|', '\\|')
+            vals.append(val)
+
+        # the first pipe is optional
+        try:
+            row = '| ' + ' | '.join(vals) + ' |\n'
+            if not IS_PY3:
+                md_sample = _py2_string_sample(md_sample + row)
+        except UnicodeDecodeError:
+            vals = [str(v) for v in vals]
+            row = '| ' + ' | '.join(vals) + ' |\n'
+            if not IS_PY3:
+                md_sample = _py2_string_sample(md_sample + row)
+        yield row
 
-            vals = [stringEscapeMD((formatCell(entry_copy.get(h, ''), False) if entry_copy.get(h) is not None else ''),
-                                   True, True) for h in headers]
 
-            # this pipe is optional
-            mdResult += '| '
-            try:
-                mdResult += ' | '.join(vals)
-            except UnicodeDecodeError:
-                vals = [str(v) for v in vals]
-                mdResult += ' | '.join(vals)
-            mdResult += ' |\n'
+def _py2_string_sample(text):
+    """
+       Python 2 fails to concatenate unicode strings with byte strings which are not ascii.
+       Gets a short string which succeeds and fails to be concatenated with other strings the same as the given text.
 
-    else:
-        mdResult += '**No entries.**\n'
+       :type text: ``str``
+       :param text: The text to sample.
 
-    return mdResult
+       :return: An empty unicode string, an empty byte string or a non ascii byte string
+       :rtype: ``str``
+    """
+    if not isinstance(text, bytes):
+        return u''
+    try:
+        text.decode('ascii')
+        return b''
+    except UnicodeDecodeError:
+        return b'\x80'
 
 
 tblToMd = tableToMarkdown
@@ -2076,6 +2366,7 @@ def flattenTable(tableDict):
 
 
 MARKDOWN_CHARS = r"\`*_{}[]()#+-!|"
+_MARKDOWN_CHARS_TRANSLATION = {ord(c): u"\\" + c for c in MARKDOWN_CHARS}
 
 
 def stringEscapeMD(st, minimal_escaping=False, escape_multiline=False):
@@ -2102,6 +2393,8 @@ def stringEscapeMD(st, minimal_escaping=False, escape_multiline=False):
     if minimal_escaping:
         for c in '|':
             st = st.replace(c, '\\' + c)
+    elif IS_PY3 and isinstance(st, str):
+        st = st.translate(_MARKDOWN_CHARS_TRANSLATION)
     else:
         st = "".join(["\\" + str(c) if c in MARKDOWN_CHARS else str(c) for c in st])
 
@@ -6942,17 +7235,28 @@ if 'requests' in sys.modules:
             The request authorization, for example: (username, password).
             Can be None.
 
+        :type pool_size: ``int``
+        :param pool_size:
+            The maximum number of connections to keep open per host, which is also the default number of
+            concurrent requests sent by ``_http_request_many``.
+            If None, will use the requests library default (10).
+
         :return: No data returned
         :rtype: ``None``
         """
 
-        def __init__(self, base_url, verify=True, proxy=False, ok_codes=tuple(), headers=None, auth=None):
+        def __init__(self, base_url, verify=True, proxy=False, ok_codes=tuple(), headers=None, auth=None,
+                     pool_size=None):
             self._base_url = base_url
             self._verify = verify
             self._ok_codes = ok_codes
             self._headers = headers
             self._auth = auth
+            self._pool_size = pool_size
+            self._retry_config = None
             self._session = requests.Session()
+            if pool_size:
+                self._mount_adapter()
             if proxy:
                 ensure_proxy_has_http_prefix()
             else:
@@ -6970,6 +7274,19 @@ if 'requests' in sys.modules:
             except Exception:  # noqa
                 demisto.debug('failed to close BaseClient session with the following error:\n{}'.format(traceback.format_exc()))
 
+        def _mount_adapter(self, max_retries=0):
+            """
+            Mounts a connection adapter with the client pool size and the given retry policy on the session.
+
+            :type max_retries: ``int`` or ``Retry``
+            :param max_retries: The retry policy of the adapter.
+            """
+            pool_size = getattr(self, '_pool_size', None)
+            pool_kwargs = {'pool_connections': pool_size, 'pool_maxsize': pool_size} if pool_size else {}
+            adapter = HTTPAdapter(max_retries=max_retries, **pool_kwargs)
+            self._session.mount('http://', adapter)
+            self._session.mount('https://', adapter)
+
         def _implement_retry(self, retries=0,
                              status_list_to_retry=None,
                              backoff_factor=5,
@@ -7012,6 +7329,10 @@ if 'requests' in sys.modules:
                 if status falls in ``status_forcelist`` range and retries have
                 been exhausted.
             """
+            retry_config = (retries, tuple(status_list_to_retry or ()), backoff_factor, raise_on_redirect, raise_on_status)
+            if getattr(self, '_retry_config', None) == retry_config:
+                # the adapter is already mounted, keep it (and its open connections) in use
+                return
             try:
                 method_whitelist = "allowed_methods" if hasattr(Retry.DEFAULT, "allowed_methods") else "method_whitelist"
                 whitelist_kawargs = {
@@ -7028,9 +7349,8 @@ if 'requests' in sys.modules:
                     raise_on_redirect=raise_on_redirect,
                     **whitelist_kawargs
                 )
-                adapter = HTTPAdapter(max_retries=retry)
-                self._session.mount('http://', adapter)
-                self._session.mount('https://', adapter)
+                self._mount_adapter(retry)
+                self._retry_config = retry_config
             except NameError:
                 pass
 
@@ -7226,6 +7546,56 @@ if 'requests' in sys.modules:
                 err_msg = 'Max Retries Error- Request attempts with {} retries failed. \n{}'.format(retries, reason)
                 raise DemistoException(err_msg, exception)
 
+        def _http_request_many(self, requests_args, max_concurrency=None, raise_on_error=True):
+            """Sends several requests concurrently over the client session, using a pool of threads.
+            Each request is sent with ``_http_request``, so retries, proxy, ok codes and error handling
+            behave exactly as in a single request.
+
+            :type requests_args: ``list``
+            :param requests_args:
+                The requests to send. Each request is a dict of ``_http_request`` keyword arguments,
+                for example: {'method': 'GET', 'url_suffix': 'ip/1.1.1.1'}.
+
+            :type max_concurrency: ``int``
+            :param max_concurrency:
+                The maximum number of requests to send at the same time.
+                If None, will use the client pool size (10 by default).
+                Sending more concurrent requests than the pool size discards the extra connections once used.
+
+            :type raise_on_error: ``bool``
+            :param raise_on_error:
+                Whether to raise the error of the first failed request (by the order of ``requests_args``).
+                When False, the exception of a failed request is returned in its place instead.
+
+            :return: The responses of the requests, in the order of ``requests_args``.
+            :rtype: ``list``
+            """
+            requests_args = list(requests_args)
+            max_concurrency = max_concurrency or getattr(self, '_pool_size', None) or requests.adapters.DEFAULT_POOLSIZE
+
+            def send_request(request_args):
+                try:
+                    return self._http_request(**request_args)
+                except Exception as exception:  # noqa: disable=broad-except
+                    return exception
+
+            if max_concurrency <= 1 or len(requests_args) <= 1:
+                results = [send_request(request_args) for request_args in requests_args]
+            else:
+                from multiprocessing.pool import ThreadPool
+                pool = ThreadPool(min(max_concurrency, len(requests_args)))
+                try:
+                    results = pool.map(send_request, requests_args)
+                finally:
+                    pool.close()
+                    pool.join()
+
+            if raise_on_error:
+                for result in results:
+                    if isinstance(result, Exception):
+                        raise result
+            return results
+
         def _is_status_code_valid(self, response, ok_codes=None):
             """If the status code is OK, return 'True'.
 
@@ -7249,6 +7619,8 @@ if 'requests' in sys.modules:
 
 def batch(iterable, batch_size=1):
     """Gets an iterable and yields slices of it.
+    Sequences (e.g. lists) are sliced, and any other iterable (e.g. a generator) is consumed lazily into lists,
+    both in linear time.
 
     :type iterable: ``list``
     :param iterable: list or other iterable object.
@@ -7259,12 +7631,43 @@ def batch(iterable, batch_size=1):
     :rtype: ``list``
     :return:: Iterable slices of given
     """
-    current_batch = iterable[:batch_size]
-    not_batched = iterable[batch_size:]
+    if batch_size < 1:
+        return
+    if hasattr(iterable, '__getitem__') and hasattr(iterable, '__len__') and not isinstance(iterable, dict):
+        for start in range(0, len(iterable), batch_size):
+            yield iterable[start:start + batch_size]
+        return
+    iterator = iter(iterable)
+    current_batch = list(islice(iterator, batch_size))
     while current_batch:
         yield current_batch
-        current_batch = not_batched[:batch_size]
-        not_batched = not_batched[batch_size:]
+        current_batch = list(islice(iterator, batch_size))
+
+
+def create_indicators_in_batches(indicators, batch_size=2000, no_update=None):
+    """Creates the given indicators in the server in batches of a fixed size.
+    The indicators are consumed lazily, so when a generator is given only one batch is held in memory at a time,
+    no matter how many indicators it yields.
+
+    :type indicators: ``iterable``
+    :param indicators: list or generator of the indicators to create.
+
+    :type batch_size: ``int``
+    :param batch_size: the number of indicators to send in each createIndicators call.
+
+    :type no_update: ``bool``
+    :param no_update: the noUpdate argument of createIndicators. If None, createIndicators is called
+        without it (for server versions below 6.5.0).
+
+    :rtype: ``int``
+    :return:: The number of indicators which were created.
+    """
+    kwargs = {} if no_update is None else {'noUpdate': no_update}
+    indicators_count = 0
+    for indicators_batch in batch(indicators, batch_size=batch_size):
+        demisto.createIndicators(indicators_batch, **kwargs)
+        indicators_count += len(indicators_batch)
+    return indicators_count
 
 
 def dict_safe_get(dict_object, keys, default_return_value=None, return_type=None, raise_return_type=True):
@@ -7952,9 +8355,18 @@ class IndicatorsSearcher:
     :type limit ``Optional[int]``
     :param limit the upper limit of the search (will be updated via iter)
 
+    :type prefetch: ``int``
+    :param prefetch: the number of pages to fetch ahead in a background thread, while the previous pages are
+        consumed. 0 (default) fetches each page when it is requested. When prefetching, stopping the iteration
+        before the search is done must be followed by calling close(), or use the searcher as a context manager
+        which closes it on exit. Otherwise the prefetching thread waits until the searcher is garbage collected.
+
     :return: No data returned
     :rtype: ``None``
     """
+    # seconds between checks whether prefetching was stopped, while waiting for the consumer to take a page
+    PREFETCH_POLL_INTERVAL = 0.1
+
     def __init__(self,
                  page=0,
                  filter_fields=None,
@@ -7963,7 +8375,8 @@ class IndicatorsSearcher:
                  size=100,
                  to_date=None,
                  value='',
-                 limit=None):
+                 limit=None,
+                 prefetch=0):
         # searchAfter is available in searchIndicators from version 6.1.0
         self._can_use_search_after = is_demisto_version_ge('6.1.0')
         # populateFields merged in https://github.com/demisto/server/pull/18398
@@ -7982,13 +8395,20 @@ class IndicatorsSearcher:
         self._original_limit = limit
         self._next_limit = limit
         self._search_is_done = False
+        self._prefetch = prefetch
+        self._prefetch_queue = None
+        self._prefetch_stopped = False
+        self._prefetch_thread = None
 
     def __iter__(self):
+        self.close()
         self._total = None
         self._search_after_param = None
         self._page = self._original_page
         self._next_limit = self._original_limit
         self._search_is_done = False
+        if self._prefetch > 0:
+            self._start_prefetch()
         return self
 
     # python2
@@ -7996,6 +8416,84 @@ class IndicatorsSearcher:
         return self.__next__()
 
     def __next__(self):
+        if self._prefetch_queue is not None:
+            return self._next_prefetched_page()
+        return self._next_page()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Stops prefetching pages, and waits for the page being fetched.
+
+        :return: No data returned
+        :rtype: ``None``
+        """
+        if self._prefetch_thread is not None:
+            self._prefetch_stopped = True
+            self._prefetch_thread.join()
+        self._prefetch_queue = None
+        self._prefetch_thread = None
+
+    def _start_prefetch(self):
+        # the pages are searched from the prefetching thread while the consumer may call the server as well
+        if hasattr(demisto, '_Demisto__do') and not hasattr(demisto, 'lock'):
+            support_multithreading()
+        self._prefetch_queue = Queue(maxsize=self._prefetch)
+        self._prefetch_stopped = False
+        from weakref import ref
+        # the thread holds only a weak reference, so a searcher which is not closed can still be collected
+        self._prefetch_thread = Thread(target=IndicatorsSearcher._prefetch_pages,
+                                       args=(ref(self), self._prefetch_queue))
+        self._prefetch_thread.daemon = True
+        self._prefetch_thread.start()
+
+    @staticmethod
+    def _prefetch_pages(searcher_ref, pages_queue):
+        """Fetches the pages into the queue until the search is done, an error occurs, prefetching is stopped
+        or the searcher is garbage collected.
+        Each queued item is a (page, error) tuple, where (None, None) marks the end of the search.
+        The queue is bounded, so fetching waits while the consumer is behind.
+        """
+        def is_stopped():
+            searcher = searcher_ref()
+            return searcher is None or searcher._prefetch_stopped
+
+        while not is_stopped():
+            try:
+                item = (searcher_ref()._next_page(), None)
+            except StopIteration:
+                item = (None, None)
+            except Exception as e:
+                # the frames of the traceback refer to the searcher, which would keep it alive
+                if IS_PY3:
+                    traceback.clear_frames(e.__traceback__)
+                else:
+                    sys.exc_clear()
+                item = (None, e)
+            while not is_stopped():
+                try:
+                    pages_queue.put(item, timeout=IndicatorsSearcher.PREFETCH_POLL_INTERVAL)
+                    break
+                except Full:
+                    continue
+            if item[0] is None:
+                return
+
+    def _next_prefetched_page(self):
+        res, error = self._prefetch_queue.get()
+        if res is None:
+            self.close()
+            self._search_is_done = True
+            if error is not None:
+                raise error
+            raise StopIteration
+        return res
+
+    def _next_page(self):
         if self._search_is_done:
             raise StopIteration
         size = min(self._size, self._next_limit or self._size)
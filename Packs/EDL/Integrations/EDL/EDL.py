@@ -6,12 +6,15 @@ import re
 
 from base64 import b64decode
 from flask import Flask, Response, request
+from gevent.event import Event
+from werkzeug.wsgi import wrap_file
 from netaddr import IPSet
-from typing import Any, Dict, cast, Iterable
+from typing import Any, Dict, cast, Iterable, Union
 from math import ceil
 import urllib3
 import dateparser
 import hashlib
+import gevent
 
 # Disable insecure warnings
 urllib3.disable_warnings()
@@ -31,6 +34,16 @@ EDL_MISSING_REFRESH_ERR_MSG: str = 'Refresh Rate must be "number date_range_unit
 EDL_FILTER_FIELDS: Optional[str] = "name,type"
 EDL_ON_DEMAND_KEY: str = 'UpdateEDL'
 EDL_ON_DEMAND_CACHE_PATH: str = ''
+EDL_ON_DEMAND_REFRESH_INTERVAL: int = 5
+EDL_ON_DEMAND_READY_TIMEOUT: int = 60
+# set once the first on-demand EDL snapshot was written, requests wait for it instead of building it themselves
+EDL_ON_DEMAND_READY: Event = Event()
+EDL_CACHE_MAX_SIZE: int = 20
+EDL_MODIFIED_TIME_FORMAT: str = '%Y-%m-%dT%H:%M:%SZ'
+EDL_WRITE_BATCH_SIZE: int = 2000
+EDL_STREAM_CHUNK_SIZE: int = 64 * 1024
+# EDL files of previous requests by their request arguments, each is the EDL file info with its 'created' time
+EDL_CACHE: Dict[str, dict] = {}
 
 ''' REFORMATTING REGEXES '''
 _PROTOCOL_REMOVAL = re.compile('^(?:[a-z]+:)*//')
@@ -115,9 +128,11 @@ def iterable_to_str(iterable: Iterable, delimiter: str = '\n') -> str:
     return str_res
 
 
-def create_new_edl(request_args: RequestArguments) -> str:
+def find_formatted_indicators(request_args: RequestArguments) -> list:
     """
-    Gets indicators from XSOAR server using IndicatorsSearcher and formats them
+    Gets indicators from XSOAR server using IndicatorsSearcher and formats them.
+    Each page of indicators is formatted once as it is fetched, and the search stops as soon as there are enough
+    formatted indicators. IPs to collapse are collapsed once, after the search.
 
     Parameters:
         request_args: Request arguments
@@ -128,40 +143,148 @@ def create_new_edl(request_args: RequestArguments) -> str:
     indicator_searcher = IndicatorsSearcher(
         filter_fields=EDL_FILTER_FIELDS,
         query=request_args.query,
-        size=PAGE_SIZE,
-        limit=limit
+        size=min(PAGE_SIZE, limit) or PAGE_SIZE
     )
-    iocs = []
     formatted_iocs: set = set()
-    while True:
-        current_limit = limit + (limit - len(formatted_iocs))
-        indicator_searcher.limit = current_limit
-        new_iocs = find_indicators_to_limit(indicator_searcher)
-        iocs.extend(new_iocs)
-        formatted_iocs = format_indicators(iocs, request_args)
-        # continue searching iocs if 1) iocs was truncated or 2) got all available iocs
-        if len(formatted_iocs) >= len(iocs) or indicator_searcher.total <= current_limit:
+    ipv4_iocs_to_collapse: set = set()
+    ipv6_iocs_to_collapse: set = set()
+    for ioc_res in indicator_searcher:
+        add_formatted_indicators(ioc_res.get('iocs') or [], request_args, formatted_iocs,
+                                 ipv4_iocs_to_collapse, ipv6_iocs_to_collapse)
+        # IPs to collapse are not counted, as we only know how many entries they make once collapsed
+        if len(formatted_iocs) >= limit:
             break
-    return iterable_to_str(list(formatted_iocs)[request_args.offset:limit])
+        # let requests be served between the pages
+        gevent.sleep(0)
+    collapse_formatted_ips(formatted_iocs, ipv4_iocs_to_collapse, ipv6_iocs_to_collapse, request_args.collapse_ips)
+    return list(formatted_iocs)[request_args.offset:limit]
 
 
-def find_indicators_to_limit(indicator_searcher: IndicatorsSearcher) -> List[dict]:
+def write_edl_file(formatted_iocs: Iterable[str], file_path: str) -> dict:
     """
-    Finds indicators using while loop with demisto.searchIndicators, and returns result and last page
+    Writes the formatted indicators to the EDL file, one per line, computing the ETag while writing.
+    The ETag and size are also stored next to the file, so it can be served without reading it first.
 
     Parameters:
-        indicator_searcher (IndicatorsSearcher): The indicator searcher used to look for indicators
+        formatted_iocs: The formatted indicators
+        file_path: The path of the EDL file
 
-    Returns:
-        (list): List of Indicators dict with value,indicator_type keys
+    Returns: The EDL file info - its 'path', 'etag' and 'size' (number of entries)
     """
-    iocs: List[dict] = []
-    for ioc_res in indicator_searcher:
-        fetched_iocs = ioc_res.get('iocs') or []
-        # save only the value and type of each indicator
-        iocs.extend({'value': ioc.get('value'), 'indicator_type': ioc.get('indicator_type')}
-                    for ioc in fetched_iocs)
-    return iocs
+    sha1 = hashlib.sha1()  # guardrails-disable-line
+    size = 0
+    with open(file_path, 'wb') as file:
+        for iocs_batch in batch(formatted_iocs, EDL_WRITE_BATCH_SIZE):
+            chunk = ('\n' if size else '') + iterable_to_str(iocs_batch)
+            data = chunk.encode()
+            file.write(data)
+            sha1.update(data)
+            size += len(iocs_batch)
+    edl_info = {'etag': f'"{sha1.hexdigest()}"', 'size': size}
+    with open(f'{file_path}.info', 'w') as file:
+        json.dump(edl_info, file)
+    return {'path': file_path, **edl_info}
+
+
+def read_edl_file_info(file_path: str) -> dict:
+    """
+    Reads the info stored next to the EDL file. If there is none, the file is read in chunks to compute it.
+
+    Parameters:
+        file_path: The path of the EDL file
+
+    Returns: The EDL file info - its 'path', 'etag' and 'size' (number of entries)
+    """
+    try:
+        with open(f'{file_path}.info', 'r') as file:
+            return {'path': file_path, **json.load(file)}
+    except (OSError, ValueError):
+        pass
+    sha1 = hashlib.sha1()  # guardrails-disable-line
+    lines = 0
+    has_content = False
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(EDL_STREAM_CHUNK_SIZE), b''):
+            sha1.update(chunk)
+            lines += chunk.count(b'\n')
+            has_content = has_content or bool(chunk.strip())
+    return {'path': file_path, 'etag': f'"{sha1.hexdigest()}"', 'size': lines + 1 if has_content else 0}
+
+
+def remove_edl_file(edl_info: Optional[dict]):
+    """
+    Removes the EDL file and its info. Responses already streaming the file keep reading it.
+
+    Parameters:
+        edl_info: The EDL file info
+    """
+    if not edl_info:
+        return
+    for file_path in (edl_info['path'], f'{edl_info["path"]}.info'):
+        try:
+            os.remove(file_path)
+        except OSError as e:
+            demisto.debug(f'Failed removing EDL file {file_path}: {e}')
+
+
+def create_new_edl(request_args: RequestArguments, file_path: str) -> dict:
+    """
+    Gets indicators from XSOAR server, formats them and writes them to the EDL file
+
+    Parameters:
+        request_args: Request arguments
+        file_path: The path of the EDL file
+
+    Returns: The EDL file info - its 'path', 'etag' and 'size' (number of entries)
+    """
+    return write_edl_file(find_formatted_indicators(request_args), file_path)
+
+
+def indicators_modified_since(query: str, since: datetime) -> bool:
+    """
+    Checks whether any of the indicators matching the query was modified since the given time
+
+    Parameters:
+        query: The indicators query
+        since: The time to check from
+
+    Returns: True if there is a modified indicator, False otherwise
+    """
+    modified_query = f'modified:>={since.strftime(EDL_MODIFIED_TIME_FORMAT)}'
+    if query:
+        modified_query = f'{modified_query} and ({query})'
+    res = demisto.searchIndicators(query=modified_query, size=1) or {}
+    return bool(res.get('iocs'))
+
+
+def get_edl(request_args: RequestArguments, max_age: int) -> dict:
+    """
+    Gets the EDL file of the request arguments.
+    The EDL of previous requests is kept by their request arguments, and returned as long as it is not older than
+    max_age and none of the indicators matching its query were modified since it was created.
+
+    Parameters:
+        request_args: Request arguments
+        max_age: The maximal age of a kept EDL, in seconds
+
+    Returns: The EDL file info - its 'path', 'etag' and 'size' (number of entries)
+    """
+    cache_key = json.dumps(request_args.to_context_json(), sort_keys=True)
+    cached_edl = EDL_CACHE.get(cache_key)
+    created = datetime.now(timezone.utc)
+    if cached_edl and (created - cached_edl['created']).total_seconds() < max_age \
+            and not indicators_modified_since(request_args.query, cached_edl['created']):
+        demisto.debug(f'Returning the EDL created at [{cached_edl["created"]}], no indicators were modified since')
+        return cached_edl
+
+    edl_info = create_new_edl(request_args, demisto.uniqueFile())
+    edl_info['created'] = created
+    remove_edl_file(EDL_CACHE.pop(cache_key, None))
+    if len(EDL_CACHE) >= EDL_CACHE_MAX_SIZE:
+        # evict the least recently created EDL
+        remove_edl_file(EDL_CACHE.pop(next(iter(EDL_CACHE))))
+    EDL_CACHE[cache_key] = edl_info
+    return edl_info
 
 
 def ip_groups_to_cidrs(ip_range_groups: Iterable):
@@ -240,9 +363,23 @@ def format_indicators(iocs: list, request_args: RequestArguments) -> set:
         1) if drop_invalids, drop invalids (has invalid chars)
         2) if port_stripping, strip ports
     """
-    formatted_indicators = set()
-    ipv4_formatted_indicators = set()
-    ipv6_formatted_indicators = set()
+    formatted_indicators: set = set()
+    ipv4_formatted_indicators: set = set()
+    ipv6_formatted_indicators: set = set()
+    add_formatted_indicators(iocs, request_args, formatted_indicators,
+                             ipv4_formatted_indicators, ipv6_formatted_indicators)
+    collapse_formatted_ips(formatted_indicators, ipv4_formatted_indicators, ipv6_formatted_indicators,
+                           request_args.collapse_ips)
+    return formatted_indicators
+
+
+def add_formatted_indicators(iocs: list, request_args: RequestArguments, formatted_indicators: set,
+                             ipv4_formatted_indicators: set, ipv6_formatted_indicators: set):
+    """
+    Formats the given IOCs (see format_indicators) and adds them to formatted_indicators.
+    IPs to collapse are added to ipv4_formatted_indicators / ipv6_formatted_indicators instead,
+    so they can be collapsed once with collapse_formatted_ips.
+    """
     for ioc in iocs:
         indicator = ioc.get('value')
         if not indicator:
@@ -289,33 +426,64 @@ def format_indicators(iocs: list, request_args: RequestArguments) -> set:
         else:
             formatted_indicators.add(indicator)
 
+
+def collapse_formatted_ips(formatted_indicators: set, ipv4_formatted_indicators: set,
+                           ipv6_formatted_indicators: set, collapse_ips: str):
+    """
+    Collapses the IPs to collapse and adds them to formatted_indicators.
+    """
     if len(ipv4_formatted_indicators) > 0:
-        ipv4_formatted_indicators = ips_to_ranges(ipv4_formatted_indicators, request_args.collapse_ips)
-        formatted_indicators.update(ipv4_formatted_indicators)
+        formatted_indicators.update(ips_to_ranges(ipv4_formatted_indicators, collapse_ips))
 
     if len(ipv6_formatted_indicators) > 0:
-        ipv6_formatted_indicators = ips_to_ranges(ipv6_formatted_indicators, request_args.collapse_ips)
-        formatted_indicators.update(ipv6_formatted_indicators)
-    return formatted_indicators
+        formatted_indicators.update(ips_to_ranges(ipv6_formatted_indicators, collapse_ips))
 
 
-def get_edl_on_demand():
+def refresh_edl_on_demand() -> bool:
     """
-    Use the local file system to store the on-demand result, using a lock to
-    limit access to the file from multiple threads.
+    Writes a new on-demand EDL snapshot if an update was requested, and swaps it with the current snapshot.
+    The snapshot is written to a temporary file and renamed over the current one, so requests that already opened
+    the current snapshot keep streaming it, and new requests get the new one.
+
+    Returns: True if a new snapshot was written, False otherwise
     """
     ctx = get_integration_context()
-    if EDL_ON_DEMAND_KEY in ctx:
-        ctx.pop(EDL_ON_DEMAND_KEY, None)
-        request_args = RequestArguments.from_context_json(ctx)
-        edl = create_new_edl(request_args)
-        with open(EDL_ON_DEMAND_CACHE_PATH, 'w') as file:
-            file.write(edl)
-        set_integration_context(ctx)
-    else:
-        with open(EDL_ON_DEMAND_CACHE_PATH, 'r') as file:
-            edl = file.read()
-    return edl
+    if EDL_ON_DEMAND_KEY not in ctx:
+        return False
+    ctx.pop(EDL_ON_DEMAND_KEY, None)
+    request_args = RequestArguments.from_context_json(ctx)
+    tmp_path = f'{EDL_ON_DEMAND_CACHE_PATH}.tmp'
+    edl_info = create_new_edl(request_args, tmp_path)
+    os.replace(f'{tmp_path}.info', f'{EDL_ON_DEMAND_CACHE_PATH}.info')
+    os.replace(tmp_path, EDL_ON_DEMAND_CACHE_PATH)
+    set_integration_context(ctx)
+    demisto.debug(f'Swapped the on-demand EDL snapshot, size: [{edl_info["size"]}], etag: [{edl_info["etag"]}]')
+    EDL_ON_DEMAND_READY.set()
+    return True
+
+
+def refresh_edl_on_demand_loop():
+    """
+    Refreshes the on-demand EDL snapshot in the background whenever an update is requested.
+    """
+    while True:
+        try:
+            refresh_edl_on_demand()
+        except Exception as e:
+            demisto.error(f'Failed refreshing the on-demand EDL: {e}. Exception: {traceback.format_exc()}')
+        gevent.sleep(EDL_ON_DEMAND_REFRESH_INTERVAL)
+
+
+def get_edl_on_demand() -> dict:
+    """
+    Gets the current on-demand EDL snapshot, which is refreshed in the background by refresh_edl_on_demand_loop.
+    Waits for the first snapshot if it was not written yet.
+
+    Returns: The EDL file info - its 'path', 'etag' and 'size' (number of entries)
+    """
+    if not EDL_ON_DEMAND_READY.wait(EDL_ON_DEMAND_READY_TIMEOUT):
+        raise DemistoException('The EDL is not ready yet, please try again later.')
+    return read_edl_file_info(EDL_ON_DEMAND_CACHE_PATH)
 
 
 def validate_basic_authentication(headers: dict, username: str, password: str) -> bool:
@@ -370,23 +538,29 @@ def route_edl() -> Response:
 
     request_args = get_request_args(request.args, params)
     on_demand = params.get('on_demand')
+    max_age = ceil((datetime.now() - dateparser.parse(cache_refresh_rate)).total_seconds())  # type: ignore[operator]
     created = datetime.now(timezone.utc)
-    edl = get_edl_on_demand() if on_demand else create_new_edl(request_args)
-    etag = f'"{hashlib.sha1(edl.encode()).hexdigest()}"'  # guardrails-disable-line
+    edl_info = get_edl_on_demand() if on_demand else get_edl(request_args, max_age)
+    etag = edl_info['etag']
     query_time = (datetime.now(timezone.utc) - created).total_seconds()
-    edl_size = 0
-    if edl.strip():
-        edl_size = edl.count('\n') + 1  # add 1 as last line doesn't have a \n
-    if len(edl) == 0 and request_args.add_comment_if_empty:
+    edl_size = edl_info['size']
+    # the file is opened before responding, so it is streamed even if a newer EDL replaces it meanwhile.
+    # wrap_file uses the server's file wrapper (sendfile) when it has one, and reads the file in chunks otherwise
+    edl_file = open(edl_info['path'], 'rb')
+    edl_length = os.fstat(edl_file.fileno()).st_size
+    edl: Union[str, Iterable[bytes]] = wrap_file(request.environ, edl_file, EDL_STREAM_CHUNK_SIZE)
+    if edl_length == 0 and request_args.add_comment_if_empty:
+        edl_file.close()
         edl = '# Empty EDL'
-    max_age = ceil((datetime.now() - dateparser.parse(cache_refresh_rate)).total_seconds())  # type: ignore[operator]
+        edl_length = len(edl)
     demisto.debug(f'Returning edl of size: [{edl_size}], created: [{created}], query time seconds: [{query_time}],'
                   f' max age: [{max_age}], etag: [{etag}]')
-    resp = Response(edl, status=200, mimetype='text/plain', headers=[
+    resp = Response(edl, status=200, mimetype='text/plain', direct_passthrough=True, headers=[
         ('X-EDL-Created', created.isoformat()),
         ('X-EDL-Query-Time-Secs', "{:.3f}".format(query_time)),
         ('X-EDL-Size', str(edl_size)),
         ('ETag', etag),
+        ('Content-Length', str(edl_length)),
     ])
     resp.cache_control.max_age = max_age
     resp.cache_control[
@@ -472,7 +646,7 @@ def test_module(_: Dict, params: Dict):
 
 def update_edl_command(args: Dict, params: Dict):
     """
-    Updates the context to update the EDL values on demand the next time it runs
+    Updates the context to update the EDL values on demand, by the background refresher
     """
     on_demand = params.get('on_demand')
     if not on_demand:
@@ -495,7 +669,7 @@ def update_edl_command(args: Dict, params: Dict):
     ctx = request_args.to_context_json()
     ctx[EDL_ON_DEMAND_KEY] = True
     set_integration_context(ctx)
-    hr = 'EDL will be updated the next time you access it'
+    hr = 'EDL will be updated in the background, and served once it is updated'
     return hr, {}, {}
 
 
@@ -551,7 +725,12 @@ def main():
     try:
         initialize_edl_context(params)
         if command == 'long-running-execution':
-            run_long_running(params)
+            edl_on_demand_refresher = gevent.spawn(refresh_edl_on_demand_loop) if params.get('on_demand') else None
+            try:
+                run_long_running(params)
+            finally:
+                if edl_on_demand_refresher:
+                    edl_on_demand_refresher.kill(timeout=1.0)
         elif command in commands:
             readable_output, outputs, raw_response = commands[command](demisto.args(), params)
             return_outputs(readable_output, outputs, raw_response)
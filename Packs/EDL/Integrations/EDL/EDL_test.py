@@ -1,4 +1,5 @@
 """Imports"""
+import hashlib
 import json
 import pytest
 import os
@@ -62,42 +63,76 @@ class TestHelperFunctions:
         """
         Test get_edl_on_demand fetches indicators from cache
         Given:
-            - No refresh signal in context
-            - Cache has a valid value
+            - The on-demand EDL snapshot is ready
+            - Cache has a valid value, without stored info
         When:
             - calling get_edl_on_demand
         Then:
-            - return the edl from the system file
+            - return the info of the edl system file
         """
         import EDL as edl
         edl.EDL_ON_DEMAND_CACHE_PATH = 'EDL_test/TestHelperFunctions/iocs_cache_values_text.txt'
-        mocker.patch.object(edl, 'get_integration_context', return_value={})
-        actual_edl = edl.get_edl_on_demand()
+        mocker.patch.object(edl, 'EDL_ON_DEMAND_READY', edl.Event())
+        edl.EDL_ON_DEMAND_READY.set()
+        edl_info = edl.get_edl_on_demand()
         with open(edl.EDL_ON_DEMAND_CACHE_PATH, 'r') as f:
             expected_edl = f.read()
-            assert actual_edl == expected_edl
+        assert edl_info['path'] == edl.EDL_ON_DEMAND_CACHE_PATH
+        assert edl_info['size'] == expected_edl.count('\n') + 1
+        assert edl_info['etag'] == f'"{hashlib.sha1(expected_edl.encode()).hexdigest()}"'
 
-    def test_get_edl_on_demand__with_refresh_signal(self, mocker):
+    def test_get_edl_on_demand__not_ready(self, mocker):
         """
-        Test get_edl_on_demand fetches new indicators and stores them to cache when key is passed
+        Test get_edl_on_demand does not build the EDL in the request
         Given:
-            - refresh signal in context
+            - The first on-demand EDL snapshot was not written yet
         When:
             - calling get_edl_on_demand
         Then:
-            - save the edl to the system file
+            - raise an error once the wait for the snapshot times out
+        """
+        import EDL as edl
+        mocker.patch.object(edl, 'EDL_ON_DEMAND_READY', edl.Event())
+        mocker.patch.object(edl, 'EDL_ON_DEMAND_READY_TIMEOUT', 0)
+        create_new_edl = mocker.patch.object(edl, 'create_new_edl')
+        with pytest.raises(edl.DemistoException, match='not ready'):
+            edl.get_edl_on_demand()
+        assert create_new_edl.call_count == 0
+
+    def test_refresh_edl_on_demand(self, mocker):
+        """
+        Test refresh_edl_on_demand swaps the snapshot when an update is requested
+        Given:
+            - A current snapshot which is being streamed
+            - refresh signal in context
+        When:
+            - calling refresh_edl_on_demand twice
+        Then:
+            - save the new edl to the system file, and store its info next to it
+            - keep streaming the current snapshot to the request which opened it
+            - remove the refresh signal from the context, so the second call does nothing
         """
         import EDL as edl
         expected_edl = "8.8.8.8"
         ctx = {edl.EDL_ON_DEMAND_KEY: True, edl.RequestArguments.CTX_QUERY_KEY: "*"}
         tmp_dir = mkdtemp()
         edl.EDL_ON_DEMAND_CACHE_PATH = os.path.join(tmp_dir, 'cache')
-        mocker.patch.object(edl, 'get_integration_context', return_value=ctx)
-        mocker.patch.object(edl, 'create_new_edl', return_value=expected_edl)
-        actual_edl = edl.get_edl_on_demand()
+        edl.write_edl_file(['1.1.1.1'], edl.EDL_ON_DEMAND_CACHE_PATH)
+        mocker.patch.object(edl, 'EDL_ON_DEMAND_READY', edl.Event())
+        mocker.patch.object(edl, 'get_integration_context', side_effect=[ctx, {}])
+        set_integration_context = mocker.patch.object(edl, 'set_integration_context')
+        mocker.patch.object(edl, 'find_formatted_indicators', return_value=[expected_edl])
+        with open(edl.EDL_ON_DEMAND_CACHE_PATH, 'r') as streamed_file:
+            assert edl.refresh_edl_on_demand()
+            assert streamed_file.read() == '1.1.1.1'
+        assert not edl.refresh_edl_on_demand()
         with open(edl.EDL_ON_DEMAND_CACHE_PATH, 'r') as f:
             cached_edl = f.read()
-            assert actual_edl == expected_edl == cached_edl
+        assert expected_edl == cached_edl
+        assert edl.get_edl_on_demand() == {'path': edl.EDL_ON_DEMAND_CACHE_PATH, 'size': 1,
+                                           'etag': f'"{hashlib.sha1(expected_edl.encode()).hexdigest()}"'}
+        assert set_integration_context.call_args[0][0] == {edl.RequestArguments.CTX_QUERY_KEY: "*"}
+        assert sorted(os.listdir(tmp_dir)) == ['cache', 'cache.info']
 
     def test_iterable_to_str_1(self):
         """Test invalid"""
@@ -139,9 +174,14 @@ class TestHelperFunctions:
         import EDL as edl
         with open('EDL_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
             iocs_json = json.loads(iocs_json_f.read())
-            mocker.patch.object(edl, 'find_indicators_to_limit', return_value=iocs_json)
+            mocker.patch.object(edl.IndicatorsSearcher, 'search_indicators_by_version',
+                                side_effect=[{'iocs': iocs_json}, {'iocs': []}])
             request_args = edl.RequestArguments(query='', limit=38, url_port_stripping=True)
-            edl_vals = edl.create_new_edl(request_args)
+            edl_path = os.path.join(mkdtemp(), 'edl')
+            edl_info = edl.create_new_edl(request_args, edl_path)
+            with open(edl_path, 'r') as f:
+                edl_vals = f.read()
+            assert edl_info['size'] == len(edl_vals.split('\n'))
             for ioc in iocs_json:
                 ip = ioc.get('value')
                 stripped_ip = edl._PORT_REMOVAL.sub(edl._URL_WITHOUT_PORT, ip)
@@ -150,18 +190,124 @@ class TestHelperFunctions:
                 else:
                     assert ip in edl_vals
 
-    def test_find_indicators_to_limit(self, mocker):
-        """Test find indicators limit"""
+    def test_find_formatted_indicators__formats_each_page_once(self, mocker):
+        """
+        Test find_formatted_indicators formats every page of indicators once, and stops searching when reaching the limit
+        Given:
+            - 3 pages of indicators, where 1 indicator of the first page is dropped
+        When:
+            - calling find_formatted_indicators with a limit of 3
+        Then:
+            - search only the first 2 pages
+            - format each indicator once
+        """
         import EDL as edl
-        with open('EDL_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
-            iocs_json = json.loads(iocs_json_f.read())
-            indicator_searcher_res = [{'iocs': iocs_json}, {'iocs': []}]
-            limit = 37
-            indicator_searcher = edl.IndicatorsSearcher()
-            indicator_searcher.limit = limit
-            mocker.patch.object(indicator_searcher, 'search_indicators_by_version', side_effect=indicator_searcher_res)
-            edl_vals = edl.find_indicators_to_limit(indicator_searcher=indicator_searcher)
-            assert len(edl_vals) == limit
+        pages = [
+            {'iocs': [{'value': '1.1.1.1', 'indicator_type': 'IP'}, {'value': 'a.com:80', 'indicator_type': 'Domain'}]},
+            {'iocs': [{'value': '2.2.2.2', 'indicator_type': 'IP'}, {'value': '3.3.3.3', 'indicator_type': 'IP'}]},
+            {'iocs': [{'value': '4.4.4.4', 'indicator_type': 'IP'}, {'value': '5.5.5.5', 'indicator_type': 'IP'}]},
+        ]
+        search_indicators = mocker.patch.object(edl.IndicatorsSearcher, 'search_indicators_by_version',
+                                                side_effect=pages)
+        add_formatted_indicators = mocker.spy(edl, 'add_formatted_indicators')
+        request_args = edl.RequestArguments(query='', limit=3)
+        edl_vals = edl.find_formatted_indicators(request_args)
+        assert search_indicators.call_count == 2
+        assert [call_args[0][0] for call_args in add_formatted_indicators.call_args_list] == \
+            [pages[0]['iocs'], pages[1]['iocs']]
+        assert set(edl_vals) == {'1.1.1.1', '2.2.2.2', '3.3.3.3'}
+
+    def test_find_formatted_indicators__collapse_ips(self, mocker):
+        """
+        Test find_formatted_indicators collapses the IPs of all the pages together
+        Given:
+            - 2 pages of connected IPs
+        When:
+            - calling find_formatted_indicators with collapse IPs to ranges
+        Then:
+            - return a single range
+        """
+        import EDL as edl
+        pages = [
+            {'iocs': [{'value': '1.1.1.1', 'indicator_type': 'IP'}, {'value': '1.1.1.2', 'indicator_type': 'IP'}]},
+            {'iocs': [{'value': '1.1.1.3', 'indicator_type': 'IP'}]},
+            {'iocs': []},
+        ]
+        mocker.patch.object(edl.IndicatorsSearcher, 'search_indicators_by_version', side_effect=pages)
+        request_args = edl.RequestArguments(query='', limit=3, collapse_ips=edl.COLLAPSE_TO_RANGES)
+        assert edl.find_formatted_indicators(request_args) == ['1.1.1.1-1.1.1.3']
+
+    def test_get_edl__cache(self, mocker):
+        """
+        Test get_edl returns the kept EDL only while it is valid
+        Given:
+            - An EDL which was created for the request arguments
+        When:
+            - calling get_edl again, with no modified indicators, with modified indicators and after max age
+        Then:
+            - return the kept EDL when no indicators were modified
+            - create a new EDL otherwise
+        """
+        import EDL as edl
+        mocker.patch.object(edl, 'EDL_CACHE', {})
+        tmp_dir = mkdtemp()
+        mocker.patch.object(edl.demisto, 'uniqueFile', side_effect=['1', '2', '3', '4'])
+        mocker.patch.object(edl, 'find_formatted_indicators',
+                            side_effect=[['1.1.1.1'], ['2.2.2.2'], ['3.3.3.3'], ['4.4.4.4']])
+        create_new_edl = mocker.patch.object(edl, 'create_new_edl', side_effect=lambda request_args, file_path:
+                                             edl.write_edl_file(edl.find_formatted_indicators(request_args),
+                                                                os.path.join(tmp_dir, file_path)))
+        search_indicators = mocker.patch.object(edl.demisto, 'searchIndicators', return_value={'iocs': []})
+        request_args = edl.RequestArguments(query='type:IP')
+
+        def get_edl(request_args, max_age):
+            with open(edl.get_edl(request_args, max_age)['path'], 'r') as f:
+                return f.read()
+
+        assert get_edl(request_args, max_age=60) == '1.1.1.1'
+        assert get_edl(request_args, max_age=60) == '1.1.1.1'
+        assert create_new_edl.call_count == 1
+        assert search_indicators.call_args[1]['query'].endswith(' and (type:IP)')
+
+        search_indicators.return_value = {'iocs': [{'value': '2.2.2.2'}]}
+        assert get_edl(request_args, max_age=60) == '2.2.2.2'
+        # the replaced EDL file is removed
+        assert not os.path.exists(os.path.join(tmp_dir, '1'))
+
+        search_indicators.return_value = {'iocs': []}
+        assert get_edl(request_args, max_age=0) == '3.3.3.3'
+        assert get_edl(edl.RequestArguments(query='type:IP', limit=1), max_age=60) == '4.4.4.4'
+
+    @pytest.mark.parametrize('edl_vals, add_comment_if_empty, expected_response', [
+        (['1.1.1.1', '2.2.2.2'], False, b'1.1.1.1\n2.2.2.2'),
+        ([], True, b'# Empty EDL'),
+        ([], False, b''),
+    ])
+    def test_route_edl__streams_file(self, mocker, edl_vals, add_comment_if_empty, expected_response):
+        """
+        Test route_edl streams the EDL file with its stored info
+        Given:
+            - An EDL file
+        When:
+            - requesting the EDL
+        Then:
+            - respond with the file content, its ETag, size and length
+            - respond with a comment if the EDL is empty and add_comment_if_empty is set
+        """
+        import EDL as edl
+        edl_info = edl.write_edl_file(edl_vals, os.path.join(mkdtemp(), 'edl'))
+        mocker.patch.object(edl.demisto, 'params', return_value={'cache_refresh_rate': '1 minute',
+                                                                 'add_comment_if_empty': add_comment_if_empty})
+        mocker.patch.object(edl, 'get_edl', return_value=edl_info)
+        mocker.patch.object(edl, 'EDL_STREAM_CHUNK_SIZE', 4)
+        with edl.APP.test_client() as client:
+            response = client.get('/')
+        assert response.status_code == 200
+        assert response.data == expected_response
+        expected_etag = '"{}"'.format(hashlib.sha1('\n'.join(edl_vals).encode()).hexdigest())
+        assert response.headers['ETag'] == edl_info['etag'] == expected_etag
+        assert response.headers['X-EDL-Size'] == str(len(edl_vals))
+        assert response.headers['Content-Length'] == str(len(expected_response))
 
     def test_format_indicators(self):
         from EDL import format_indicators, RequestArguments, COLLAPSE_TO_RANGES
@@ -4,16 +4,23 @@ from CommonServerPython import *
 from CommonServerUserPython import *
 
 import re
+import heapq
+import operator
 from base64 import b64decode
 from flask import Flask, Response, request
+from werkzeug.wsgi import ClosingIterator, wrap_file
 from netaddr import IPAddress, IPSet
-from typing import Callable, Any, cast, Dict, Tuple
+from typing import Callable, Any, cast, Dict, IO, Iterable, Iterator, Tuple
 from math import ceil
+from itertools import chain, islice
 import dateparser
+import hashlib
 
 ''' GLOBAL VARIABLES '''
 INTEGRATION_NAME: str = 'Export Indicators Service'
 PAGE_SIZE: int = 200
+STREAM_CHUNK_SIZE: int = 64 * 1024
+EXPORT_CACHE_MAX_SIZE: int = 20
 APP: Flask = Flask('demisto-export_iocs')
 CTX_VALUES_KEY: str = 'dmst_export_iocs_values'
 CTX_MIMETYPE_KEY: str = 'dmst_export_iocs_mimetype'
@@ -66,6 +73,12 @@ _PORT_REMOVAL = re.compile(r'^([a-z0-9\-\.]+)(?:\:[0-9]+)*')
 _INVALID_TOKEN_REMOVAL = re.compile(r'(?:[^\./+=\?&]+\*[^\./+=\?&]*)|(?:[^\./+=\?&]*\*[^\./+=\?&]+)')
 _BROAD_PATTERN = re.compile(r'^(?:\*\.)+[a-zA-Z]+(?::[0-9]+)?$')
 
+# The lists which were created by their request arguments, each with the 'path' of the list file, its 'created' time
+# and its info, see get_list_part_info
+EXPORT_CACHE: Dict[str, dict] = {}
+# The IoCs of the last on-demand update, with the 'last_run' time of the update and the 'path' of the IoCs file
+ON_DEMAND_IOCS: dict = {}
+
 
 '''Request Arguments Class'''
 
@@ -97,6 +110,46 @@ class RequestArguments:
             if len(category_attribute_list) != 1 or '' not in category_attribute_list:
                 self.category_attribute = category_attribute_list
 
+    def to_context_json(self) -> dict:
+        """Returns the request arguments, as stored in the integration context by an on-demand update"""
+        return {
+            'last_limit': self.limit,
+            'last_offset': self.offset,
+            'last_format': self.out_format,
+            'last_query': self.query,
+            'mwg_type': self.mwg_type,
+            'drop_invalids': self.drop_invalids,
+            'strip_port': self.strip_port,
+            'category_default': self.category_default,
+            'category_attribute': self.category_attribute,
+            'collapse_ips': self.collapse_ips,
+            'csv_text': self.csv_text,
+            'sort_field': self.sort_field,
+            'sort_order': self.sort_order,
+        }
+
+    @classmethod
+    def from_context_json(cls, ctx_dict: dict):
+        """Returns an initiated instance of the class from the integration context of an on-demand update"""
+        request_args = cls(
+            query=ctx_dict.get('last_query') or '',
+            **assign_params(
+                out_format=ctx_dict.get('last_format'),
+                limit=ctx_dict.get('last_limit'),
+                offset=ctx_dict.get('last_offset'),
+                mwg_type=ctx_dict.get('mwg_type'),
+                strip_port=ctx_dict.get('strip_port'),
+                drop_invalids=ctx_dict.get('drop_invalids'),
+                category_default=ctx_dict.get('category_default'),
+                collapse_ips=ctx_dict.get('collapse_ips'),
+                csv_text=ctx_dict.get('csv_text'),
+                sort_field=ctx_dict.get('sort_field'),
+                sort_order=ctx_dict.get('sort_order'),
+            )
+        )
+        request_args.category_attribute = ctx_dict.get('category_attribute') or []
+        return request_args
+
     def is_request_change(self, last_update_data: Dict):
         if self.limit != last_update_data.get('last_limit'):
             return True
@@ -153,105 +206,178 @@ def list_to_str(inp_list: list, delimiter: str = ',', map_func: Callable = str)
     return str_res
 
 
-def sort_iocs(request_args: RequestArguments, iocs: list) -> list:
+def find_top_iocs(request_args: RequestArguments, iocs: Iterator[dict], size: int) -> list:
     """
-    Sorts the IoCs according to the sort field and order.
-    Returns: Sorted List of IoCs, if sorting arguments are defined.
+    Finds the first IoCs according to the sort field and order, without keeping more than a few times size IoCs in
+    memory while iterating. If the IoCs could not be sorted, the first IoCs are returned in their search order.
+    Returns: Sorted List of the first IoCs.
     """
+    if request_args.sort_order == SORT_ASCENDING:
+        select, precedes = heapq.nsmallest, operator.lt
+    else:
+        select, precedes = heapq.nlargest, operator.gt
+
+    def sort_key(ioc):
+        return ioc[request_args.sort_field]
+
+    first_iocs = list(islice(iocs, size))
+    if not first_iocs:
+        return []
     try:
-        if request_args.sort_field:
-            if request_args.sort_order == SORT_ASCENDING:
-                return sorted(iocs, key=lambda ioc: ioc[request_args.sort_field], reverse=False)
-            elif request_args.sort_order == SORT_DESCENDING:
-                return sorted(iocs, key=lambda ioc: ioc[request_args.sort_field], reverse=True)
+        top_iocs = select(size, first_iocs, key=sort_key)
+        # once there are enough IoCs, only IoCs that precede the last selected one can be selected
+        last_key = sort_key(top_iocs[-1])
+        for ioc in iocs:
+            if precedes(sort_key(ioc), last_key):
+                top_iocs.append(ioc)
+                if len(top_iocs) >= 2 * size + PAGE_SIZE:
+                    top_iocs = select(size, top_iocs, key=sort_key)
+                    last_key = sort_key(top_iocs[-1])
+        return select(size, top_iocs, key=sort_key)
     except KeyError:
         demisto.debug('ExportIndicators - Could not sort IoCs, please verify that you entered the correct field name.\n'
                       f'Field used: {request_args.sort_field}')
     except Exception as e:
         demisto.debug(f'ExportIndicators - Could not sort IoCs due to an unknown error.\n{e}')
 
-    return iocs
+    return first_iocs
 
 
-def refresh_outbound_context(request_args: RequestArguments, on_demand: bool = False) -> str:
+def count_formatted_entries(ioc: dict, request_args: RequestArguments) -> int:
     """
-    Refresh the values and format using an indicator_query to call demisto.searchIndicators
-    Update integration cache only in case of running on demand
-    Returns: List(IoCs in output format)
+    Counts the entries the IoC adds to the formatted values, for the formats that do not collapse IoCs together
     """
-    now = datetime.now()
-    # poll indicators into list from demisto
-    iocs = []
-    out_dict: dict = {}
-    limit = request_args.offset + request_args.limit
-    indicator_searcher = IndicatorsSearcher(
-        query=request_args.query,
-        size=PAGE_SIZE
-    )
-    while True:
-        indicator_searcher.limit = limit + 100  # fetch more indicators to reduce chances of search after truncation
-        new_iocs = find_indicators_with_limit(indicator_searcher)[request_args.offset:limit]
-        if not new_iocs:
-            break
-        iocs += new_iocs
-        iocs = sort_iocs(request_args, iocs)
-        # reformat the output
-        out_dict, actual_indicator_amount = create_values_for_returned_dict(iocs, request_args)
-        if request_args.out_format in [FORMAT_CSV, FORMAT_XSOAR_CSV]:
-            actual_indicator_amount = actual_indicator_amount - 1
-        if actual_indicator_amount >= len(iocs) or (indicator_searcher.total and indicator_searcher.total <= limit):
-            # continue searching iocs if 1) iocs was truncated or 2) got all available iocs
-            break
-        # advance search window with gap size
-        limit += (limit - actual_indicator_amount)
+    if request_args.out_format == FORMAT_PROXYSG:
+        return int(bool(ioc.get('indicator_type') in ['URL', 'Domain', 'DomainGlob'] and ioc.get('value')))
 
-    if request_args.out_format == FORMAT_JSON:
-        out_dict[CTX_MIMETYPE_KEY] = MIMETYPE_JSON
+    return int(bool(ioc.get('value')))
 
-    elif request_args.out_format in [FORMAT_CSV, FORMAT_XSOAR_CSV]:
-        if request_args.csv_text:
-            out_dict[CTX_MIMETYPE_KEY] = MIMETYPE_TEXT
 
+def select_collapsed_iocs(iocs: Iterator[dict], request_args: RequestArguments) -> list:
+    """
+    Takes IoCs until the formatted values hold request_args.limit entries, where IPs are collapsed to ranges or CIDRs.
+    The collapsed entries are counted only once the IoCs taken since the last count could have reached the limit.
+    """
+    limit = request_args.limit
+    iocs_list: List[dict] = []
+    ip_sets = {'IP': IPSet(), 'IPv6': IPSet()}
+    values_count = 0
+    not_ip_count = 0
+    next_count = limit
+    for ioc in iocs:
+        iocs_list.append(ioc)
+        value = ioc.get('value')
+        if not value:
+            continue
+
+        ip_set = ip_sets.get(ioc.get('indicator_type'))
+        if ip_set is None:
+            not_ip_count += 1
         else:
-            out_dict[CTX_MIMETYPE_KEY] = MIMETYPE_CSV
+            ip_set.add(IPAddress(value))
 
-    elif request_args.out_format in [FORMAT_JSON_SEQ, FORMAT_XSOAR_JSON_SEQ]:
-        out_dict[CTX_MIMETYPE_KEY] = MIMETYPE_JSON_SEQ
+        values_count += 1
+        if values_count >= next_count:
+            entries_count = not_ip_count + sum(len(ip_set_to_ranges(ip_set, request_args.collapse_ips))
+                                               for ip_set in ip_sets.values())
+            if entries_count >= limit:
+                break
+            next_count = values_count + limit - entries_count
+
+    return iocs_list
+
+
+def select_panos_url_iocs(iocs: Iterator[dict], request_args: RequestArguments) -> Tuple[list, dict]:
+    """
+    Takes IoCs until their PAN-OS URL formatted values hold request_args.limit entries, formatting each IoC once.
+    Returns: List of the taken IoCs, and a dictionary of the formatted values
+    """
+    iocs_list: List[dict] = []
+    formatted_indicators: List[str] = []
+    for ioc in iocs if request_args.limit > 0 else []:
+        iocs_list.append(ioc)
+        formatted_indicators.extend(panos_url_format_indicator(ioc, request_args.drop_invalids,
+                                                               request_args.strip_port))
+        if len(formatted_indicators) >= request_args.limit:
+            break
+
+    return iocs_list, {CTX_VALUES_KEY: list_to_str(formatted_indicators, '\n')} if iocs_list else {}
+
+
+def select_outbound_iocs(iocs: Iterator[dict], request_args: RequestArguments) -> list:
+    """
+    Takes IoCs until their formatted values hold request_args.limit entries, so that IoCs which the output format
+    drops do not count towards the limit.
+    Returns: List of the taken IoCs.
+    """
+    if request_args.limit <= 0:
+        return []
+
+    if request_args.out_format in [FORMAT_MWG, FORMAT_JSON, FORMAT_XSOAR_JSON]:
+        return list(islice(iocs, request_args.limit))
+
+    if request_args.out_format in [FORMAT_TEXT, FORMAT_CSV] and request_args.collapse_ips != DONT_COLLAPSE:
+        return select_collapsed_iocs(iocs, request_args)
+
+    iocs_list: List[dict] = []
+    entries_count = 0
+    for ioc in iocs:
+        iocs_list.append(ioc)
+        entries_count += count_formatted_entries(ioc, request_args)
+        if entries_count >= request_args.limit:
+            break
+
+    return iocs_list
+
+
+def find_outbound_iocs(request_args: RequestArguments) -> Tuple[list, dict]:
+    """
+    Find the IoCs using an indicator_query to call demisto.searchIndicators, and format them.
+    The indicator pages are searched once, and only the IoCs which are returned are formatted.
+    Returns: The IoCs, and a dictionary of the formatted values
+    """
+    indicator_searcher = IndicatorsSearcher(
+        query=request_args.query,
+        size=PAGE_SIZE
+    )
+    iocs = iter_indicators(indicator_searcher)
+    if request_args.sort_field and request_args.sort_order in [SORT_ASCENDING, SORT_DESCENDING]:
+        iocs = iter(find_top_iocs(request_args, iocs, request_args.offset + request_args.limit))
 
+    iocs = islice(iocs, request_args.offset, None)
+    if request_args.out_format == FORMAT_PANOSURL:
+        iocs_list, out_dict = select_panos_url_iocs(iocs, request_args)
     else:
-        out_dict[CTX_MIMETYPE_KEY] = MIMETYPE_TEXT
+        iocs_list = select_outbound_iocs(iocs, request_args)
+        out_dict = create_values_for_returned_dict(iocs_list, request_args)[0] if iocs_list else {}
+    out_dict[CTX_MIMETYPE_KEY] = get_outbound_mimetype(request_args)
+    return iocs_list, out_dict
+
+
+def refresh_outbound_context(request_args: RequestArguments, on_demand: bool = False) -> str:
+    """
+    Refresh the values and format using an indicator_query to call demisto.searchIndicators
+    Update integration cache only in case of running on demand. Only the request arguments and the update time are
+    stored, and the server searches the IoCs of the update once per update, when the list is first requested.
+    Returns: List(IoCs in output format)
+    """
+    now = datetime.now()
+    _, out_dict = find_outbound_iocs(request_args)
 
     if on_demand:
         set_integration_context({
-            "last_output": out_dict,
             'last_run': date_to_timestamp(now),
-            'last_limit': request_args.limit,
-            'last_offset': request_args.offset,
-            'last_format': request_args.out_format,
-            'last_query': request_args.query,
-            'current_iocs': iocs,
-            'mwg_type': request_args.mwg_type,
-            'drop_invalids': request_args.drop_invalids,
-            'strip_port': request_args.strip_port,
-            'category_default': request_args.category_default,
-            'category_attribute': request_args.category_attribute,
-            'collapse_ips': request_args.collapse_ips,
-            'csv_text': request_args.csv_text,
-            'sort_field': request_args.sort_field,
-            'sort_order': request_args.sort_order,
+            **request_args.to_context_json(),
         })
     return out_dict[CTX_VALUES_KEY] if CTX_VALUES_KEY in out_dict else []
 
 
-def find_indicators_with_limit(indicator_searcher: IndicatorsSearcher) -> list:
+def iter_indicators(indicator_searcher: IndicatorsSearcher) -> Iterator[dict]:
     """
-    Finds indicators using demisto.searchIndicators
+    Iterates the indicators found using demisto.searchIndicators, keeping a single page of them in memory
     """
-    iocs: List[dict] = []
     for ioc_res in indicator_searcher:
-        fetched_iocs = ioc_res.get('iocs') or []
-        iocs.extend(fetched_iocs)
-    return iocs
+        yield from ioc_res.get('iocs') or []
 
 
 def ip_groups_to_cidrs(ip_range_groups: list):
@@ -304,67 +430,89 @@ def ips_to_ranges(ips: list, collapse_ips: str):
         ips (list): a list of IP strings.
         collapse_ips (str): Whether to collapse to Ranges or CIDRs.
 
+    Returns:
+        list. a list to Ranges or CIDRs.
+    """
+    return ip_set_to_ranges(IPSet(ips), collapse_ips)
+
+
+def ip_set_to_ranges(ip_set: IPSet, collapse_ips: str):
+    """Collapse an IP set to Ranges or CIDRs.
+
+    Args:
+        ip_set (IPSet): the IPs to collapse.
+        collapse_ips (str): Whether to collapse to Ranges or CIDRs.
+
     Returns:
         list. a list to Ranges or CIDRs.
     """
 
     if collapse_ips == COLLAPSE_TO_RANGES:
-        ips_range_groups = IPSet(ips).iter_ipranges()
+        ips_range_groups = ip_set.iter_ipranges()
         return ip_groups_to_ranges(ips_range_groups)
 
     else:
-        cidrs = IPSet(ips).iter_cidrs()
+        cidrs = ip_set.iter_cidrs()
         return ip_groups_to_cidrs(cidrs)
 
 
 def panos_url_formatting(iocs: list, drop_invalids: bool, strip_port: bool):
     formatted_indicators = []  # type:List
     for indicator_data in iocs:
-        # only format URLs and Domains
-        indicator = indicator_data.get('value')
-        if not indicator:
-            continue
-        if indicator_data.get('indicator_type') in ['URL', 'Domain', 'DomainGlob']:
-            indicator = indicator.lower()
-
-            # remove initial protocol - http/https/ftp/ftps etc
-            indicator = _PROTOCOL_REMOVAL.sub('', indicator)
-
-            indicator_with_port = indicator
-            # remove port from indicator - from demisto.com:369/rest/of/path -> demisto.com/rest/of/path
-            indicator = _PORT_REMOVAL.sub(r'\g<1>', indicator)
-            # check if removing the port changed something about the indicator
-            if indicator != indicator_with_port and not strip_port:
-                # if port was in the indicator and strip_port param not set - ignore the indicator
-                continue
-
-            with_invalid_tokens_indicator = indicator
-            # remove invalid tokens from indicator
-            indicator = _INVALID_TOKEN_REMOVAL.sub('*', indicator)
-
-            # check if the indicator held invalid tokens
-            if with_invalid_tokens_indicator != indicator:
-                # invalid tokens in indicator- if drop_invalids is set - ignore the indicator
-                if drop_invalids:
-                    continue
-
-                # check if after removing the tokens the indicator is too broad if so - ignore
-                # example of too broad terms: "*.paloalto", "*.*.paloalto", "*.paloalto:60"
-                hostname = indicator
-                if '/' in hostname:
-                    hostname, _ = hostname.split('/', 1)
-
-                if _BROAD_PATTERN.match(hostname) is not None:
-                    continue
-
-            # for PAN-OS "*.domain.com" does not match "domain.com" - we should provide both
-            if indicator.startswith('*.'):
-                formatted_indicators.append(indicator[2:])
-
-        formatted_indicators.append(indicator)
+        formatted_indicators.extend(panos_url_format_indicator(indicator_data, drop_invalids, strip_port))
     return {CTX_VALUES_KEY: list_to_str(formatted_indicators, '\n')}, len(formatted_indicators)
 
 
+def panos_url_format_indicator(indicator_data: dict, drop_invalids: bool, strip_port: bool) -> list:
+    """
+    Formats a single IoC for PAN-OS, returns an empty list if the IoC is ignored
+    """
+    # only format URLs and Domains
+    indicator = indicator_data.get('value')
+    if not indicator:
+        return []
+    formatted_indicators = []  # type:List
+    if indicator_data.get('indicator_type') in ['URL', 'Domain', 'DomainGlob']:
+        indicator = indicator.lower()
+
+        # remove initial protocol - http/https/ftp/ftps etc
+        indicator = _PROTOCOL_REMOVAL.sub('', indicator)
+
+        indicator_with_port = indicator
+        # remove port from indicator - from demisto.com:369/rest/of/path -> demisto.com/rest/of/path
+        indicator = _PORT_REMOVAL.sub(r'\g<1>', indicator)
+        # check if removing the port changed something about the indicator
+        if indicator != indicator_with_port and not strip_port:
+            # if port was in the indicator and strip_port param not set - ignore the indicator
+            return []
+
+        with_invalid_tokens_indicator = indicator
+        # remove invalid tokens from indicator
+        indicator = _INVALID_TOKEN_REMOVAL.sub('*', indicator)
+
+        # check if the indicator held invalid tokens
+        if with_invalid_tokens_indicator != indicator:
+            # invalid tokens in indicator- if drop_invalids is set - ignore the indicator
+            if drop_invalids:
+                return []
+
+            # check if after removing the tokens the indicator is too broad if so - ignore
+            # example of too broad terms: "*.paloalto", "*.*.paloalto", "*.paloalto:60"
+            hostname = indicator
+            if '/' in hostname:
+                hostname, _ = hostname.split('/', 1)
+
+            if _BROAD_PATTERN.match(hostname) is not None:
+                return []
+
+        # for PAN-OS "*.domain.com" does not match "domain.com" - we should provide both
+        if indicator.startswith('*.'):
+            formatted_indicators.append(indicator[2:])
+
+    formatted_indicators.append(indicator)
+    return formatted_indicators
+
+
 def create_json_out_format(iocs: list):
     formatted_indicators = []  # type:List
     for indicator_data in iocs:
@@ -379,9 +527,8 @@ def json_format_single_indicator(indicator: dict):
     json_format_indicator = {
         "indicator": indicator.get("value")
     }
-    indicator.pop("value", None)
-
-    json_format_indicator["value"] = indicator
+    # the IoC is not modified, as it may be formatted again for another request
+    json_format_indicator["value"] = {key: value for key, value in indicator.items() if key != "value"}
     return json_format_indicator
 
 
@@ -522,64 +669,181 @@ def create_values_for_returned_dict(iocs: list, request_args: RequestArguments)
     return {CTX_VALUES_KEY: list_to_str(formatted_indicators, '\n')}, len(formatted_indicators)
 
 
-def get_outbound_mimetype() -> str:
+def get_outbound_mimetype(request_args: RequestArguments) -> str:
     """Returns the mimetype of the export_iocs"""
-    ctx = get_integration_context().get('last_output', {})
-    return ctx.get(CTX_MIMETYPE_KEY, 'text/plain')
+    if request_args.out_format == FORMAT_JSON:
+        return MIMETYPE_JSON
+
+    elif request_args.out_format in [FORMAT_CSV, FORMAT_XSOAR_CSV]:
+        if request_args.csv_text:
+            return MIMETYPE_TEXT
+
+        return MIMETYPE_CSV
+
+    elif request_args.out_format in [FORMAT_JSON_SEQ, FORMAT_XSOAR_JSON_SEQ]:
+        return MIMETYPE_JSON_SEQ
+
+    return MIMETYPE_TEXT
+
+
+def write_ioc_lines(iocs: Iterable[dict], file_path: str):
+    """
+    Writes the IoCs to a file, one JSON per line
+    """
+    with open(file_path, 'w', encoding='utf-8') as file:
+        for ioc in iocs:
+            file.write(f'{json.dumps(ioc)}\n')
+
+
+def remove_cache_file(cache_entry: Optional[dict]):
+    """
+    Removes the file of a cache entry
+    """
+    if not cache_entry:
+        return
+    try:
+        os.remove(cache_entry['path'])
+    except OSError as e:
+        demisto.debug(f'Failed removing the cache file {cache_entry["path"]}: {e}')
+
+
+def get_list_part_info(chunks: Iterable[bytes], file: Optional[IO[bytes]] = None) -> dict:
+    """
+    Computes the ETag, length and number of lines of a part of the list, chunk by chunk.
+
+    Parameters:
+        chunks: The encoded chunks of the list part
+        file: A file to write the chunks to, while computing
+
+    Returns: The list part info - its 'etag', 'length' in bytes, number of 'newlines' and whether it 'has_content'
+    """
+    sha1 = hashlib.sha1()  # guardrails-disable-line
+    length = newlines = 0
+    has_content = False
+    for chunk in chunks:
+        if file:
+            file.write(chunk)
+        sha1.update(chunk)
+        length += len(chunk)
+        newlines += chunk.count(b'\n')
+        has_content = has_content or bool(chunk.strip())
+    return {'etag': f'"{sha1.hexdigest()}"', 'length': length, 'newlines': newlines, 'has_content': has_content}
+
+
+def get_cached_values(cache_key: str, create_values: Callable[[], str], min_created: Optional[float] = None) -> dict:
+    """
+    Gets the list of the cache key from the cache, or creates it and keeps it in the cache.
+    Each list is kept in a file, so lists of several formats and queries are kept at once.
+    The ETag, length and number of lines of the list are computed while writing its file, and are kept with it,
+    so the list is served without reading it first.
+
+    Parameters:
+        cache_key: The key of the list, built of its request arguments
+        create_values: Creates the list if it is not in the cache
+        min_created: The timestamp before which a kept list is not used
+
+    Returns: The cache entry of the list - its file 'path', 'created' time, and list part info
+    """
+    cached = EXPORT_CACHE.get(cache_key)
+    if cached and (min_created is None or cached['created'] > min_created) and os.path.exists(cached['path']):
+        return cached
+
+    created = date_to_timestamp(datetime.now())
+    values = create_values() or ''
+    file_path = demisto.uniqueFile()
+    with open(file_path, 'wb') as file:
+        list_info = get_list_part_info(iter_encoded_chunks(values), file)
+    remove_cache_file(EXPORT_CACHE.pop(cache_key, None))
+    if len(EXPORT_CACHE) >= EXPORT_CACHE_MAX_SIZE:
+        # evict the least recently created list
+        remove_cache_file(EXPORT_CACHE.pop(next(iter(EXPORT_CACHE))))
+    EXPORT_CACHE[cache_key] = {'path': file_path, 'created': created, **list_info}
+    return EXPORT_CACHE[cache_key]
+
+
+def get_on_demand_iocs(last_update_data: dict) -> list:
+    """
+    Gets the IoCs of the last on-demand update. They are searched once per update, and kept in a file, so the lists
+    of other formats are created from them without searching again.
+
+    Parameters:
+        last_update_data: The integration context, as stored by the update
+
+    Returns: The IoCs of the update
+    """
+    global ON_DEMAND_IOCS
+    last_run = last_update_data.get('last_run')
+    if ON_DEMAND_IOCS.get('last_run') == last_run:
+        try:
+            with open(ON_DEMAND_IOCS['path'], 'r', encoding='utf-8') as file:
+                return [json.loads(line) for line in file]
+        except OSError as e:
+            demisto.debug(f'Failed reading the on-demand IoCs file {ON_DEMAND_IOCS["path"]}: {e}')
+
+    iocs, _ = find_outbound_iocs(RequestArguments.from_context_json(last_update_data))
+    file_path = demisto.uniqueFile()
+    write_ioc_lines(iocs, file_path)
+    remove_cache_file(ON_DEMAND_IOCS)
+    ON_DEMAND_IOCS = {'last_run': last_run, 'path': file_path}
+    return iocs
+
+
+def get_on_demand_cache_key(request_args: RequestArguments, last_update_data: dict) -> str:
+    """
+    Returns the cache key of an on-demand list. The list is of the query of the last update.
+    """
+    return json.dumps({**request_args.to_context_json(), 'last_query': last_update_data.get('last_query'),
+                       'last_run': last_update_data.get('last_run')}, sort_keys=True)
 
 
 def get_outbound_ioc_values(on_demand, request_args: RequestArguments,
-                            last_update_data=None, cache_refresh_rate=None) -> str:
+                            last_update_data=None, cache_refresh_rate=None) -> Optional[dict]:
     """
-    Get the ioc list to return in the list
+    Get the cache entry of the ioc list to return in the list, see get_cached_values
     """
     if last_update_data is None:
         last_update_data = {}
 
-    last_update = last_update_data.get('last_run')
-    last_query = last_update_data.get('last_query')
-    current_iocs = last_update_data.get('current_iocs')
-
-    # on_demand ignores cache
+    # on_demand serves the IoCs of the last update
     if on_demand:
+        if not last_update_data.get('last_run'):
+            return None
+        # the IoCs of the update are searched only when a list of the update is not in the cache
         if request_args.is_request_change(last_update_data):
-            values_str = get_ioc_values_str_from_context(request_args=request_args, iocs=current_iocs)
+            return get_cached_values(get_on_demand_cache_key(request_args, last_update_data),
+                                     lambda: get_ioc_values_str_from_context(
+                                         request_args=request_args, iocs=get_on_demand_iocs(last_update_data)))
+        # the IoCs of the update were already selected by its arguments, so they are only formatted
+        return get_cached_values(get_on_demand_cache_key(request_args, last_update_data),
+                                 lambda: get_update_values_str(request_args=request_args,
+                                                               iocs=get_on_demand_iocs(last_update_data)))
 
-        else:
-            values_str = get_ioc_values_str_from_context(request_args=request_args)
-
-    else:
-        if last_update:
-            # takes the cache_refresh_rate amount of time back since run time.
-            cache_time, _ = parse_date_range(cache_refresh_rate, to_timestamp=True)
-            if last_update <= cache_time or request_args.is_request_change(last_update_data) or \
-                    request_args.query != last_query:
-                values_str = refresh_outbound_context(request_args=request_args)
-            else:
-                values_str = get_ioc_values_str_from_context(request_args=request_args)
-        else:
-            values_str = refresh_outbound_context(request_args)
-
-    return values_str
+    # takes the cache_refresh_rate amount of time back since run time.
+    cache_time, _ = parse_date_range(cache_refresh_rate, to_timestamp=True)
+    return get_cached_values(json.dumps(request_args.to_context_json(), sort_keys=True),
+                             lambda: refresh_outbound_context(request_args=request_args), cache_time)
 
 
 def get_ioc_values_str_from_context(request_args: RequestArguments, iocs=None) -> str:
     """
-    Extracts output values from cache
+    Formats the IoCs of the last on-demand update by the request arguments
     """
-    if iocs:
-        if request_args.offset > len(iocs):
-            return ''
+    if not iocs or request_args.offset > len(iocs):
+        return ''
 
-        iocs = iocs[request_args.offset: request_args.limit + request_args.offset]
-        returned_dict, _ = create_values_for_returned_dict(iocs, request_args=request_args)
-        current_cache = get_integration_context()
-        current_cache['last_output'] = returned_dict
-        set_integration_context(current_cache)
+    iocs = iocs[request_args.offset: request_args.limit + request_args.offset]
+    returned_dict, _ = create_values_for_returned_dict(iocs, request_args=request_args)
+    return returned_dict.get(CTX_VALUES_KEY, '')
 
-    else:
-        returned_dict = get_integration_context().get('last_output', {})
 
+def get_update_values_str(request_args: RequestArguments, iocs: list) -> str:
+    """
+    Formats the IoCs of the last on-demand update by the arguments of the update, as the update formatted them
+    """
+    if not iocs:
+        return ''
+
+    returned_dict, _ = create_values_for_returned_dict(iocs, request_args=request_args)
     return returned_dict.get(CTX_VALUES_KEY, '')
 
 
@@ -694,6 +958,19 @@ def get_request_args(params):
                             category_attribute, collapse_ips, csv_text, sort_field, sort_order)
 
 
+def iter_encoded_chunks(values: str) -> Iterator[bytes]:
+    """
+    Iterates over the encoded chunks of the list values, without encoding them into a single string.
+
+    Parameters:
+        values: The list values
+
+    Returns: The encoded chunks of the list
+    """
+    for i in range(0, len(values), STREAM_CHUNK_SIZE):
+        yield values[i:i + STREAM_CHUNK_SIZE].encode()
+
+
 @APP.route('/', methods=['GET'])
 def route_list_values() -> Response:
     """
@@ -718,44 +995,66 @@ def route_list_values() -> Response:
         created = datetime.now(timezone.utc)
         cache_refresh_rate = params.get('cache_refresh_rate')
 
-        values = get_outbound_ioc_values(
+        last_update_data = get_integration_context()
+        list_info = get_outbound_ioc_values(
             on_demand=params.get('on_demand'),
-            last_update_data=get_integration_context(),
+            last_update_data=last_update_data,
             cache_refresh_rate=cache_refresh_rate,
             request_args=request_args
         )
         query_time = (datetime.now(timezone.utc) - created).total_seconds()
 
-        if not get_integration_context() and params.get('on_demand'):
-            values = 'You are running in On-Demand mode - please run !eis-update command to initialize the ' \
-                     'export process'
+        values: Iterable[bytes]
+        if not last_update_data and params.get('on_demand'):
+            values = ['You are running in On-Demand mode - please run !eis-update command to initialize the '
+                      'export process'.encode()]
+            list_info = get_list_part_info(values)
+
+        elif not list_info or not list_info['length']:
+            values = ["No Results Found For the Query".encode()]
+            list_info = get_list_part_info(values)
 
-        elif not values:
-            values = "No Results Found For the Query"
+        else:
+            # the file is opened before responding, so it is streamed even if a newer list replaces it meanwhile.
+            # wrap_file uses the server's file wrapper (sendfile) when it has one, and reads the file in chunks otherwise
+            values = wrap_file(request.environ, open(list_info['path'], 'rb'), STREAM_CHUNK_SIZE)
 
+        # the list is streamed by parts, so the values are not copied to add the strings around them
+        list_parts: List[Tuple[Iterable[bytes], dict]] = [(values, list_info)]
         # if the case there are strings to add to the EDL, add them if the output type is text
         if request_args.out_format == FORMAT_TEXT:
             append_str = params.get("append_string")
             prepend_str = params.get("prepend_string")
             if append_str:
-                append_str = append_str.replace("\\n", "\n")
-                values = f"{values}{append_str}"
+                append_part = [append_str.replace("\\n", "\n").encode()]
+                list_parts.append((append_part, get_list_part_info(append_part)))
             if prepend_str:
-                prepend_str = prepend_str.replace("\\n", "\n")
-                values = f"{prepend_str}\n{values}"
+                prepend_part = [(prepend_str.replace("\\n", "\n") + '\n').encode()]
+                list_parts.insert(0, (prepend_part, get_list_part_info(prepend_part)))
 
-        mimetype = get_outbound_mimetype()
+        mimetype = get_outbound_mimetype(request_args)
 
         list_size = 0
-        if values.strip():
-            list_size = values.count('\n') + 1  # add 1 as last line doesn't have a \n
+        if any(part_info['has_content'] for _, part_info in list_parts):
+            # add 1 as last line doesn't have a \n
+            list_size = sum(part_info['newlines'] for _, part_info in list_parts) + 1
+        list_length = sum(part_info['length'] for _, part_info in list_parts)
+        etag = list_info['etag']
+        if len(list_parts) > 1:
+            # the ETag of each part is kept with it, so the list ETag is built of them without reading the list
+            etag = get_list_part_info(part_info['etag'].encode() for _, part_info in list_parts)['etag']
+            values = ClosingIterator(chain.from_iterable(part for part, _ in list_parts),
+                                     getattr(values, 'close', None))
+
         max_age = ceil((datetime.now() - dateparser.parse(cache_refresh_rate)).total_seconds())  # type: ignore[operator]
         demisto.debug(f'Returning exported indicators list of size: [{list_size}], created: [{created}], '
-                      f'query time seconds: [{query_time}], max age: [{max_age}]')
-        resp = Response(values, status=200, mimetype=mimetype, headers=[
+                      f'query time seconds: [{query_time}], max age: [{max_age}], etag: [{etag}]')
+        resp = Response(values, status=200, mimetype=mimetype, direct_passthrough=True, headers=[
             ('X-ExportIndicators-Created', created.isoformat()),
             ('X-ExportIndicators-Query-Time-Secs', "{:.3f}".format(query_time)),
-            ('X-ExportIndicators-Size', str(list_size))
+            ('X-ExportIndicators-Size', str(list_size)),
+            ('ETag', etag),
+            ('Content-Length', str(list_length)),
         ])
         resp.cache_control.max_age = max_age
         resp.cache_control[
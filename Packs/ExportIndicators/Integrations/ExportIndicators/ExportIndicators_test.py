@@ -1,6 +1,12 @@
 """Imports"""
+import copy
 import json
+import os
+import uuid
 import pytest
+from datetime import datetime
+from tempfile import mkdtemp
+from CommonServerPython import date_to_timestamp
 import demistomock as demisto
 from netaddr import IPAddress
 
@@ -9,124 +15,157 @@ IOC_RES_LEN = 38
 '''Tests'''
 
 
+def mock_cache(mocker):
+    """Mocks the cache of the lists, so its files are written to a temporary directory"""
+    import ExportIndicators as ei
+    tmp_dir = mkdtemp()
+    mocker.patch.object(ei, 'EXPORT_CACHE', {})
+    mocker.patch.object(ei, 'ON_DEMAND_IOCS', {})
+    mocker.patch.object(ei.demisto, 'uniqueFile', side_effect=lambda: os.path.join(tmp_dir, str(uuid.uuid4())))
+
+
+def read_list(list_info):
+    """Reads the list values from the file of its cache entry"""
+    with open(list_info['path'], 'r', encoding='utf-8') as file:
+        return file.read()
+
+
 class TestHelperFunctions:
     def test_get_outbound_ioc_values_1(self, mocker):
         """Test on_demand"""
-        from ExportIndicators import get_outbound_ioc_values, RequestArguments
-        with open('ExportIndicators_test/TestHelperFunctions/iocs_cache_values_text.json', 'r') as iocs_text_values_f:
-            iocs_text_dict = json.loads(iocs_text_values_f.read())
-            mocker.patch.object(demisto, 'getIntegrationContext', return_value={"last_output": iocs_text_dict})
-            request_args = RequestArguments(query='', out_format='text', limit=50, offset=0)
-            ioc_list = get_outbound_ioc_values(
-                on_demand=True,
-                request_args=request_args
-            )
-            for ioc_row in ioc_list:
-                assert ioc_row in iocs_text_dict
+        import ExportIndicators as ei
+        mock_cache(mocker)
+        with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
+            iocs_json = json.loads(iocs_json_f.read())
+        find_indicators = mocker.patch.object(ei, 'iter_indicators', return_value=iocs_json)
+        request_args = ei.RequestArguments(query='', out_format='text', limit=50, offset=0)
+        last_update_data = {'last_run': 1578383898000, **request_args.to_context_json()}
+        ioc_list = read_list(ei.get_outbound_ioc_values(
+            on_demand=True,
+            request_args=request_args,
+            last_update_data=last_update_data
+        ))
+        assert ioc_list == '\n'.join(ioc['value'] for ioc in iocs_json if ioc.get('value'))
+        assert find_indicators.call_count == 1
 
     def test_get_outbound_ioc_values_2(self, mocker):
         """Test update by not on_demand with no refresh"""
-        import CommonServerPython as CSP
-        mocker.patch.object(CSP, 'parse_date_range', return_value=(1578383899, 1578383899))
         import ExportIndicators as ei
-        with open('ExportIndicators_test/TestHelperFunctions/iocs_cache_values_text.json', 'r') as iocs_text_values_f:
-            iocs_text_dict = json.loads(iocs_text_values_f.read())
-            mocker.patch.object(demisto, 'getIntegrationContext', return_value={"last_output": iocs_text_dict})
-            mocker.patch.object(ei, 'refresh_outbound_context', return_value=iocs_text_dict)
-            mocker.patch.object(demisto, 'getLastRun', return_value={'last_run': 1578383898000})
-            request_args = ei.RequestArguments(query='', out_format='text', limit=50, offset=0)
-            ioc_list = ei.get_outbound_ioc_values(
+        mock_cache(mocker)
+        mocker.patch.object(ei, 'parse_date_range', return_value=(0, 0))
+        refresh_outbound_context = mocker.patch.object(ei, 'refresh_outbound_context',
+                                                       side_effect=['1.1.1.1\n2.2.2.2', '3.3.3.3'])
+        request_args = ei.RequestArguments(query='', out_format='text', limit=50, offset=0)
+        for _ in range(2):
+            ioc_list = read_list(ei.get_outbound_ioc_values(
                 on_demand=False,
                 request_args=request_args,
                 cache_refresh_rate='1 minute'
-            )
-            for ioc_row in ioc_list:
-                assert ioc_row in iocs_text_dict
+            ))
+            assert ioc_list == '1.1.1.1\n2.2.2.2'
+        assert refresh_outbound_context.call_count == 1
 
     def test_get_outbound_ioc_values_3(self, mocker):
         """Test update by not on_demand with refresh"""
-        import CommonServerPython as CSP
-        mocker.patch.object(CSP, 'parse_date_range', return_value=(1578383898, 1578383898))
         import ExportIndicators as ei
-        with open('ExportIndicators_test/TestHelperFunctions/iocs_cache_values_text.json', 'r') as iocs_text_values_f:
-            iocs_text_dict = json.loads(iocs_text_values_f.read())
-            mocker.patch.object(demisto, 'getIntegrationContext', return_value={"last_output": iocs_text_dict})
-            mocker.patch.object(ei, 'refresh_outbound_context', return_value=iocs_text_dict)
-            mocker.patch.object(demisto, 'getLastRun', return_value={'last_run': 1578383898000})
-            request_args = ei.RequestArguments(query='', out_format='text', limit=50, offset=0)
-            ioc_list = ei.get_outbound_ioc_values(
-                on_demand=False,
-                request_args=request_args,
-                cache_refresh_rate='1 minute'
-            )
-            for ioc_row in ioc_list:
-                assert ioc_row in iocs_text_dict
-
-    def test_get_outbound_ioc_values_4(self, mocker):
-        """Test update by request params change - limit"""
-        import CommonServerPython as CSP
-        mocker.patch.object(CSP, 'parse_date_range', return_value=(1578383898, 1578383898))
+        mock_cache(mocker)
+        parse_date_range = mocker.patch.object(ei, 'parse_date_range', return_value=(0, 0))
+        mocker.patch.object(ei, 'refresh_outbound_context', side_effect=['1.1.1.1\n2.2.2.2', '3.3.3.3'])
+        request_args = ei.RequestArguments(query='', out_format='text', limit=50, offset=0)
+        assert read_list(ei.get_outbound_ioc_values(on_demand=False, request_args=request_args,
+                                                    cache_refresh_rate='1 minute')) == '1.1.1.1\n2.2.2.2'
+        parse_date_range.return_value = (date_to_timestamp(datetime.now()) + 1, 0)
+        assert read_list(ei.get_outbound_ioc_values(on_demand=False, request_args=request_args,
+                                                    cache_refresh_rate='1 minute')) == '3.3.3.3'
+
+    @pytest.mark.parametrize('changed_args', [{'limit': 1}, {'offset': 1}, {'query': 'type:URL'},
+                                              {'out_format': 'csv'}])
+    def test_get_outbound_ioc_values_4(self, mocker, changed_args):
+        """Test update by request params change - limit, offset, query and format"""
         import ExportIndicators as ei
-        with open('ExportIndicators_test/TestHelperFunctions/iocs_cache_values_text.json', 'r') as iocs_text_values_f:
-            iocs_text_dict = json.loads(iocs_text_values_f.read())
-            mocker.patch.object(demisto, 'getIntegrationContext', return_value={"last_output": iocs_text_dict,
-                                                                                "last_limit": 1, "last_offset": 0,
-                                                                                "last_query": "type:ip",
-                                                                                "last_format": "text"})
-            mocker.patch.object(ei, 'refresh_outbound_context', return_value=iocs_text_dict)
-            mocker.patch.object(demisto, 'getLastRun', return_value={'last_run': 1578383898000})
-            request_args = ei.RequestArguments(query='type:ip', out_format='text', limit=50, offset=0)
-            ioc_list = ei.get_outbound_ioc_values(
-                on_demand=False,
-                request_args=request_args,
-                cache_refresh_rate='1 minute'
-            )
-            for ioc_row in ioc_list:
-                assert ioc_row in iocs_text_dict
-
-    def test_get_outbound_ioc_values_5(self, mocker):
-        """Test update by request params change - offset"""
-        import CommonServerPython as CSP
-        mocker.patch.object(CSP, 'parse_date_range', return_value=(1578383898, 1578383898))
+        mock_cache(mocker)
+        mocker.patch.object(ei, 'parse_date_range', return_value=(0, 0))
+        refresh_outbound_context = mocker.patch.object(ei, 'refresh_outbound_context',
+                                                       side_effect=['1.1.1.1\n2.2.2.2', '3.3.3.3'])
+        request_args = {'query': 'type:ip', 'out_format': 'text', 'limit': 50, 'offset': 0}
+        assert read_list(ei.get_outbound_ioc_values(on_demand=False, request_args=ei.RequestArguments(**request_args),
+                                                    cache_refresh_rate='1 minute')) == '1.1.1.1\n2.2.2.2'
+        changed_request_args = ei.RequestArguments(**{**request_args, **changed_args})
+        assert read_list(ei.get_outbound_ioc_values(on_demand=False, request_args=changed_request_args,
+                                                    cache_refresh_rate='1 minute')) == '3.3.3.3'
+        # both lists are kept
+        assert read_list(ei.get_outbound_ioc_values(on_demand=False, request_args=ei.RequestArguments(**request_args),
+                                                    cache_refresh_rate='1 minute')) == '1.1.1.1\n2.2.2.2'
+        assert refresh_outbound_context.call_count == 2
+
+    def test_get_outbound_ioc_values_on_demand_formats(self, mocker):
+        """
+        Test the on-demand IoCs are searched once per update by the server, and served in any format
+        Given:
+            - An on-demand update of the list in text format
+        When:
+            - requesting the list in text, csv and json-seq formats, and after another update
+        Then:
+            - search the IoCs once per update, and format them by the request format
+            - keep only the update request arguments and time in the integration context
+        """
         import ExportIndicators as ei
-        with open('ExportIndicators_test/TestHelperFunctions/iocs_cache_values_text.json', 'r') as iocs_text_values_f:
-            iocs_text_dict = json.loads(iocs_text_values_f.read())
-            mocker.patch.object(demisto, 'getIntegrationContext', return_value={"last_output": iocs_text_dict,
-                                                                                "last_limit": 50, "last_offset": 1,
-                                                                                "last_query": "type:ip",
-                                                                                "last_format": "text"})
-            mocker.patch.object(ei, 'refresh_outbound_context', return_value=iocs_text_dict)
-            mocker.patch.object(demisto, 'getLastRun', return_value={'last_run': 1578383898000})
-            request_args = ei.RequestArguments(query='type:ip', out_format='text', limit=50, offset=0)
-            ioc_list = ei.get_outbound_ioc_values(
-                on_demand=False,
-                request_args=request_args,
-                cache_refresh_rate='1 minute'
-            )
-            for ioc_row in ioc_list:
-                assert ioc_row in iocs_text_dict
-
-    def test_get_outbound_ioc_values_6(self, mocker):
-        """Test update by request params change - query"""
-        import CommonServerPython as CSP
-        mocker.patch.object(CSP, 'parse_date_range', return_value=(1578383898, 1578383898))
+        mock_cache(mocker)
+        with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
+            iocs_json = json.loads(iocs_json_f.read())
+        find_indicators = mocker.patch.object(ei, 'iter_indicators', return_value=iocs_json)
+        set_integration_context = mocker.patch.object(ei, 'set_integration_context')
+        request_args = ei.RequestArguments(query='', out_format='text', limit=50, offset=0)
+        update_values = ei.refresh_outbound_context(request_args, on_demand=True)
+        last_update_data = set_integration_context.call_args[0][0]
+        assert set(last_update_data) == {'last_run', *request_args.to_context_json()}
+        assert find_indicators.call_count == 1
+
+        text_list = read_list(ei.get_outbound_ioc_values(on_demand=True, request_args=request_args,
+                                                         last_update_data=last_update_data))
+        assert text_list == update_values == '\n'.join(ioc['value'] for ioc in iocs_json if ioc.get('value'))
+        assert find_indicators.call_count == 2
+
+        for out_format in ['csv', 'json-seq', 'text']:
+            format_request_args = ei.RequestArguments(query='', out_format=out_format, limit=50, offset=0)
+            format_list = read_list(ei.get_outbound_ioc_values(on_demand=True, request_args=format_request_args,
+                                                               last_update_data=last_update_data))
+            expected_list, _ = ei.create_values_for_returned_dict(copy.deepcopy(iocs_json), format_request_args)
+            assert format_list == expected_list[ei.CTX_VALUES_KEY]
+        assert find_indicators.call_count == 2
+
+        # the lists of the update are cached, so requesting them again does not read the IoCs of the update
+        get_on_demand_iocs = mocker.spy(ei, 'get_on_demand_iocs')
+        ei.get_outbound_ioc_values(on_demand=True, request_args=request_args, last_update_data=last_update_data)
+        assert get_on_demand_iocs.call_count == 0
+
+        find_indicators.return_value = iocs_json[:1]
+        next_update_data = {**last_update_data, 'last_run': last_update_data['last_run'] + 1}
+        next_list = read_list(ei.get_outbound_ioc_values(on_demand=True, request_args=request_args,
+                                                         last_update_data=next_update_data))
+        assert next_list == iocs_json[0]['value']
+        assert find_indicators.call_count == 3
+
+    def test_get_outbound_ioc_values_on_demand_offset(self, mocker):
+        """
+        Test the on-demand IoCs of an update with an offset are served as the update found them
+        Given:
+            - An on-demand update of the list with an offset
+        When:
+            - requesting the list with the update arguments
+        Then:
+            - serve the update list, without applying the offset again
+        """
         import ExportIndicators as ei
-        with open('ExportIndicators_test/TestHelperFunctions/iocs_cache_values_text.json', 'r') as iocs_text_values_f:
-            iocs_text_dict = json.loads(iocs_text_values_f.read())
-            mocker.patch.object(demisto, 'getIntegrationContext', return_value={"last_output": iocs_text_dict,
-                                                                                "last_limit": 50, "last_offset": 0,
-                                                                                "last_query": "type:URL",
-                                                                                "last_format": "text"})
-            mocker.patch.object(ei, 'refresh_outbound_context', return_value=iocs_text_dict)
-            mocker.patch.object(demisto, 'getLastRun', return_value={'last_run': 1578383898000})
-            request_args = ei.RequestArguments(query='type:ip', out_format='text', limit=50, offset=0)
-            ioc_list = ei.get_outbound_ioc_values(
-                on_demand=False,
-                request_args=request_args,
-                cache_refresh_rate='1 minute'
-            )
-            for ioc_row in ioc_list:
-                assert ioc_row in iocs_text_dict
+        mock_cache(mocker)
+        iocs = [{'value': f'1.1.1.{i}', 'indicator_type': 'IP'} for i in range(6)]
+        mocker.patch.object(ei, 'iter_indicators', return_value=iocs)
+        set_integration_context = mocker.patch.object(ei, 'set_integration_context')
+        request_args = ei.RequestArguments(query='', out_format='text', limit=3, offset=2)
+        ei.refresh_outbound_context(request_args, on_demand=True)
+        list_info = ei.get_outbound_ioc_values(on_demand=True, request_args=request_args,
+                                               last_update_data=set_integration_context.call_args[0][0])
+        assert read_list(list_info) == '1.1.1.2\n1.1.1.3\n1.1.1.4'
 
     def test_list_to_str_1(self):
         """Test invalid"""
@@ -180,7 +219,7 @@ class TestHelperFunctions:
         import ExportIndicators as ei
         with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
             iocs_json = json.loads(iocs_json_f.read())
-            mocker.patch.object(ei, 'find_indicators_with_limit', return_value=iocs_json)
+            mocker.patch.object(ei, 'iter_indicators', return_value=iocs_json)
             request_args = ei.RequestArguments(query='', out_format='text', limit=38)
             ei_vals = ei.refresh_outbound_context(request_args)
             for ioc in iocs_json:
@@ -188,12 +227,34 @@ class TestHelperFunctions:
                 if ip:
                     assert ip in ei_vals
 
+    def test_refresh_outbound_context_on_demand(self, mocker):
+        """
+        Test an on-demand update keeps only small metadata in the integration context
+        Given:
+            - IoCs found by the query of the update
+        When:
+            - updating the list on demand
+        Then:
+            - return the formatted IoCs
+            - keep only the update time and request arguments in the integration context, without the IoCs
+        """
+        import ExportIndicators as ei
+        with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
+            iocs_json = json.loads(iocs_json_f.read())
+        mocker.patch.object(ei, 'iter_indicators', return_value=iocs_json)
+        set_integration_context = mocker.patch.object(ei, 'set_integration_context')
+        request_args = ei.RequestArguments(query='', out_format='text', limit=38)
+        ei_vals = ei.refresh_outbound_context(request_args, on_demand=True)
+        assert ei_vals == '\n'.join(ioc['value'] for ioc in iocs_json if ioc.get('value'))
+        context = set_integration_context.call_args[0][0]
+        assert context == {'last_run': context['last_run'], **request_args.to_context_json()}
+
     def test_refresh_outbound_context_2(self, mocker):
         """Test out_format= XSOAR json"""
         import ExportIndicators as ei
         with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
             iocs_json = json.loads(iocs_json_f.read())
-            mocker.patch.object(ei, 'find_indicators_with_limit', return_value=iocs_json)
+            mocker.patch.object(ei, 'iter_indicators', return_value=iocs_json)
             request_args = ei.RequestArguments(query='', out_format='XSOAR json', limit=39)
             ei_vals = ei.refresh_outbound_context(request_args)
             assert isinstance(ei_vals, str)
@@ -205,7 +266,7 @@ class TestHelperFunctions:
         import ExportIndicators as ei
         with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
             iocs_json = json.loads(iocs_json_f.read())
-            mocker.patch.object(ei, 'find_indicators_with_limit', return_value=iocs_json)
+            mocker.patch.object(ei, 'iter_indicators', return_value=iocs_json)
             request_args = ei.RequestArguments(query='', out_format='XSOAR csv', limit=38)
             ei_vals = ei.refresh_outbound_context(request_args)
             with open('ExportIndicators_test/TestHelperFunctions/iocs_out_csv.txt', 'r') as iocs_out_f:
@@ -218,7 +279,7 @@ class TestHelperFunctions:
         import ExportIndicators as ei
         with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
             iocs_json = json.loads(iocs_json_f.read())
-            mocker.patch.object(ei, 'find_indicators_with_limit', return_value=iocs_json)
+            mocker.patch.object(ei, 'iter_indicators', return_value=iocs_json)
             request_args = ei.RequestArguments(query='', out_format='XSOAR json-seq', limit=38)
             ei_vals = ei.refresh_outbound_context(request_args)
             with open('ExportIndicators_test/TestHelperFunctions/iocs_out_json_seq.txt', 'r') as iocs_out_f:
@@ -230,7 +291,7 @@ class TestHelperFunctions:
         import ExportIndicators as ei
         with open('ExportIndicators_test/TestHelperFunctions/demisto_url_iocs.json', 'r') as iocs_json_f:
             iocs_json = json.loads(iocs_json_f.read())
-            mocker.patch.object(ei, 'find_indicators_with_limit', return_value=iocs_json)
+            mocker.patch.object(ei, 'iter_indicators', return_value=iocs_json)
             request_args = ei.RequestArguments(query='', out_format='json', limit=2)
             ei_vals = ei.refresh_outbound_context(request_args)
             ei_vals = json.loads(ei_vals)
@@ -243,7 +304,7 @@ class TestHelperFunctions:
         import ExportIndicators as ei
         with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
             iocs_json = json.loads(iocs_json_f.read())
-            mocker.patch.object(ei, 'find_indicators_with_limit', return_value=iocs_json)
+            mocker.patch.object(ei, 'iter_indicators', return_value=iocs_json)
             request_args = ei.RequestArguments(query='', out_format='json-seq', limit=38)
             ei_vals = ei.refresh_outbound_context(request_args)
             with open('ExportIndicators_test/TestHelperFunctions/iocs_out_json_seq_old.txt', 'r') as iocs_out_f:
@@ -256,7 +317,7 @@ class TestHelperFunctions:
         import ExportIndicators as ei
         with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
             iocs_json = json.loads(iocs_json_f.read())
-            mocker.patch.object(ei, 'find_indicators_with_limit', return_value=iocs_json)
+            mocker.patch.object(ei, 'iter_indicators', return_value=iocs_json)
             request_args = ei.RequestArguments(query='', out_format='csv', limit=38)
             ei_vals = ei.refresh_outbound_context(request_args)
             with open('ExportIndicators_test/TestHelperFunctions/iocs_out_csv_old.txt', 'r') as iocs_out_f:
@@ -264,8 +325,8 @@ class TestHelperFunctions:
                 for ioc in iocs_out.split('\n'):
                     assert ioc in ei_vals
 
-    def test_find_indicators_with_limit_1(self, mocker):
-        """Test find indicators limit"""
+    def test_iter_indicators(self, mocker):
+        """Test iterating the indicators of the searched pages"""
         import ExportIndicators as ei
         with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
             iocs_json = json.loads(iocs_json_f.read())
@@ -275,7 +336,7 @@ class TestHelperFunctions:
                 limit=limit
             )
             mocker.patch.object(indicator_searcher, 'search_indicators_by_version', side_effect=indicator_searcher_res)
-            ei_vals = ei.find_indicators_with_limit(indicator_searcher)
+            ei_vals = list(ei.iter_indicators(indicator_searcher))
             assert len(ei_vals) == limit
 
     def test_create_values_for_returned_dict_1(self):
@@ -501,11 +562,17 @@ class TestHelperFunctions:
         assert "2.2.2.2" in ip_range_list
         assert "25.24.23.22" in ip_range_list
 
-    def test_empty_integartion_context_mimtype(self, mocker):
-        from ExportIndicators import get_outbound_mimetype
-        mocker.patch.object(demisto, 'getIntegrationContext', return_value={})
-        mimtype = get_outbound_mimetype()
-        assert mimtype == 'text/plain'
+    @pytest.mark.parametrize('out_format, csv_text, expected_mimetype', [
+        ('text', False, 'text/plain'),
+        ('json', False, 'application/json'),
+        ('csv', False, 'text/csv'),
+        ('csv', True, 'text/plain'),
+        ('XSOAR json-seq', False, 'application/json-seq'),
+    ])
+    def test_get_outbound_mimetype(self, out_format, csv_text, expected_mimetype):
+        from ExportIndicators import get_outbound_mimetype, RequestArguments
+        request_args = RequestArguments(query='', out_format=out_format, csv_text=csv_text)
+        assert get_outbound_mimetype(request_args) == expected_mimetype
 
     @pytest.mark.parametrize('sort_field, sort_order, expected_first_result', [
         ('lastSeen', 'asc', '200.77.186.170'),
@@ -517,7 +584,7 @@ class TestHelperFunctions:
         from ExportIndicators import refresh_outbound_context, RequestArguments
         with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
             iocs_json = json.loads(iocs_json_f.read())
-            mocker.patch.object(ei, 'find_indicators_with_limit', side_effect=[iocs_json, []])
+            mocker.patch.object(ei, 'iter_indicators', return_value=iocs_json)
             request_args = RequestArguments(query='', out_format='text', sort_field=sort_field, sort_order=sort_order)
             ei_vals = refresh_outbound_context(request_args)
 
@@ -529,7 +596,7 @@ class TestHelperFunctions:
         from ExportIndicators import refresh_outbound_context, RequestArguments
         with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
             iocs_json = json.loads(iocs_json_f.read())
-            mocker.patch.object(ei, 'find_indicators_with_limit', side_effect=[iocs_json, []])
+            mocker.patch.object(ei, 'iter_indicators', return_value=iocs_json)
             request_args = RequestArguments(query='', out_format='text', sort_field='lastSeen',
                                             sort_order='invalid_sort_order')
             ei_vals = refresh_outbound_context(request_args)
@@ -542,7 +609,7 @@ class TestHelperFunctions:
         from ExportIndicators import refresh_outbound_context, RequestArguments
         with open('ExportIndicators_test/TestHelperFunctions/demisto_iocs.json', 'r') as iocs_json_f:
             iocs_json = json.loads(iocs_json_f.read())
-            mocker.patch.object(ei, 'find_indicators_with_limit', side_effect=[iocs_json, []])
+            mocker.patch.object(ei, 'iter_indicators', return_value=iocs_json)
             request_args = RequestArguments(query='', out_format='text', sort_field='invalid_field_name',
                                             sort_order='asc')
             mocker.patch.object(demisto, 'debug')
@@ -551,3 +618,146 @@ class TestHelperFunctions:
             debug_list = [call[0][0] for call in demisto.debug.call_args_list]
             assert 'ExportIndicators - Could not sort IoCs, please verify that you entered the correct field name.\n' \
                    'Field used: invalid_field_name' in debug_list
+
+    @pytest.mark.parametrize('sort_order, reverse', [('asc', False), ('desc', True)])
+    def test_find_outbound_iocs__sorts_all_pages(self, mocker, sort_order, reverse):
+        """
+        Given:
+            - IoCs searched in several pages, out of the search order of the sort field
+        When:
+            - requesting a sorted list with an offset and a limit
+        Then:
+            - search the pages once, and return the IoCs of the window of all the sorted IoCs
+        """
+        import ExportIndicators as ei
+        iocs = [{'value': f'{i}.com', 'indicator_type': 'Domain', 'score': (i * 37) % 1000} for i in range(1000)]
+        search_indicators = mocker.patch.object(demisto, 'searchIndicators', side_effect=[
+            {'iocs': iocs[i:i + ei.PAGE_SIZE], 'total': len(iocs)} for i in range(0, len(iocs), ei.PAGE_SIZE)
+        ] + [{'iocs': [], 'total': len(iocs)}])
+        request_args = ei.RequestArguments(query='', out_format='text', limit=20, offset=10,
+                                           sort_field='score', sort_order=sort_order)
+        iocs_list, out_dict = ei.find_outbound_iocs(request_args)
+
+        expected_iocs = sorted(iocs, key=lambda ioc: ioc['score'], reverse=reverse)[10:30]
+        assert iocs_list == expected_iocs
+        assert out_dict[ei.CTX_VALUES_KEY] == '\n'.join(ioc['value'] for ioc in expected_iocs)
+        assert search_indicators.call_count == len(iocs) // ei.PAGE_SIZE
+
+    def test_find_outbound_iocs__dropped_iocs(self, mocker):
+        """
+        Given:
+            - URLs with ports, which the panosurl format drops, and a wildcard domain which adds two entries
+        When:
+            - requesting a panosurl list with a limit
+        Then:
+            - take IoCs past the dropped ones until the list holds the limit, and stop searching
+        """
+        import ExportIndicators as ei
+        iocs = [{'value': 'https://a.com:8080/path', 'indicator_type': 'URL'},
+                {'value': '*.b.com', 'indicator_type': 'DomainGlob'},
+                {'value': 'c.com:443', 'indicator_type': 'Domain'},
+                {'value': 'd.com', 'indicator_type': 'Domain'},
+                {'value': 'e.com', 'indicator_type': 'Domain'},
+                {'value': 'f.com', 'indicator_type': 'Domain'}]
+        iter_indicators = mocker.patch.object(ei, 'iter_indicators', return_value=iter(iocs))
+        request_args = ei.RequestArguments(query='', out_format=ei.FORMAT_PANOSURL, limit=3, offset=0)
+        iocs_list, out_dict = ei.find_outbound_iocs(request_args)
+
+        assert iocs_list == iocs[:4]
+        assert out_dict[ei.CTX_VALUES_KEY] == 'b.com\n*.b.com\nd.com'
+        assert next(iter_indicators.return_value) == iocs[4]
+
+    @pytest.mark.parametrize('collapse_ips, expected_values', [
+        ('Don\'t Collapse', '1.1.1.0\n1.1.1.1\n1.1.1.2'),
+        ('To CIDRs', 'a.com\n1.1.1.0/31\n1.1.1.2'),
+        ('To Ranges', 'a.com\n1.1.1.0-1.1.1.5'),
+    ])
+    def test_find_outbound_iocs__collapsed_ips(self, mocker, collapse_ips, expected_values):
+        """
+        Given:
+            - consecutive IPs, which are collapsed to fewer entries
+        When:
+            - requesting a text list with a limit, with and without collapsing the IPs
+        Then:
+            - take IoCs until the collapsed list holds the limit
+        """
+        import ExportIndicators as ei
+        iocs = [{'value': f'1.1.1.{i}', 'indicator_type': 'IP'} for i in range(6)]
+        iocs.insert(3, {'value': 'a.com', 'indicator_type': 'Domain'})
+        mocker.patch.object(ei, 'iter_indicators', return_value=iocs)
+        request_args = ei.RequestArguments(query='', out_format='text', limit=3, offset=0, collapse_ips=collapse_ips)
+        _, out_dict = ei.find_outbound_iocs(request_args)
+
+        assert out_dict[ei.CTX_VALUES_KEY] == expected_values
+
+    @pytest.mark.parametrize('prepend_string, append_string, expected_list, expected_size', [
+        ('# list', '\\n# end', b'# list\n1.1.1.1\n2.2.2.2\n# end', '4'),
+        ('', '', b'1.1.1.1\n2.2.2.2', '2'),
+    ])
+    def test_route_list_values__streams_list(self, mocker, prepend_string, append_string, expected_list, expected_size):
+        """
+        Test route_list_values streams the cached list file with the strings to add around it
+        Given:
+            - A cached list, with and without prepend and append strings
+        When:
+            - requesting the list
+        Then:
+            - respond with the prepend string, the values and the append string
+            - respond with the ETag, size and length of the list, built of the info kept with the cached list
+        """
+        import hashlib
+        import ExportIndicators as ei
+        mock_cache(mocker)
+        mocker.patch.object(demisto, 'params', return_value={'cache_refresh_rate': '1 minute', 'format': 'text',
+                                                             'indicators_query': 'type:IP',
+                                                             'prepend_string': prepend_string,
+                                                             'append_string': append_string})
+        mocker.patch.object(ei, 'STREAM_CHUNK_SIZE', 4)
+        list_info = ei.get_cached_values('list', lambda: '1.1.1.1\n2.2.2.2')
+        assert list_info['etag'] == '"{}"'.format(hashlib.sha1(b'1.1.1.1\n2.2.2.2').hexdigest())
+        assert list_info['length'] == 15
+        mocker.patch.object(ei, 'get_outbound_ioc_values', return_value=list_info)
+        mocker.patch.object(ei, 'get_integration_context', return_value={})
+        with ei.APP.test_client() as client:
+            response = client.get('/')
+        assert response.status_code == 200
+        assert response.data == expected_list
+        assert response.headers['X-ExportIndicators-Size'] == expected_size
+        assert response.headers['Content-Length'] == str(len(expected_list))
+        if prepend_string:
+            parts_etags = [ei.get_list_part_info([part])['etag'] for part in [b'# list\n', b'\n# end']]
+            parts_etags.insert(1, list_info['etag'])
+            expected_etag = ei.get_list_part_info(etag.encode() for etag in parts_etags)['etag']
+        else:
+            expected_etag = list_info['etag']
+        assert response.headers['ETag'] == expected_etag
+
+    @pytest.mark.parametrize('on_demand, values, expected_list', [
+        (True, None, b'You are running in On-Demand mode - please run !eis-update command to initialize the '
+                     b'export process'),
+        (False, '', b'No Results Found For the Query'),
+    ])
+    def test_route_list_values__no_values(self, mocker, on_demand, values, expected_list):
+        """
+        Test route_list_values responds with a message when there are no values to stream
+        Given:
+            - An on-demand list which was not updated, or an empty list
+        When:
+            - requesting the list
+        Then:
+            - respond with the matching message, its ETag and length
+        """
+        import hashlib
+        import ExportIndicators as ei
+        mock_cache(mocker)
+        mocker.patch.object(demisto, 'params', return_value={'cache_refresh_rate': '1 minute', 'format': 'text',
+                                                             'indicators_query': 'type:IP', 'on_demand': on_demand})
+        list_info = ei.get_cached_values('list', lambda: values) if values is not None else None
+        mocker.patch.object(ei, 'get_outbound_ioc_values', return_value=list_info)
+        mocker.patch.object(ei, 'get_integration_context', return_value={})
+        with ei.APP.test_client() as client:
+            response = client.get('/')
+        assert response.status_code == 200
+        assert response.data == expected_list
+        assert response.headers['ETag'] == '"{}"'.format(hashlib.sha1(expected_list).hexdigest())
+        assert response.headers['Content-Length'] == str(len(expected_list))
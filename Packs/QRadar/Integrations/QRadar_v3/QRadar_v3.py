@@ -29,6 +29,7 @@ RULES_ENRCH_FLG = 'true'  # when set to true, will try to enrich offense with ru
 MAX_FETCH_EVENT_RETIRES = 3  # max iteration to try search the events of an offense
 SLEEP_FETCH_EVENT_RETIRES = 10  # sleep between iteration to try search the events of an offense
 MAX_NUMBER_OF_OFFENSES_TO_CHECK_SEARCH = 5  # Number of offenses to check during mirroring if search was completed.
+ENRICHMENT_CACHE_TTL_SECS = 60 * 60  # time to keep offense types, closing reasons, rules and domains names
 
 ADVANCED_PARAMETERS_STRING_NAMES = [
     'DOMAIN_ENRCH_FLG',
@@ -44,7 +45,8 @@ ADVANCED_PARAMETER_INT_NAMES = [
     'LOCK_WAIT_TIME',
     'MAX_WORKERS',
     'MAX_FETCH_EVENT_RETIRES',
-    'SLEEP_FETCH_EVENT_RETIRES'
+    'SLEEP_FETCH_EVENT_RETIRES',
+    'ENRICHMENT_CACHE_TTL_SECS'
 ]
 
 ''' CONSTANTS '''
@@ -70,11 +72,15 @@ MIRROR_DIRECTION: Dict[str, Optional[str]] = {
 MIRRORED_OFFENSES_CTX_KEY = 'mirrored_offenses'
 UPDATED_MIRRORED_OFFENSES_CTX_KEY = 'updated_mirrored_offenses'
 RESUBMITTED_MIRRORED_OFFENSES_CTX_KEY = 'resubmitted_mirrored_offenses'
+# Offenses of these lists are kept one per context key, '<list key>_<offense id>', ordered by '<list key>_ids'
+MIRRORED_OFFENSES_LISTS_CTX_KEYS = (MIRRORED_OFFENSES_CTX_KEY, UPDATED_MIRRORED_OFFENSES_CTX_KEY)
 UTC_TIMEZONE = pytz.timezone('utc')
 ID_QUERY_REGEX = re.compile(r'(?:\s+|^)id((\s)*)>(=?)((\s)*)((\d)+)(?:\s+|$)')
 ASCENDING_ID_ORDER = '+id'
 EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS)
 lock = Lock()
+# {cache_name: {id: (expiry_time, name)}}, kept across the fetch cycles of the long running execution
+ENRICHMENT_CACHES: Dict[str, Dict[Any, Tuple[float, Any]]] = {}
 
 ''' OUTPUT FIELDS REPLACEMENT MAPS '''
 OFFENSE_OLD_NEW_NAMES_MAP = {
@@ -665,6 +671,7 @@ class Client(BaseClient):
 
 def safely_update_context_data(func: Callable):
     """Decorator for updating context data using versions.
+    Only the context keys changed by func are set, on top of the latest integration context.
     In case of a race condition, preform func with the new context_data and try updating again.
 
     Args:
@@ -674,37 +681,31 @@ def safely_update_context_data(func: Callable):
     raise DemistoException if reached maximum of retries.
     """
     def wrapper(*args, **kwargs):
-        context_was_set = False
-        retries = 0
+        if 'context_data' not in kwargs or 'version' not in kwargs:
+            raise ValueError('context_data and version must be in the func kwargs if '
+                             'safely_update_context_data decorator is used but were not found.')
         max_retries = 5
-        return_value = None
-        while not context_was_set and retries < max_retries:
-            context_data, version, return_value = func(*args, **kwargs)
+        for retries in range(max_retries):
+            new_context_data, version, return_value = func(*args, **kwargs)
             print_debug_msg(f'Attempting to update context data after version {version} with retry {retries}')
-            new_context_data, new_version = get_integration_context_with_version()
+            raw_context_data, new_version = get_integration_context_with_version()
             if new_version == version:
+                changes = get_context_data_changes(raw_context_data, kwargs['context_data'], new_context_data)
                 try:
-                    set_to_integration_context_with_retries(context_data, max_retry_times=1)
-                    context_was_set = True
-                    print_debug_msg(f'Updated integration context after version {version} in retry {retries}.')
-                except Exception as e:
-                    if 'Max retry attempts exceeded' in str(e):
-                        continue
-                    else:
-                        raise e
+                    set_integration_context(apply_context_data_changes(raw_context_data, changes), version=version)
+                    print_debug_msg(f'Updated {len(changes)} integration context keys after version {version} '
+                                    f'in retry {retries}.')
+                    return return_value
+                except ValueError as e:
+                    print_debug_msg(f'Could not update context data after version {version} in retry {retries}. '
+                                    f'Error was: {str(e)}')
+                    raw_context_data, new_version = get_integration_context_with_version()
             else:
-                if 'context_data' not in kwargs or 'version' not in kwargs:
-                    raise ValueError('context_data and version must be in the func kwargs if '
-                                     'safely_update_context_data decorator is used but were not found.')
-                else:
-                    kwargs['context_data'] = extract_context_data(new_context_data)
-                    kwargs['version'] = new_version
-                    print_debug_msg(f'Could not update context data after version {version} due to new '
-                                    f'version {new_version} in retry {retries}')
-                    retries = retries + 1
-        if retries == max_retries:
-            raise DemistoException(f'Reached maximum retries, could not update context data for function {func}.')
-        return return_value
+                print_debug_msg(f'Could not update context data after version {version} due to new '
+                                f'version {new_version} in retry {retries}')
+            kwargs['context_data'] = extract_context_data(raw_context_data, include_id=True)
+            kwargs['version'] = new_version
+        raise DemistoException(f'Reached maximum retries, could not update context data for function {func}.')
     return wrapper
 
 
@@ -810,6 +811,29 @@ def is_valid_ip(ip: str) -> bool:
         return False
 
 
+def get_cached_enrichment_names(cache_name: str, ids: Set, get_names: Callable[[Set], Dict]) -> Dict:
+    """
+    Receives IDs of QRadar objects, and returns their names from the enrichment cache. Only IDs which are not cached,
+    or were cached more than 'ENRICHMENT_CACHE_TTL_SECS' seconds ago, are requested from QRadar service.
+    Args:
+        cache_name (str): Name of the cache of the objects, e.g. 'rules'.
+        ids (Set): IDs of the objects.
+        get_names (Callable[[Set], Dict]): Function performing the API call to retrieve {id: name} of the IDs given.
+
+    Returns:
+        (Dict): Dictionary of {id: name}
+    """
+    cache = ENRICHMENT_CACHES.setdefault(cache_name, {})
+    now = time.time()
+    ids_to_get = {id_ for id_ in ids if id_ not in cache or cache[id_][0] <= now}
+    if ids_to_get:
+        for id_ in ids_to_get:
+            cache.pop(id_, None)
+        expiry_time = now + ENRICHMENT_CACHE_TTL_SECS
+        cache.update({id_: (expiry_time, name) for id_, name in get_names(ids_to_get).items()})
+    return {id_: cache[id_][1] for id_ in ids if id_ in cache}
+
+
 def get_offense_types(client: Client, offenses: List[Dict]) -> Dict:
     """
     Receives list of offenses, and performs API call to QRadar service to retrieve the offense type names
@@ -824,9 +848,12 @@ def get_offense_types(client: Client, offenses: List[Dict]) -> Dict:
     offense_types_ids = {offense.get('offense_type') for offense in offenses if offense.get('offense_type') is not None}
     if not offense_types_ids:
         return dict()
-    offense_types = client.offense_types(filter_=f'''id in ({','.join(map(str, offense_types_ids))})''',
-                                         fields='id,name')
-    return {offense_type.get('id'): offense_type.get('name') for offense_type in offense_types}
+
+    def get_offense_types_names(ids: Set) -> Dict:
+        offense_types = client.offense_types(filter_=f'''id in ({','.join(map(str, ids))})''', fields='id,name')
+        return {offense_type.get('id'): offense_type.get('name') for offense_type in offense_types}
+
+    return get_cached_enrichment_names('offense_types', offense_types_ids, get_offense_types_names)
 
 
 def get_offense_closing_reasons(client: Client, offenses: List[Dict]) -> Dict:
@@ -844,9 +871,12 @@ def get_offense_closing_reasons(client: Client, offenses: List[Dict]) -> Dict:
                           if offense.get('closing_reason_id') is not None}
     if not closing_reason_ids:
         return dict()
-    closing_reasons = client.closing_reasons_list(filter_=f'''id in ({','.join(map(str, closing_reason_ids))})''',
-                                                  fields='id,text')
-    return {closing_reason.get('id'): closing_reason.get('text') for closing_reason in closing_reasons}
+
+    def get_closing_reasons_names(ids: Set) -> Dict:
+        closing_reasons = client.closing_reasons_list(filter_=f'''id in ({','.join(map(str, ids))})''', fields='id,text')
+        return {closing_reason.get('id'): closing_reason.get('text') for closing_reason in closing_reasons}
+
+    return get_cached_enrichment_names('closing_reasons', closing_reason_ids, get_closing_reasons_names)
 
 
 def get_domain_names(client: Client, outputs: List[Dict]) -> Dict:
@@ -863,8 +893,12 @@ def get_domain_names(client: Client, outputs: List[Dict]) -> Dict:
     domain_ids = {offense.get('domain_id') for offense in outputs if offense.get('domain_id') is not None}
     if not domain_ids:
         return dict()
-    domains_info = client.domains_list(filter_=f'''id in ({','.join(map(str, domain_ids))})''', fields='id,name')
-    return {domain_info.get('id'): domain_info.get('name') for domain_info in domains_info}
+
+    def get_domains_names(ids: Set) -> Dict:
+        domains_info = client.domains_list(filter_=f'''id in ({','.join(map(str, ids))})''', fields='id,name')
+        return {domain_info.get('id'): domain_info.get('name') for domain_info in domains_info}
+
+    return get_cached_enrichment_names('domains', domain_ids, get_domains_names)
 
 
 def get_rules_names(client: Client, offenses: List[Dict]) -> Dict:
@@ -881,8 +915,12 @@ def get_rules_names(client: Client, offenses: List[Dict]) -> Dict:
     rules_ids = {rule.get('id') for offense in offenses for rule in offense.get('rules', [])}
     if not rules_ids:
         return dict()
-    rules = client.rules_list(None, None, f'''id in ({','.join(map(str, rules_ids))})''', 'id,name')
-    return {rule.get('id'): rule.get('name') for rule in rules}
+
+    def get_rules_names_by_ids(ids: Set) -> Dict:
+        rules = client.rules_list(None, None, f'''id in ({','.join(map(str, ids))})''', 'id,name')
+        return {rule.get('id'): rule.get('name') for rule in rules}
+
+    return get_cached_enrichment_names('rules', rules_ids, get_rules_names_by_ids)
 
 
 def get_offense_addresses(client: Client, offenses: List[Dict], is_destination_addresses: bool) -> Dict:
@@ -1204,6 +1242,23 @@ def print_debug_msg(msg: str):
             lock.release()
 
 
+@safely_update_context_data
+def clear_mirrored_offenses(context_data: dict, version: Any) -> Tuple[dict, Any, dict]:
+    """Remove all the offenses from the mirroring with events context data lists.
+
+    Args:
+        context_data: The context data to update.
+        version: The version of the context data to update.
+
+    Returns: (The new context data, The context_data version the change was based on, The new context_data)
+    """
+    new_context_data = context_data.copy()
+    new_context_data.update({UPDATED_MIRRORED_OFFENSES_CTX_KEY: [],
+                             MIRRORED_OFFENSES_CTX_KEY: [],
+                             RESUBMITTED_MIRRORED_OFFENSES_CTX_KEY: []})
+    return new_context_data, version, new_context_data
+
+
 def reset_mirroring_events_variables(mirror_options: str):
     """In case of change in mirror_options initialize mirror with events context data variables.
 
@@ -1212,7 +1267,8 @@ def reset_mirroring_events_variables(mirror_options: str):
 
     Returns: None
     """
-    ctx = extract_context_data(get_integration_context().copy())
+    raw_ctx, ctx_version = get_integration_context_with_version()
+    ctx = extract_context_data(raw_ctx, include_id=True)
     try:
         print_mirror_events_stats(ctx, f"New Long Running Container - Before Mirroring Variables Reset, "
                                        f"Mirror Option {mirror_options}")
@@ -1222,12 +1278,9 @@ def reset_mirroring_events_variables(mirror_options: str):
         mirror_options = 'needs reset to mirroring vars'
 
     if mirror_options != MIRROR_OFFENSE_AND_EVENTS:
-        ctx[UPDATED_MIRRORED_OFFENSES_CTX_KEY] = []
-        ctx[MIRRORED_OFFENSES_CTX_KEY] = []
-        ctx[RESUBMITTED_MIRRORED_OFFENSES_CTX_KEY] = []
+        ctx = clear_mirrored_offenses(context_data=ctx, version=ctx_version)
 
     print_mirror_events_stats(ctx, "New Long Running Container - After Mirroring Variables Reset")
-    set_to_integration_context_with_retries(encode_context_data(ctx))
 
 
 def is_reset_triggered(handle_reset: bool = False):
@@ -1383,14 +1436,109 @@ def create_search_with_retry(client: Client, fetch_mode: str, offense: Dict, eve
     return None
 
 
+def poll_offense_search(client: Client, search_id: str, offense_id: int) -> Optional[List[Dict]]:
+    """
+    Polls QRadar service once for the status of the search ID given. If the status returned is within
+    'TERMINATING_SEARCH_STATUSES', performs a call to retrieve the events returned by the search.
+
+    Args:
+        client (Client): Client to perform the API calls.
+        search_id (str): ID of the search to poll for its status.
+        offense_id (int): ID of the offense to enrich with events returned by search. Used for logging purposes here.
+
+    Returns:
+        (List[Dict]): List of events returned by query, if the search was terminated.
+        None: If the search is still running.
+    """
+    search_status_response = client.search_status_get(search_id)
+    query_status = search_status_response.get('status')
+    if query_status not in TERMINATING_SEARCH_STATUSES:
+        return None
+    print_debug_msg(f'Getting events for offense {offense_id}')
+    search_results_response = client.search_results_get(search_id)
+    print_debug_msg(f'Http response: {search_results_response.get("http_response", "Not specified - ok")}')
+    events = search_results_response.get('events', [])
+    sanitized_events = sanitize_outputs(events)
+    print_debug_msg(f'Fetched {len(sanitized_events)} events for offense {offense_id}.')
+    return sanitized_events
+
+
+def poll_offenses_events_with_retry(client: Client, offenses_search_ids: Dict[int, str],
+                                    max_retries: int = EVENTS_FAILURE_LIMIT) -> Dict[int, Tuple[List[Dict], str]]:
+    """
+    Polls QRadar service for all the search IDs given until the status returned for each of them is within
+    'TERMINATING_SEARCH_STATUSES', and retrieves the events returned by each search.
+    The searches are polled together: in each round the statuses of all the running searches are requested
+    concurrently, followed by a single sleep, so polling lasts about as long as the slowest search.
+    Has retry mechanism, because QRadar service tends to return random errors when
+    it is loaded.
+    Therefore, 'max_retries' retries will be made for each search, to try avoid such cases as much as possible.
+
+    Args:
+        client (Client): Client to perform the API calls.
+        offenses_search_ids (Dict[int, str]): Dictionary of {offense_id: search_id} of the searches to poll.
+        max_retries (int): Number of retries.
+
+    Returns:
+        (Dict[int, Tuple[List[Dict], str]]): Dictionary of {offense_id: (events, failure_message)}. The events are an
+                                             empty list if number of retries exceeded limit, and the failure message
+                                             is given in case an error occurred.
+    """
+    results: Dict[int, Tuple[List[Dict], str]] = {}
+    num_of_failures = {offense_id: 0 for offense_id in offenses_search_ids}
+    failure_messages = {offense_id: '' for offense_id in offenses_search_ids}
+    running_searches = dict(offenses_search_ids)
+    start_time = time.time()
+    while running_searches:
+        if is_reset_triggered():
+            results.update({offense_id: ([], 'Reset was triggered for integration.') for offense_id in running_searches})
+            break
+        futures = {offense_id: EXECUTOR.submit(poll_offense_search, client, search_id, offense_id)
+                   for offense_id, search_id in running_searches.items()}
+        sleep_time = 0
+        for offense_id, future in futures.items():
+            search_id = running_searches[offense_id]
+            try:
+                events = future.result()
+                # failures are relevant only when consecutive
+                num_of_failures[offense_id] = 0
+                if events is None:
+                    sleep_time = max(sleep_time, EVENTS_INTERVAL_SECS)
+                else:
+                    results[offense_id] = events, failure_messages[offense_id]
+            except Exception as e:
+                print_debug_msg(
+                    f'Error while fetching offense {offense_id} events, search_id: {search_id}. Error details: {str(e)} \n'
+                    f'{traceback.format_exc()}')
+                num_of_failures[offense_id] += 1
+                if num_of_failures[offense_id] < max_retries:
+                    sleep_time = max(sleep_time, FAILURE_SLEEP)
+                else:
+                    failure_messages[offense_id] = f'{repr(e)} \nSee logs for further details.'
+                if num_of_failures[offense_id] > max_retries:
+                    print_debug_msg(f'Could not fetch events for offense ID: {offense_id}, returning empty events array.')
+                    results[offense_id] = [], failure_messages[offense_id]
+
+        running_searches = {offense_id: search_id for offense_id, search_id in running_searches.items()
+                            if offense_id not in results}
+        if not running_searches:
+            break
+        elapsed = time.time() - start_time
+        if elapsed >= FETCH_SLEEP:  # print status debug every fetch sleep (or after)
+            print_debug_msg(f'Still fetching events of {len(running_searches)} offenses, '
+                            f'search_ids: {list(running_searches.values())}.')
+            start_time = time.time()
+        time.sleep(sleep_time)
+
+    return results
+
+
 def poll_offense_events_with_retry(client: Client, search_id: str, offense_id: int,
                                    max_retries: int = EVENTS_FAILURE_LIMIT) -> Tuple[List[Dict], str]:
     """
     Polls QRadar service for search ID given until status returned is within 'TERMINATING_SEARCH_STATUSES'.
     Afterwards, performs a call to retrieve the events returned by the search.
-    Has retry mechanism, because QRadar service tends to return random errors when
-    it is loaded.
-    Therefore, 'max_retries' retries will be made, to try avoid such cases as much as possible.
+    See 'poll_offenses_events_with_retry'.
 
     Args:
         client (Client): Client to perform the API calls.
@@ -1402,54 +1550,21 @@ def poll_offense_events_with_retry(client: Client, search_id: str, offense_id: i
         (List[Dict], str): List of events returned by query. Returns empty list if number of retries exceeded limit,
                            A failure message in case an error occured.
     """
-    num_of_failures = 0
-    start_time = time.time()
-    failure_message = ''
-    while num_of_failures <= max_retries:
-        try:
-            if is_reset_triggered():
-                return [], 'Reset was triggered for integration.'
-            search_status_response = client.search_status_get(search_id)
-            query_status = search_status_response.get('status')
-            # failures are relevant only when consecutive
-            num_of_failures = 0
-            if query_status in TERMINATING_SEARCH_STATUSES:
-                print_debug_msg(f'Getting events for offense {offense_id}')
-                search_results_response = client.search_results_get(search_id)
-                print_debug_msg(f'Http response: {search_results_response.get("http_response", "Not specified - ok")}')
-                events = search_results_response.get('events', [])
-                sanitized_events = sanitize_outputs(events)
-                print_debug_msg(f'Fetched {len(sanitized_events)} events for offense {offense_id}.')
-                return sanitized_events, failure_message
-            elapsed = time.time() - start_time
-            if elapsed >= FETCH_SLEEP:  # print status debug every fetch sleep (or after)
-                print_debug_msg(f'Still fetching offense {offense_id} events, search_id: {search_id}.')
-                start_time = time.time()
-            time.sleep(EVENTS_INTERVAL_SECS)
-        except Exception as e:
-            print_debug_msg(
-                f'Error while fetching offense {offense_id} events, search_id: {search_id}. Error details: {str(e)} \n'
-                f'{traceback.format_exc()}')
-            num_of_failures += 1
-            if num_of_failures < max_retries:
-                time.sleep(FAILURE_SLEEP)
-            else:
-                failure_message = f'{repr(e)} \nSee logs for further details.'
+    return poll_offenses_events_with_retry(client, {offense_id: search_id}, max_retries)[offense_id]
 
-    print_debug_msg(f'Could not fetch events for offense ID: {offense_id}, returning empty events array.')
-    return [], failure_message
 
-
-def enrich_offense_with_events(client: Client, offense: Dict, fetch_mode: str, events_columns: str, events_limit: int,
-                               max_retries: int = MAX_FETCH_EVENT_RETIRES):
+def enrich_offenses_with_events(client: Client, offenses: List[Dict], fetch_mode: str, events_columns: str,
+                                events_limit: int, max_retries: int = MAX_FETCH_EVENT_RETIRES) -> List[Dict]:
     """
-    Enriches offense given with events.
+    Enriches offenses given with events.
+    The searches of all the offenses are created concurrently, and polled together (see
+    'poll_offenses_events_with_retry'), so the enrichment lasts about as long as the slowest search.
     Has retry mechanism for events returned by query to QRadar. This is needed because events might not be
     indexed when performing the search, and QRadar will return less events than expected.
     Retry mechanism here meant to avoid such cases as much as possible
     Args:
         client (Client): Client to perform the API calls.
-        offense (Dict): Offense to enrich with events.
+        offenses (List[Dict]): Offenses to enrich with events.
         fetch_mode (str): Which enrichment mode was requested.
                           Can be 'Fetch With All Events', 'Fetch Correlation Events Only'
         events_columns (str): Columns of the events to be extracted from query.
@@ -1457,41 +1572,79 @@ def enrich_offense_with_events(client: Client, offense: Dict, fetch_mode: str, e
         max_retries (int): Number of retries.
 
     Returns:
-        (Dict): Enriched offense with events.
+        (List[Dict]): Enriched offenses with events.
     """
     if is_reset_triggered():
-        return offense
+        return offenses
 
-    failure_message = ''
-    events: List[dict] = []
-    min_events_size = min(offense.get('event_count', 0), events_limit)
-    # decreasing 1 minute from the start_time to avoid the case where the minute queried of start_time equals end_time.
+    failure_messages: Dict[int, str] = {offense['id']: '' for offense in offenses}
+    events: Dict[int, List[dict]] = {offense['id']: [] for offense in offenses}
+    min_events_sizes = {offense['id']: min(offense.get('event_count', 0), events_limit) for offense in offenses}
+    offenses_to_search = offenses
     for i in range(max_retries):
         # retry to check if we got all the event (its not an error retry), see docstring
-        search_response = create_search_with_retry(client, fetch_mode, offense, events_columns,
-                                                   events_limit)
-        if not search_response:
-            continue
+        search_responses = EXECUTOR.map(
+            lambda offense: create_search_with_retry(client, fetch_mode, offense, events_columns, events_limit),
+            offenses_to_search)
+        offenses_search_ids = {offense['id']: search_response['search_id']
+                               for offense, search_response in zip(offenses_to_search, search_responses)
+                               if search_response}
+        if offenses_search_ids:
+            offenses_events = poll_offenses_events_with_retry(client, offenses_search_ids)
+        else:
+            offenses_events = {}
 
-        offense_id = offense['id']
-        events, failure_message = poll_offense_events_with_retry(client, search_response['search_id'], offense_id)
-        if len(events) >= min_events_size:
-            print_debug_msg(f"Fetched {len(events)}/{min_events_size} for offense ID {offense_id}")
+        for offense_id, (offense_events, failure_message) in offenses_events.items():
+            events[offense_id], failure_messages[offense_id] = offense_events, failure_message
+            if len(offense_events) >= min_events_sizes[offense_id]:
+                print_debug_msg(f"Fetched {len(offense_events)}/{min_events_sizes[offense_id]} for offense ID "
+                                f"{offense_id}")
+            else:
+                print_debug_msg(f'Did not fetch enough events. Expected at least {min_events_sizes[offense_id]}. '
+                                f'Retrying to fetch events for offense ID: {offense_id}. '
+                                f'Retry number {i}/{max_retries}')
+
+        offenses_to_search = [offense for offense in offenses_to_search
+                              if offense['id'] not in offenses_events
+                              or len(events[offense['id']]) < min_events_sizes[offense['id']]]
+        if not offenses_to_search:
             break
-        print_debug_msg(f'Did not fetch enough events. Expected at least {min_events_size}. Retrying to fetch events '
-                        f'for offense ID: {offense_id}. Retry number {i}/{max_retries}')
         if i < max_retries - 1:
             time.sleep(SLEEP_FETCH_EVENT_RETIRES)
 
-    print_debug_msg(f"Reached max retries for offense {offense.get('id')} with failure message {failure_message}")
-    if failure_message == '' and len(events) < min_events_size:
-        failure_message = 'Events were probably not indexed in QRadar at the time of the mirror.'
+    enriched_offenses = []
+    for offense in offenses:
+        offense_id = offense['id']
+        failure_message = failure_messages[offense_id]
+        print_debug_msg(f"Reached max retries for offense {offense_id} with failure message {failure_message}")
+        if failure_message == '' and len(events[offense_id]) < min_events_sizes[offense_id]:
+            failure_message = 'Events were probably not indexed in QRadar at the time of the mirror.'
+
+        enriched_offense = dict(offense, mirroring_events_message=failure_message)
+        if events[offense_id]:
+            enriched_offense = dict(enriched_offense, events=events[offense_id])
+        enriched_offenses.append(enriched_offense)
+
+    return enriched_offenses
+
 
-    offense = dict(offense, mirroring_events_message=failure_message)
-    if events:
-        offense = dict(offense, events=events)
+def enrich_offense_with_events(client: Client, offense: Dict, fetch_mode: str, events_columns: str, events_limit: int,
+                               max_retries: int = MAX_FETCH_EVENT_RETIRES):
+    """
+    Enriches offense given with events. See 'enrich_offenses_with_events'.
+    Args:
+        client (Client): Client to perform the API calls.
+        offense (Dict): Offense to enrich with events.
+        fetch_mode (str): Which enrichment mode was requested.
+                          Can be 'Fetch With All Events', 'Fetch Correlation Events Only'
+        events_columns (str): Columns of the events to be extracted from query.
+        events_limit (int): Maximum number of events to enrich the offense.
+        max_retries (int): Number of retries.
 
-    return offense
+    Returns:
+        (Dict): Enriched offense with events.
+    """
+    return enrich_offenses_with_events(client, [offense], fetch_mode, events_columns, events_limit, max_retries)[0]
 
 
 def get_incidents_long_running_execution(client: Client, offenses_per_fetch: int, user_query: str, fetch_mode: str,
@@ -1534,17 +1687,7 @@ def get_incidents_long_running_execution(client: Client, offenses_per_fetch: int
     print_debug_msg(f'New highest ID returned from QRadar offenses: {new_highest_offense_id}')
 
     if fetch_mode != FetchMode.no_events.value:
-        futures = []
-        for offense in offenses:
-            futures.append(EXECUTOR.submit(
-                enrich_offense_with_events,
-                client=client,
-                offense=offense,
-                fetch_mode=fetch_mode,
-                events_columns=events_columns,
-                events_limit=events_limit,
-            ))
-        offenses = [future.result() for future in futures]
+        offenses = enrich_offenses_with_events(client, offenses, fetch_mode, events_columns, events_limit)
 
     if is_reset_triggered(handle_reset=True):
         return None, None
@@ -1595,19 +1738,9 @@ def update_mirrored_events(client: Client,
     updated_offenses = []
     try:
         if len(offenses) > 0:
-            futures = []
             for offense in offenses:
                 print_debug_msg(f"Updating events in offense: {offense.get('id')}")
-                futures.append(EXECUTOR.submit(
-                    enrich_offense_with_events,
-                    client=client,
-                    offense=offense,
-                    fetch_mode=fetch_mode,
-                    events_columns=events_columns,
-                    events_limit=events_limit,
-                ))
-
-            updated_offenses += [future.result() for future in futures]
+            updated_offenses += enrich_offenses_with_events(client, offenses, fetch_mode, events_columns, events_limit)
         return updated_offenses
 
     except Exception as e:
@@ -1695,7 +1828,7 @@ def move_updated_offenses(context_data: dict, version: Any, include_context_data
         if not new_context_data.get('last_mirror_update'):
             new_context_data.update({'last_mirror_update': str(context_data.get('last_mirror_update', 0))})
 
-    return encode_context_data(new_context_data, include_id=True), version, new_context_data
+    return new_context_data, version, new_context_data
 
 
 def long_running_execution_command(client: Client, params: Dict):
@@ -1751,12 +1884,11 @@ def long_running_execution_command(client: Client, params: Dict):
                 mirror_direction=mirror_direction
             )
 
-            orig_context_data = extract_context_data(ctx.copy(), include_id=True)
-            context_data = {LAST_FETCH_KEY: orig_context_data.get(LAST_FETCH_KEY)}
+            ctx = extract_context_data(ctx, include_id=True)
+            context_data = {LAST_FETCH_KEY: ctx.get(LAST_FETCH_KEY)}
 
             updated_mirrored_offenses = None
             if mirror_options == MIRROR_OFFENSE_AND_EVENTS:
-                ctx = extract_context_data(ctx)
                 print_mirror_events_stats(ctx, "Long Running Command - Before Update")
                 updated_mirrored_offenses = update_mirrored_events(client=client,
                                                                    fetch_mode=fetch_mode,
@@ -3051,8 +3183,48 @@ def json_dumps_inner(listed_objects: list) -> List[str]:
     return listed_json_dumps
 
 
+def get_mirrored_offenses_ids_ctx_key(list_key: str) -> str:
+    """Get the context key holding the ordered offense ids of a mirrored offenses list.
+
+    Args:
+        list_key: The key of the mirrored offenses list, one of MIRRORED_OFFENSES_LISTS_CTX_KEYS.
+
+    Returns: The context key of the list offense ids.
+    """
+    return f'{list_key}_ids'
+
+
+def get_mirrored_offense_ctx_key(list_key: str, offense_id: Any) -> str:
+    """Get the context key holding a single offense of a mirrored offenses list.
+
+    Args:
+        list_key: The key of the mirrored offenses list, one of MIRRORED_OFFENSES_LISTS_CTX_KEYS.
+        offense_id: The offense id.
+
+    Returns: The context key of the offense.
+    """
+    return f'{list_key}_{offense_id}'
+
+
+def encode_context_data_value(key: str, value: Any) -> str:
+    """Encode a single context data value, which is not a mirrored offenses list, to its integration context form.
+
+    Args:
+        key: The context data key.
+        value: The decoded value.
+
+    Returns: The json encoded value.
+    """
+    if key == LAST_FETCH_KEY:
+        return json.dumps(int(value))
+    if key == 'last_mirror_update':
+        return json.dumps(str(value))
+    return json.dumps(json_dumps_inner(value))
+
+
 def extract_context_data(context_data: dict, include_id: bool = False) -> dict:
-    """Transform the context data from partially json encoded to fully decoded.
+    """Transform the context data from its integration context form to fully decoded.
+    Mirrored offenses lists stored in the previous form of a single double json encoded list are supported as well.
 
     Args:
         context_data: The context data.
@@ -3062,12 +3234,18 @@ def extract_context_data(context_data: dict, include_id: bool = False) -> dict:
     """
     new_context_data = context_data.copy()
     new_context_data.pop(LAST_FETCH_KEY, None)
-    if not new_context_data:
-        new_context_data = {}
+    for list_key in MIRRORED_OFFENSES_LISTS_CTX_KEYS:
+        ids_key = get_mirrored_offenses_ids_ctx_key(list_key)
+        if ids_key in context_data:
+            offenses = []
+            for offense_id in json.loads(new_context_data.pop(ids_key)):
+                offense_key = get_mirrored_offense_ctx_key(list_key, offense_id)
+                if offense_key in new_context_data:
+                    offenses.append(json.loads(new_context_data.pop(offense_key)))
+        else:
+            offenses = json_loads_inner(json.loads(context_data.get(list_key, '[]')))
+        new_context_data[list_key] = offenses
     new_context_data.update({
-        UPDATED_MIRRORED_OFFENSES_CTX_KEY: json_loads_inner(json.loads(
-            context_data.get(UPDATED_MIRRORED_OFFENSES_CTX_KEY, '[]'))),
-        MIRRORED_OFFENSES_CTX_KEY: json_loads_inner(json.loads(context_data.get(MIRRORED_OFFENSES_CTX_KEY, '[]'))),
         RESUBMITTED_MIRRORED_OFFENSES_CTX_KEY: json_loads_inner(json.loads(
             context_data.get(RESUBMITTED_MIRRORED_OFFENSES_CTX_KEY, '[]'))),
         'samples': json_loads_inner(json.loads(context_data.get('samples', '[]'))),
@@ -3079,31 +3257,90 @@ def extract_context_data(context_data: dict, include_id: bool = False) -> dict:
     return new_context_data
 
 
+def get_context_data_changes(raw_context_data: dict, context_data: dict, new_context_data: dict) -> Dict[str, Any]:
+    """Get the integration context keys to set in order to move from context_data to new_context_data.
+    Mirrored offenses are compared by identity, so only the added or replaced offenses are encoded, and every removed
+    offense is mapped to None. Keys missing from new_context_data are left as is.
+
+    Args:
+        raw_context_data: The integration context that context_data was extracted from.
+        context_data: The context data in its decoded python object form.
+        new_context_data: The new context data in its decoded python object form.
+
+    Returns: The changed integration context keys with their encoded values, None for keys to remove.
+    """
+    changes: Dict[str, Any] = {}
+    for list_key in MIRRORED_OFFENSES_LISTS_CTX_KEYS:
+        offenses = context_data.get(list_key)
+        if list_key in raw_context_data:
+            # Move a list in the previous form to a key per offense.
+            changes[list_key] = None
+            new_offenses = new_context_data.get(list_key, offenses or [])
+            offenses = None
+        elif list_key in new_context_data:
+            new_offenses = new_context_data[list_key]
+        else:
+            continue
+        previous_offenses = {str(offense.get('id')): offense for offense in offenses or []}
+        new_ids = []
+        for offense in new_offenses:
+            offense_id = str(offense.get('id'))
+            new_ids.append(offense_id)
+            previous_offense = previous_offenses.pop(offense_id, None)
+            if previous_offense is not offense and previous_offense != offense:
+                changes[get_mirrored_offense_ctx_key(list_key, offense_id)] = json.dumps(offense)
+        for offense_id in previous_offenses:
+            changes[get_mirrored_offense_ctx_key(list_key, offense_id)] = None
+        if offenses is None or new_ids != [str(offense.get('id')) for offense in offenses]:
+            changes[get_mirrored_offenses_ids_ctx_key(list_key)] = json.dumps(new_ids)
+
+    for key in (RESUBMITTED_MIRRORED_OFFENSES_CTX_KEY, 'samples', 'last_mirror_update', LAST_FETCH_KEY):
+        if key in new_context_data:
+            value = encode_context_data_value(key, new_context_data[key])
+            if raw_context_data.get(key) != value:
+                changes[key] = value
+
+    return changes
+
+
+def apply_context_data_changes(raw_context_data: dict, changes: Dict[str, Any]) -> dict:
+    """Apply context data changes on an integration context.
+
+    Args:
+        raw_context_data: The integration context to apply the changes on.
+        changes: The changed integration context keys, None for keys to remove.
+
+    Returns: The new integration context.
+    """
+    new_raw_context_data = raw_context_data.copy()
+    for key, value in changes.items():
+        if value is None:
+            new_raw_context_data.pop(key, None)
+        else:
+            new_raw_context_data[key] = value
+    return new_raw_context_data
+
+
 def encode_context_data(context_data: dict, include_id: bool = False) -> dict:
-    """Transform the context data from a decoded python object form to a partially json encoded form.
-    This is done in order to maintain compatibility with the set_to_integration_context_with_retries command.
+    """Transform the context data from a decoded python object form to its integration context form,
+    in which every value is json encoded and each mirrored offense is kept in a key of its own.
 
     Args:
         context_data: The context data in its decoded python object form
         include_id: Whether to include id in the encoding of the data.
 
-    Returns: The context data in its partially json encoded form.
+    Returns: The context data in its integration context form.
     """
-    new_context_data = context_data.copy()
-    new_context_data.pop('retry_compatible', None)
-    new_context_data.pop(LAST_FETCH_KEY, None)
+    new_context_data = {key: context_data.get(key, []) for key in MIRRORED_OFFENSES_LISTS_CTX_KEYS}
     new_context_data.update({
-        UPDATED_MIRRORED_OFFENSES_CTX_KEY: json_dumps_inner(context_data.get(UPDATED_MIRRORED_OFFENSES_CTX_KEY, [])),
-        MIRRORED_OFFENSES_CTX_KEY: json_dumps_inner(context_data.get(MIRRORED_OFFENSES_CTX_KEY, [])),
-        RESUBMITTED_MIRRORED_OFFENSES_CTX_KEY: json_dumps_inner(context_data.get(RESUBMITTED_MIRRORED_OFFENSES_CTX_KEY,
-                                                                                 [])),
-        'samples': json_dumps_inner(context_data.get('samples', [])),
-        'last_mirror_update': str(context_data.get('last_mirror_update', 0))
+        RESUBMITTED_MIRRORED_OFFENSES_CTX_KEY: context_data.get(RESUBMITTED_MIRRORED_OFFENSES_CTX_KEY, []),
+        'samples': context_data.get('samples', []),
+        'last_mirror_update': context_data.get('last_mirror_update', 0)
     })
     if include_id and LAST_FETCH_KEY in context_data:
-        new_context_data.update({LAST_FETCH_KEY: int(context_data.get(LAST_FETCH_KEY, 0))})
+        new_context_data.update({LAST_FETCH_KEY: context_data.get(LAST_FETCH_KEY, 0)})
 
-    return new_context_data
+    return get_context_data_changes({}, {}, new_context_data)
 
 
 @safely_update_context_data
@@ -3122,15 +3359,15 @@ def remove_offense_from_context_data(context_data: dict, version: Any, offense_i
     updated = context_data.get(UPDATED_MIRRORED_OFFENSES_CTX_KEY, [])
     resubmitted = context_data.get(RESUBMITTED_MIRRORED_OFFENSES_CTX_KEY, [])
 
+    new_context_data = context_data.copy()
     if offense_to_remove and offense_to_remove in updated:
-        updated.remove(offense_to_remove)
+        new_context_data[UPDATED_MIRRORED_OFFENSES_CTX_KEY] = [offense for offense in updated
+                                                               if offense != offense_to_remove]
     if offense_id in resubmitted:
-        resubmitted.remove(offense_id)
-
-    context_data[RESUBMITTED_MIRRORED_OFFENSES_CTX_KEY] = resubmitted
-    context_data[UPDATED_MIRRORED_OFFENSES_CTX_KEY] = updated
+        new_context_data[RESUBMITTED_MIRRORED_OFFENSES_CTX_KEY] = [resubmitted_id for resubmitted_id in resubmitted
+                                                                   if resubmitted_id != offense_id]
 
-    return encode_context_data(context_data), version, context_data
+    return new_context_data, version, new_context_data
 
 
 def get_remote_data_command(client: Client, params: Dict[str, Any], args: Dict) -> GetRemoteDataResponse:
@@ -3297,7 +3534,7 @@ def add_modified_remote_offenses(context_data: dict, version: str, mirror_option
             new_context_data.update({RESUBMITTED_MIRRORED_OFFENSES_CTX_KEY: clean_updates_mirrored_offenses_ids})
 
     print_mirror_events_stats(new_context_data, "Get Modified Remote Data - After update")
-    return encode_context_data(new_context_data, include_id=False), version, new_modified_records_ids
+    return new_context_data, version, new_modified_records_ids
 
 
 def get_modified_remote_data_command(client: Client, params: Dict[str, str],
@@ -3343,13 +3580,15 @@ def change_ctx_to_be_compatible_with_retry() -> None:
     In order to move QRadar from using set_integration_context to set_to_integration_context_with_retries, the fields
     need to change to JSON strings.
     Change is required due to race condition occurring between get-modified-remote-data to long-running-execution.
+    The mirrored offenses lists, previously kept as double JSON encoded lists, are moved to a key per offense so
+    updating a single offense does not require encoding all of them.
 
     Because some customers already have instances running where fields are not JSON fields, this function is needed
     to make them be compatible with new changes.
     Returns:
         (None): Modifies context to be compatible.
     """
-    ctx = get_integration_context()
+    ctx, ctx_version = get_integration_context_with_version()
     new_ctx = ctx.copy()
     try:
         extract_context_data(ctx)
@@ -3364,11 +3603,22 @@ def change_ctx_to_be_compatible_with_retry() -> None:
         new_ctx['samples'] = json.loads(ctx.get('samples'))
         new_ctx['last_mirror_update'] = json.loads(ctx.get('last_mirror_update', '0'))
 
-    if not extract_works:
-        encoded_ctx = encode_context_data(new_ctx)
-        print_debug_msg(f"Change ctx context data is {ctx}")
-        set_to_integration_context_with_retries(encoded_ctx)
-        print_debug_msg(f"Change ctx context data was changed to {encoded_ctx}")
+    if extract_works and not any(list_key in ctx for list_key in MIRRORED_OFFENSES_LISTS_CTX_KEYS):
+        return
+
+    if extract_works:
+        new_ctx = extract_context_data(ctx)
+    else:
+        new_ctx.pop(LAST_FETCH_KEY, None)
+    encoded_ctx = apply_context_data_changes(ctx, get_context_data_changes(ctx, {}, new_ctx))
+    print_debug_msg(f"Change ctx context data is {ctx}")
+    try:
+        set_integration_context(encoded_ctx, version=ctx_version)
+    except ValueError as e:
+        # The context was updated meanwhile, the change will be made by the next command.
+        print_debug_msg(f"Could not change ctx context data after version {ctx_version}. Error was: {str(e)}")
+        return
+    print_debug_msg(f"Change ctx context data was changed to {encoded_ctx}")
 
 
 ''' MAIN FUNCTION '''
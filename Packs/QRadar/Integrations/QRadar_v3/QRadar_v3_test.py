@@ -3,7 +3,6 @@
 """
 import io
 import json
-import concurrent.futures
 from datetime import datetime
 from typing import Dict, Callable
 
@@ -32,7 +31,9 @@ from QRadar_v3 import get_time_parameter, add_iso_entries_to_dict, build_final_o
     qradar_log_sources_list_command, qradar_get_custom_properties_command, enrich_asset_properties, \
     flatten_nested_geolocation_values, get_modified_remote_data_command, get_remote_data_command, is_valid_ip, \
     qradar_ips_source_get_command, qradar_ips_local_destination_get_command, update_mirrored_events, \
-    encode_context_data, extract_context_data, change_ctx_to_be_compatible_with_retry
+    encode_context_data, extract_context_data, change_ctx_to_be_compatible_with_retry, \
+    poll_offenses_events_with_retry, enrich_offenses_with_events, get_cached_enrichment_names, \
+    get_context_data_changes, move_updated_offenses
 
 client = Client(
     server='https://192.168.0.1',
@@ -514,17 +515,105 @@ def test_enrich_offense_with_events(mocker, offense: Dict, fetch_mode, mock_sear
                                                          'of the mirror.')
 
     mocker.patch.object(QRadar_v3, "create_search_with_retry", return_value=mock_search_response)
-    poll_events_mock = mocker.patch.object(QRadar_v3, "poll_offense_events_with_retry",
-                                           return_value=poll_events_response)
+    poll_events_mock = mocker.patch.object(QRadar_v3, "poll_offenses_events_with_retry",
+                                           return_value={offense['id']: poll_events_response})
 
     enriched_offense = enrich_offense_with_events(client, offense, fetch_mode, event_columns_default_value,
                                                   events_limit=events_limit, max_retries=1)
 
     if mock_search_response:
-        assert poll_events_mock.call_args[0][1] == mock_search_response['search_id']
+        assert poll_events_mock.call_args[0][1] == {offense['id']: mock_search_response['search_id']}
     assert enriched_offense == expected_offense
 
 
+def test_poll_offenses_events_with_retry(mocker):
+    """
+    Given:
+     - Searches of several offenses, which are completed after a different number of polls.
+
+    When:
+     - Polling the searches of the offenses.
+
+    Then:
+     - Ensure the searches are polled together, sleeping once per polling round.
+     - Ensure the events of every search are returned, and retrieved once.
+    """
+    set_integration_context(dict())
+    polls_to_complete = {'search_1': 1, 'search_2': 3, 'search_3': 2}
+    polls_count = {search_id: 0 for search_id in polls_to_complete}
+
+    def search_status_get(search_id):
+        polls_count[search_id] += 1
+        return {'status': 'COMPLETED' if polls_count[search_id] >= polls_to_complete[search_id] else 'EXECUTE'}
+
+    mocker.patch.object(client, 'search_status_get', side_effect=search_status_get)
+    search_results_get = mocker.patch.object(client, 'search_results_get',
+                                             side_effect=lambda search_id: {'events': [{'search': search_id}]})
+    sleep_mock = mocker.patch.object(QRadar_v3.time, 'sleep')
+
+    results = poll_offenses_events_with_retry(client, {1: 'search_1', 2: 'search_2', 3: 'search_3'})
+
+    assert results == {offense_id: ([{'search': f'search_{offense_id}'}], '') for offense_id in (1, 2, 3)}
+    assert polls_count == polls_to_complete
+    assert search_results_get.call_count == 3
+    assert [call[0][0] for call in sleep_mock.call_args_list] == [QRadar_v3.EVENTS_INTERVAL_SECS] * 2
+
+
+def test_enrich_offenses_with_events(mocker):
+    """
+    Given:
+     - Offenses to enrich with events, where the events of one of them are not indexed at the first search.
+
+    When:
+     - Enriching the offenses with events.
+
+    Then:
+     - Ensure the searches of all the offenses are polled together.
+     - Ensure only the offense without enough events is searched again.
+    """
+    set_integration_context(dict())
+    offenses = [{'id': 1, 'event_count': 1, 'start_time': 0}, {'id': 2, 'event_count': 2, 'start_time': 0}]
+    mocker.patch.object(QRadar_v3, 'create_search_with_retry',
+                        side_effect=lambda client_, fetch_mode, offense, *args: {'search_id': f'search_{offense["id"]}'})
+    poll_events_mock = mocker.patch.object(QRadar_v3, 'poll_offenses_events_with_retry', side_effect=[
+        {1: ([{'event': 1}], ''), 2: ([{'event': 2}], '')},
+        {2: ([{'event': 2}, {'event': 3}], '')},
+    ])
+    mocker.patch.object(QRadar_v3.time, 'sleep')
+
+    enriched_offenses = enrich_offenses_with_events(client, offenses, 'all_events', event_columns_default_value,
+                                                    events_limit=5, max_retries=2)
+
+    assert [call[0][1] for call in poll_events_mock.call_args_list] == [{1: 'search_1', 2: 'search_2'},
+                                                                        {2: 'search_2'}]
+    assert enriched_offenses == [dict(offenses[0], events=[{'event': 1}], mirroring_events_message=''),
+                                 dict(offenses[1], events=[{'event': 2}, {'event': 3}], mirroring_events_message='')]
+
+
+def test_get_cached_enrichment_names(mocker):
+    """
+    Given:
+     - Names of QRadar objects which were requested in previous fetches.
+
+    When:
+     - Getting the names of objects by their IDs.
+
+    Then:
+     - Ensure only IDs which are not cached, or whose cache time passed, are requested.
+    """
+    mocker.patch.dict(QRadar_v3.ENRICHMENT_CACHES, clear=True)
+    mocker.patch.object(QRadar_v3.time, 'time', return_value=1000)
+    get_names = mocker.MagicMock(side_effect=lambda ids: {id_: f'name{id_}' for id_ in ids})
+
+    assert get_cached_enrichment_names('rules', {1, 2}, get_names) == {1: 'name1', 2: 'name2'}
+    assert get_cached_enrichment_names('rules', {2, 3}, get_names) == {2: 'name2', 3: 'name3'}
+    assert [call[0][0] for call in get_names.call_args_list] == [{1, 2}, {3}]
+
+    QRadar_v3.time.time.return_value = 1000 + QRadar_v3.ENRICHMENT_CACHE_TTL_SECS
+    assert get_cached_enrichment_names('rules', {1, 2, 3}, get_names) == {1: 'name1', 2: 'name2', 3: 'name3'}
+    assert get_names.call_args[0][0] == {1, 2, 3}
+
+
 @pytest.mark.parametrize('func, args, expected',
                          [(create_search_with_retry,
                            {'client': client, 'offense': command_test_data['offenses_list']['response'][0],
@@ -1216,15 +1305,15 @@ def test_mirroring_offenses_with_events(mocker, offenses, context_data):
     """
     # Get a list of offenses to update their events
     mocker.patch.object(client, 'offenses_list', return_value=offenses.get('ids'))
-    mocker.patch.object(QRadar_v3, 'get_integration_context_with_version', return_value=(set_context_data_as_json(
+    mocker.patch.object(QRadar_v3, 'get_integration_context_with_version', return_value=(encode_context_data(
         context_data.get('before_offenses_ids')), 666))
-    mocker.patch.object(QRadar_v3, 'set_to_integration_context_with_retries')
+    mocker.patch.object(QRadar_v3, 'set_integration_context')
     get_modified_remote_data_command(client, {'mirror_options': MIRROR_OFFENSE_AND_EVENTS}, {"lastUpdate": "0"})
-    QRadar_v3.set_to_integration_context_with_retries.assert_called_once_with(encode_context_data(
-        context_data.get('with_offenses_ids')), max_retry_times=1)
+    assert_context_data_set(context_data.get('with_offenses_ids'))
 
     # Transfer that list to the long running docker and update the events.
-    mocker.patch.object(concurrent.futures.ThreadPoolExecutor, 'submit', side_effect=offenses.get('as_results'))
+    mocker.patch.object(QRadar_v3, 'enrich_offenses_with_events',
+                        return_value=[result.result() for result in offenses.get('as_results')])
     updated_mirrored_offenses = update_mirrored_events(client=client,
                                                        fetch_mode=FetchMode.correlations_events_only.value,
                                                        events_columns='',
@@ -1236,17 +1325,16 @@ def test_mirroring_offenses_with_events(mocker, offenses, context_data):
 
     # Update an incident's events accordingly.
     for offense_index, offense in enumerate(offenses.get('ids')):
-        mocker.patch.object(QRadar_v3, 'get_integration_context_with_version', return_value=(set_context_data_as_json(
+        mocker.patch.object(QRadar_v3, 'get_integration_context_with_version', return_value=(encode_context_data(
             context_data.get('with_events')[offense_index]), 666))
         mocker.patch.object(client, 'offenses_list', return_value=offense)
         mocker.patch.object(QRadar_v3, 'enrich_offenses_result', return_value=offense)
-        mocker.patch.object(QRadar_v3, 'set_to_integration_context_with_retries')
+        mocker.patch.object(QRadar_v3, 'set_integration_context')
         result = get_remote_data_command(client, {'mirror_options': MIRROR_OFFENSE_AND_EVENTS},
                                          {'id': offense.get('id'), 'lastUpdate': 1})
 
         # Make sure the final offense has it's updated events
-        QRadar_v3.set_to_integration_context_with_retries.assert_called_once_with(
-            encode_context_data(context_data.get('with_updated_removed')[offense_index]), max_retry_times=1)
+        assert_context_data_set(context_data.get('with_updated_removed')[offense_index])
         assert result.mirrored_object.get('events', '')
 
         updated_result_events = result.mirrored_object.get('events')
@@ -1254,12 +1342,10 @@ def test_mirroring_offenses_with_events(mocker, offenses, context_data):
             assert event in updated_result_events
 
 
-def set_context_data_as_json(context_data, include_id=False):
-    new_context_data = encode_context_data(context_data, include_id=include_id)
-    for key in new_context_data.keys():
-        new_context_data[key] = json.dumps(new_context_data[key])
-
-    return new_context_data
+def assert_context_data_set(expected_context_data):
+    QRadar_v3.set_integration_context.assert_called_once()
+    assert extract_context_data(QRadar_v3.set_integration_context.call_args.args[0]) == \
+        extract_context_data(encode_context_data(expected_context_data))
 
 
 @pytest.mark.parametrize('offenses, context_data',
@@ -1388,15 +1474,14 @@ def test_mirroring_with_events_resubmit_exhausted_offenses(mocker, offenses, con
         Ensure get_remote_data updated incident and updated the context data accordingly.
     """
     mocker.patch.object(client, 'offenses_list', return_value=offenses.get('new_offenses'))
-    mocker.patch.object(QRadar_v3, 'get_integration_context_with_version', return_value=(set_context_data_as_json(
+    mocker.patch.object(QRadar_v3, 'get_integration_context_with_version', return_value=(encode_context_data(
         context_data.get('get_modified_input')), 666))
-    mocker.patch.object(QRadar_v3, 'set_to_integration_context_with_retries')
+    mocker.patch.object(QRadar_v3, 'set_integration_context')
     mocker.patch.object(QRadar_v3, 'GetModifiedRemoteDataResponse')
 
     get_modified_remote_data_command(client, {'mirror_options': MIRROR_OFFENSE_AND_EVENTS}, {"lastUpdate": "0"})
 
-    QRadar_v3.set_to_integration_context_with_retries.assert_called_once_with(encode_context_data(
-        context_data.get('get_modified_output')), max_retry_times=1)
+    assert_context_data_set(context_data.get('get_modified_output'))
     assert set(QRadar_v3.GetModifiedRemoteDataResponse.call_args.args[0]) == set(offenses.get('to_update'))
     assert len(QRadar_v3.GetModifiedRemoteDataResponse.call_args.args[0]) == len(offenses.get('to_update'))
 
@@ -1405,17 +1490,16 @@ def test_mirroring_with_events_resubmit_exhausted_offenses(mocker, offenses, con
 
     # Update an incident's events accordingly.
     for offense_index, offense in enumerate(updated_offenses):
-        mocker.patch.object(QRadar_v3, 'get_integration_context_with_version', return_value=(set_context_data_as_json(
+        mocker.patch.object(QRadar_v3, 'get_integration_context_with_version', return_value=(encode_context_data(
             context_input_for_get_remote_data), 666))
         mocker.patch.object(client, 'offenses_list', return_value=offense)
         mocker.patch.object(QRadar_v3, 'enrich_offenses_result', return_value=offense)
-        mocker.patch.object(QRadar_v3, 'set_to_integration_context_with_retries')
+        mocker.patch.object(QRadar_v3, 'set_integration_context')
         get_remote_data_command(client, {'mirror_options': MIRROR_OFFENSE_AND_EVENTS},
                                 {'id': offense.get('id'), 'lastUpdate': 1})
 
         # Make sure the final offense has it's updated events
-        QRadar_v3.set_to_integration_context_with_retries.assert_called_once_with(
-            encode_context_data(context_data.get('after_get_remote_data')[offense_index]), max_retry_times=1)
+        assert_context_data_set(context_data.get('after_get_remote_data')[offense_index])
 
         context_input_for_get_remote_data = context_data.get('after_get_remote_data')[offense_index]
 
@@ -1531,27 +1615,25 @@ def test_mirroring_with_events_remove_resubmitted_offenses(mocker, offenses, con
     """
     mocker.patch.object(client, 'offenses_list', return_value=offenses.get('new_offenses'))
     mocker.patch.object(QRadar_v3, 'get_integration_context_with_version',
-                        return_value=(set_context_data_as_json(context_data.get('get_modified_input')), 666))
-    mocker.patch.object(QRadar_v3, 'set_to_integration_context_with_retries')
+                        return_value=(encode_context_data(context_data.get('get_modified_input')), 666))
+    mocker.patch.object(QRadar_v3, 'set_integration_context')
     mocker.patch.object(QRadar_v3, 'GetModifiedRemoteDataResponse')
 
     get_modified_remote_data_command(client, {'mirror_options': MIRROR_OFFENSE_AND_EVENTS}, {"lastUpdate": "0"})
 
-    QRadar_v3.set_to_integration_context_with_retries.assert_called_once_with(encode_context_data(
-        context_data.get('get_modified_output')), max_retry_times=1)
+    assert_context_data_set(context_data.get('get_modified_output'))
     assert set(QRadar_v3.GetModifiedRemoteDataResponse.call_args.args[0]) == set(offenses.get('to_update'))
     assert len(QRadar_v3.GetModifiedRemoteDataResponse.call_args.args[0]) == len(offenses.get('to_update'))
 
     mocker.patch.object(client, 'offenses_list', return_value=offenses.get('newer_offenses'))
-    mocker.patch.object(QRadar_v3, 'get_integration_context_with_version', return_value=(set_context_data_as_json(
+    mocker.patch.object(QRadar_v3, 'get_integration_context_with_version', return_value=(encode_context_data(
         context_data.get('get_modified_output')), 666))
-    mocker.patch.object(QRadar_v3, 'set_to_integration_context_with_retries')
+    mocker.patch.object(QRadar_v3, 'set_integration_context')
     mocker.patch.object(QRadar_v3, 'GetModifiedRemoteDataResponse')
 
     get_modified_remote_data_command(client, {'mirror_options': MIRROR_OFFENSE_AND_EVENTS}, {"lastUpdate": "0"})
 
-    QRadar_v3.set_to_integration_context_with_retries.assert_called_once_with(encode_context_data(
-        context_data.get('clean_get_modified_output')), max_retry_times=1)
+    assert_context_data_set(context_data.get('clean_get_modified_output'))
     assert set(QRadar_v3.GetModifiedRemoteDataResponse.call_args.args[0]) == set(offenses.get('clean_to_update'))
     assert len(QRadar_v3.GetModifiedRemoteDataResponse.call_args.args[0]) == len(offenses.get('clean_to_update'))
 
@@ -1570,15 +1652,71 @@ def test_mirroring_with_events_remove_resubmitted_offenses(mocker, offenses, con
      MIRRORED_OFFENSES_CTX_KEY: [],
      RESUBMITTED_MIRRORED_OFFENSES_CTX_KEY: ['1', '11']}])
 def test_extract_decode_encode(context_data):
-    assert extract_context_data(set_context_data_as_json(context_data, include_id=True),
+    assert extract_context_data(encode_context_data(context_data, include_id=True),
                                 include_id=True) == context_data
 
 
-@pytest.mark.parametrize('context_data, retry_compatible', [
-    # Happy flow: configuration matches retry_compatible
-    ({'samples': [{'id': '1', 'last_persisted_time': 2,
-                   'events': [{'event_id': '2'}, {'event_id': '3'}]}],
-      'last_mirror_update': '10',
+def test_get_context_data_changes():
+    """
+    Given:
+        - Context data with mirrored offenses.
+
+    When:
+        - Updating a single offense, removing another and keeping the rest as is.
+
+    Then:
+        - Ensure only the updated offense is encoded, the removed offense key is removed and the other keys are kept.
+    """
+    context_data = {MIRRORED_OFFENSES_CTX_KEY: [{'id': i, 'last_persisted_time': i} for i in range(5)],
+                    UPDATED_MIRRORED_OFFENSES_CTX_KEY: [{'id': 10, 'events': []}]}
+    raw_context_data = encode_context_data(context_data)
+    context_data = extract_context_data(raw_context_data)
+    mirrored = context_data[MIRRORED_OFFENSES_CTX_KEY]
+    new_context_data = {MIRRORED_OFFENSES_CTX_KEY: [mirrored[0], {'id': 1, 'last_persisted_time': 7}] + mirrored[3:]}
+
+    changes = get_context_data_changes(raw_context_data, context_data, new_context_data)
+
+    assert changes == {f'{MIRRORED_OFFENSES_CTX_KEY}_1': json.dumps({'id': 1, 'last_persisted_time': 7}),
+                       f'{MIRRORED_OFFENSES_CTX_KEY}_2': None,
+                       f'{MIRRORED_OFFENSES_CTX_KEY}_ids': json.dumps(['0', '1', '3', '4'])}
+
+
+def test_safely_update_context_data_merges_by_offense_id(mocker):
+    """
+    Given:
+        - Context data with mirrored offenses, updated by another container after it was read.
+
+    When:
+        - Moving an updated offense with move_updated_offenses.
+
+    Then:
+        - Ensure the update is retried on top of the latest context data, keeping the changes of the other container.
+    """
+    context_data = {MIRRORED_OFFENSES_CTX_KEY: [{'id': 1}, {'id': 2}], 'last_mirror_update': '5'}
+    raw_context_data = encode_context_data(context_data)
+    latest_context_data = {MIRRORED_OFFENSES_CTX_KEY: [{'id': 1}, {'id': 2}, {'id': 3}], 'last_mirror_update': '6'}
+    mocker.patch.object(QRadar_v3, 'get_integration_context_with_version',
+                        side_effect=[(encode_context_data(latest_context_data), 2)] * 2)
+    mocker.patch.object(QRadar_v3, 'set_integration_context')
+
+    move_updated_offenses(context_data=extract_context_data(raw_context_data), version=1,
+                          include_context_data={LAST_FETCH_KEY: 3}, updated_list=[{'id': 2, 'events': []}])
+
+    assert QRadar_v3.set_integration_context.call_args.kwargs['version'] == 2
+    assert extract_context_data(QRadar_v3.set_integration_context.call_args.args[0], include_id=True) == {
+        MIRRORED_OFFENSES_CTX_KEY: [{'id': 1}, {'id': 3}],
+        UPDATED_MIRRORED_OFFENSES_CTX_KEY: [{'id': 2, 'events': []}],
+        RESUBMITTED_MIRRORED_OFFENSES_CTX_KEY: [],
+        'samples': [],
+        'last_mirror_update': '6',
+        LAST_FETCH_KEY: 3}
+
+
+@pytest.mark.parametrize('context_data', [
+    # Fields are not JSON encoded
+    {'samples': [{'id': '1', 'last_persisted_time': 2,
+                  'events': [{'event_id': '2'}, {'event_id': '3'}]}],
+     'last_mirror_update': '10',
      LAST_FETCH_KEY: 5,
      UPDATED_MIRRORED_OFFENSES_CTX_KEY: [{'id': '1',
                                           'last_persisted_time': 2,
@@ -1591,60 +1729,56 @@ def test_extract_decode_encode(context_data):
      MIRRORED_OFFENSES_CTX_KEY: [],
      RESUBMITTED_MIRRORED_OFFENSES_CTX_KEY: ['1', '11'],
      'retry_compatible': False},
-     False),
-    # Happy flow: configuration matches retry_compatible
-    ({'samples': '["{\\"id\\": \\"1\\", '
-                 '\\"last_persisted_time\\": 2, '
-                 '\\"events\\": [{\\"event_id\\": \\"2\\"}, {\\"event_id\\": \\"3\\"}]}"]',
-      'id': '"5"',
-      'last_mirror_update': '"10"',
-      'updated_mirrored_offenses': '["{\\"id\\": \\"1\\", '
-                                   '\\"last_persisted_time\\": 2, '
-                                   '\\"events\\": [{\\"event_id\\": \\"2\\"}, {\\"event_id\\": \\"3\\"}]}", '
-                                   '"{\\"id\\": \\"11\\", '
-                                   '\\"last_persisted_time\\": 3, '
-                                   '\\"events\\": [{\\"event_id\\": \\"22\\"}, {\\"event_id\\": \\"33\\"}]}"]',
-      'mirrored_offenses': '[]',
-      'resubmitted_mirrored_offenses': '["\\"1\\"", "\\"11\\""]',
-      'retry_compatible': True},
-     True),
-    # Configuration doesn't match retry_compatible
-    ({'samples': [{'id': '1', 'last_persisted_time': 2,
-                   'events': [{'event_id': '2'}, {'event_id': '3'}]}],
-      'last_mirror_update': '10',
-      LAST_FETCH_KEY: 5,
-      UPDATED_MIRRORED_OFFENSES_CTX_KEY: [{'id': '1',
-                                           'last_persisted_time': 2,
-                                           'events': [{'event_id': '2'},
-                                                      {'event_id': '3'}]},
-                                          {'id': '11',
-                                           'last_persisted_time': 3,
-                                           'events': [{'event_id': '22'},
-                                                      {'event_id': '33'}]}],
-      MIRRORED_OFFENSES_CTX_KEY: [],
-      RESUBMITTED_MIRRORED_OFFENSES_CTX_KEY: ['1', '11'],
-      'retry_compatible': True},
-     False),
-    # Configuration doesn't match retry_compatible
-    ({'samples': '["{\\"id\\": \\"1\\", '
-                 '\\"last_persisted_time\\": 2, '
-                 '\\"events\\": [{\\"event_id\\": \\"2\\"}, {\\"event_id\\": \\"3\\"}]}"]',
-      'id': '"5"',
-      'last_mirror_update': '"10"',
-      'updated_mirrored_offenses': '["{\\"id\\": \\"1\\", '
-                                   '\\"last_persisted_time\\": 2, '
-                                   '\\"events\\": [{\\"event_id\\": \\"2\\"}, {\\"event_id\\": \\"3\\"}]}", '
-                                   '"{\\"id\\": \\"11\\", '
-                                   '\\"last_persisted_time\\": 3, '
-                                   '\\"events\\": [{\\"event_id\\": \\"22\\"}, {\\"event_id\\": \\"33\\"}]}"]',
-      'mirrored_offenses': '[]',
-      'resubmitted_mirrored_offenses': '["\\"1\\"", "\\"11\\""]',
-      'retry_compatible': False},
-     True),
+    # Mirrored offenses lists are double JSON encoded
+    {'samples': '["{\\"id\\": \\"1\\", '
+                '\\"last_persisted_time\\": 2, '
+                '\\"events\\": [{\\"event_id\\": \\"2\\"}, {\\"event_id\\": \\"3\\"}]}"]',
+     'id': '"5"',
+     'last_mirror_update': '"10"',
+     'updated_mirrored_offenses': '["{\\"id\\": \\"1\\", '
+                                  '\\"last_persisted_time\\": 2, '
+                                  '\\"events\\": [{\\"event_id\\": \\"2\\"}, {\\"event_id\\": \\"3\\"}]}", '
+                                  '"{\\"id\\": \\"11\\", '
+                                  '\\"last_persisted_time\\": 3, '
+                                  '\\"events\\": [{\\"event_id\\": \\"22\\"}, {\\"event_id\\": \\"33\\"}]}"]',
+     'mirrored_offenses': '[]',
+     'resubmitted_mirrored_offenses': '["\\"1\\"", "\\"11\\""]',
+     'retry_compatible': True},
+    # retry_compatible flag doesn't match the fields encoding
+    {'samples': [{'id': '1', 'last_persisted_time': 2,
+                  'events': [{'event_id': '2'}, {'event_id': '3'}]}],
+     'last_mirror_update': '10',
+     LAST_FETCH_KEY: 5,
+     UPDATED_MIRRORED_OFFENSES_CTX_KEY: [{'id': '1',
+                                          'last_persisted_time': 2,
+                                          'events': [{'event_id': '2'},
+                                                     {'event_id': '3'}]},
+                                         {'id': '11',
+                                          'last_persisted_time': 3,
+                                          'events': [{'event_id': '22'},
+                                                     {'event_id': '33'}]}],
+     MIRRORED_OFFENSES_CTX_KEY: [],
+     RESUBMITTED_MIRRORED_OFFENSES_CTX_KEY: ['1', '11'],
+     'retry_compatible': True},
+    # retry_compatible flag doesn't match the fields encoding
+    {'samples': '["{\\"id\\": \\"1\\", '
+                '\\"last_persisted_time\\": 2, '
+                '\\"events\\": [{\\"event_id\\": \\"2\\"}, {\\"event_id\\": \\"3\\"}]}"]',
+     'id': '"5"',
+     'last_mirror_update': '"10"',
+     'updated_mirrored_offenses': '["{\\"id\\": \\"1\\", '
+                                  '\\"last_persisted_time\\": 2, '
+                                  '\\"events\\": [{\\"event_id\\": \\"2\\"}, {\\"event_id\\": \\"3\\"}]}", '
+                                  '"{\\"id\\": \\"11\\", '
+                                  '\\"last_persisted_time\\": 3, '
+                                  '\\"events\\": [{\\"event_id\\": \\"22\\"}, {\\"event_id\\": \\"33\\"}]}"]',
+     'mirrored_offenses': '[]',
+     'resubmitted_mirrored_offenses': '["\\"1\\"", "\\"11\\""]',
+     'retry_compatible': False},
     # No retry_compatible
-    ({'samples': [{'id': '1', 'last_persisted_time': 2,
-                   'events': [{'event_id': '2'}, {'event_id': '3'}]}],
-      'last_mirror_update': '10',
+    {'samples': [{'id': '1', 'last_persisted_time': 2,
+                  'events': [{'event_id': '2'}, {'event_id': '3'}]}],
+     'last_mirror_update': '10',
      LAST_FETCH_KEY: 5,
      UPDATED_MIRRORED_OFFENSES_CTX_KEY: [{'id': '1',
                                           'last_persisted_time': 2,
@@ -1657,58 +1791,53 @@ def test_extract_decode_encode(context_data):
      MIRRORED_OFFENSES_CTX_KEY: [],
      RESUBMITTED_MIRRORED_OFFENSES_CTX_KEY: ['1', '11'],
      'retry_compatible': False},
-     False),
-    ({'samples': '["{\\"id\\": \\"1\\", '
-                 '\\"last_persisted_time\\": 2, '
-                 '\\"events\\": [{\\"event_id\\": \\"2\\"}, {\\"event_id\\": \\"3\\"}]}"]',
-      'id': '"5"',
-      'last_mirror_update': '"10"',
-      'updated_mirrored_offenses': '["{\\"id\\": \\"1\\", '
-                                   '\\"last_persisted_time\\": 2, '
-                                   '\\"events\\": [{\\"event_id\\": \\"2\\"}, {\\"event_id\\": \\"3\\"}]}", '
-                                   '"{\\"id\\": \\"11\\", '
-                                   '\\"last_persisted_time\\": 3, '
-                                   '\\"events\\": [{\\"event_id\\": \\"22\\"}, {\\"event_id\\": \\"33\\"}]}"]',
-      'mirrored_offenses': '[]',
-      'resubmitted_mirrored_offenses': '["\\"1\\"", "\\"11\\""]',
-      'retry_compatible': False},
-     True),
-    ({'samples': '["{\\"id\\": \\"1\\", '
-                 '\\"last_persisted_time\\": 2, '
-                 '\\"events\\": [{\\"event_id\\": \\"2\\"}, {\\"event_id\\": \\"3\\"}]}"]',
-      'id': '"5"',
-      'last_mirror_update': '"10"',
-      'updated_mirrored_offenses': '["{\\"id\\": \\"1\\", '
-                                   '\\"last_persisted_time\\": 2, '
-                                   '\\"events\\": [{\\"event_id\\": \\"2\\"}, {\\"event_id\\": \\"3\\"}]}", '
-                                   '"{\\"id\\": \\"11\\", '
-                                   '\\"last_persisted_time\\": 3, '
-                                   '\\"events\\": [{\\"event_id\\": \\"22\\"}, {\\"event_id\\": \\"33\\"}]}"]',
-      'mirrored_offenses': '[]',
-      'resubmitted_mirrored_offenses': '["\\"1\\"", "\\"11\\""]',
-      'retry_compatible': False},
-     True)
+    {'samples': '["{\\"id\\": \\"1\\", '
+                '\\"last_persisted_time\\": 2, '
+                '\\"events\\": [{\\"event_id\\": \\"2\\"}, {\\"event_id\\": \\"3\\"}]}"]',
+     'id': '"5"',
+     'last_mirror_update': '"10"',
+     'updated_mirrored_offenses': '["{\\"id\\": \\"1\\", '
+                                  '\\"last_persisted_time\\": 2, '
+                                  '\\"events\\": [{\\"event_id\\": \\"2\\"}, {\\"event_id\\": \\"3\\"}]}", '
+                                  '"{\\"id\\": \\"11\\", '
+                                  '\\"last_persisted_time\\": 3, '
+                                  '\\"events\\": [{\\"event_id\\": \\"22\\"}, {\\"event_id\\": \\"33\\"}]}"]',
+     'mirrored_offenses': '[]',
+     'resubmitted_mirrored_offenses': '["\\"1\\"", "\\"11\\""]',
+     'retry_compatible': False},
+    {'samples': '["{\\"id\\": \\"1\\", '
+                '\\"last_persisted_time\\": 2, '
+                '\\"events\\": [{\\"event_id\\": \\"2\\"}, {\\"event_id\\": \\"3\\"}]}"]',
+     'id': '"5"',
+     'last_mirror_update': '"10"',
+     'updated_mirrored_offenses': '["{\\"id\\": \\"1\\", '
+                                  '\\"last_persisted_time\\": 2, '
+                                  '\\"events\\": [{\\"event_id\\": \\"2\\"}, {\\"event_id\\": \\"3\\"}]}", '
+                                  '"{\\"id\\": \\"11\\", '
+                                  '\\"last_persisted_time\\": 3, '
+                                  '\\"events\\": [{\\"event_id\\": \\"22\\"}, {\\"event_id\\": \\"33\\"}]}"]',
+     'mirrored_offenses': '[]',
+     'resubmitted_mirrored_offenses': '["\\"1\\"", "\\"11\\""]',
+     'retry_compatible': False}
 ])
-def test_change_ctx_to_be_compatible(mocker, context_data, retry_compatible):
+def test_change_ctx_to_be_compatible(mocker, context_data):
     """Test changing the context data to be compatible with set_to_integration_context_with_retries.
 
     Given:
-        Context data in the old or new format.
+        Context data in the old formats.
 
     When:
         Executing any command.
 
     Then:
-        Ensure the context_data is transformed to the new format if needed.
+        Ensure the context_data is transformed to the new format, with a context key per mirrored offense.
     """
-    mocker.patch.object(QRadar_v3, 'get_integration_context', return_value=context_data)
-    encoded_context = context_data
-    mocker.patch.object(QRadar_v3, 'set_to_integration_context_with_retries')
+    mocker.patch.object(QRadar_v3, 'get_integration_context_with_version', return_value=(context_data, 1))
+    mocker.patch.object(QRadar_v3, 'set_integration_context')
 
     change_ctx_to_be_compatible_with_retry()
-    if not retry_compatible:
-        encoded_context = set_context_data_as_json(context_data)
 
+    encoded_context = QRadar_v3.set_integration_context.call_args.args[0]
     encoded_context.pop('retry_compatible', None)
 
     extracted_ctx = {'samples': [{'id': '1', 'last_persisted_time': 2,
@@ -1726,11 +1855,18 @@ def test_change_ctx_to_be_compatible(mocker, context_data, retry_compatible):
                      RESUBMITTED_MIRRORED_OFFENSES_CTX_KEY: ['1', '11']}
 
     assert extract_context_data(encoded_context) == extracted_ctx
+    assert UPDATED_MIRRORED_OFFENSES_CTX_KEY not in encoded_context
+    assert MIRRORED_OFFENSES_CTX_KEY not in encoded_context
+    assert encoded_context[f'{UPDATED_MIRRORED_OFFENSES_CTX_KEY}_11'] == json.dumps(
+        extracted_ctx[UPDATED_MIRRORED_OFFENSES_CTX_KEY][1])
 
-    if not retry_compatible:
-        QRadar_v3.set_to_integration_context_with_retries.assert_called_once_with(encode_context_data(extracted_ctx))
-    else:
-        assert not QRadar_v3.set_to_integration_context_with_retries.called
+    # The transformed context is kept as is.
+    mocker.patch.object(QRadar_v3, 'get_integration_context_with_version', return_value=(encoded_context, 2))
+    mocker.patch.object(QRadar_v3, 'set_integration_context')
+
+    change_ctx_to_be_compatible_with_retry()
+
+    assert not QRadar_v3.set_integration_context.called
 
 
 @pytest.mark.parametrize('context_data, retry_compatible, extracted_ctx', [
@@ -1758,12 +1894,15 @@ def test_change_ctx_with_dirty_samples(mocker, context_data, retry_compatible, e
     Then:
         Ensure the context_data is transformed to the new format.
     """
-    mocker.patch.object(QRadar_v3, 'get_integration_context', return_value=context_data)
-    mocker.patch.object(QRadar_v3, 'set_to_integration_context_with_retries')
+    mocker.patch.object(QRadar_v3, 'get_integration_context_with_version', return_value=(context_data, 1))
+    mocker.patch.object(QRadar_v3, 'set_integration_context')
 
     change_ctx_to_be_compatible_with_retry()
 
     if not retry_compatible:
-        QRadar_v3.set_to_integration_context_with_retries.assert_called_once_with(encode_context_data(extracted_ctx))
+        encoded_context = QRadar_v3.set_integration_context.call_args.args[0]
+        encoded_context.pop('retry_compatible', None)
+        assert extract_context_data(encoded_context, include_id=True) == extract_context_data(
+            encode_context_data(extracted_ctx, include_id=True), include_id=True)
     else:
-        assert not QRadar_v3.set_to_integration_context_with_retries.called
+        assert not QRadar_v3.set_integration_context.called
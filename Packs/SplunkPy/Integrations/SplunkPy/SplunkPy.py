@@ -17,6 +17,8 @@ import requests
 import urllib3
 import io
 import re
+import csv
+from multiprocessing.pool import ThreadPool
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -28,6 +30,11 @@ SPLUNK_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
 VERIFY_CERTIFICATE = not bool(params.get('unsecure'))
 FETCH_LIMIT = int(params.get('fetch_limit')) if params.get('fetch_limit') else 50
 FETCH_LIMIT = max(min(200, FETCH_LIMIT), 1)
+FETCH_TIME_SLICES = int(params.get('fetch_time_slices')) if params.get('fetch_time_slices') else 1
+FETCH_TIME_SLICES = max(min(10, FETCH_TIME_SLICES), 1)
+MAX_CONCURRENT_FETCH_JOBS = 4
+MAX_FOUND_NOTABLE_IDS = 2000
+SEARCH_RESULTS_SUMMARY_LIMIT = 50
 PROBLEMATIC_CHARACTERS = ['.', '(', ')', '[', ']']
 REPLACE_WITH = '_'
 REPLACE_FLAG = params.get('replaceKeys', False)
@@ -89,6 +96,106 @@ TIME_IS_MISSING = 'time_is_missing'
 
 # =========== Regular Fetch Mechanism ===========
 
+def split_fetch_window(earliest_time, latest_time, slices_count):
+    """ Splits a fetch time window into consecutive time slices of (almost) equal length
+
+    Args:
+        earliest_time (str): The start of the window in SPLUNK_TIME_FORMAT.
+        latest_time (str): The end of the window in SPLUNK_TIME_FORMAT.
+        slices_count (int): The maximal number of slices, every slice is at least a second long.
+
+    Returns:
+        list: The slices, as [earliest time, latest time, offset] lists.
+    """
+    start = datetime.strptime(earliest_time, SPLUNK_TIME_FORMAT)
+    end = datetime.strptime(latest_time, SPLUNK_TIME_FORMAT)
+    window_seconds = int((end - start).total_seconds())
+    if window_seconds <= 0:
+        return []
+
+    slices_count = min(slices_count, window_seconds)
+    boundaries = [(start + timedelta(seconds=window_seconds * i // slices_count)).strftime(SPLUNK_TIME_FORMAT)
+                  for i in range(slices_count)] + [latest_time]
+    return [[boundaries[i], boundaries[i + 1], 0] for i in range(slices_count)]
+
+
+def fetch_notables_in_time_slice(service, search_query, time_slice):
+    earliest_time, latest_time, offset = time_slice
+    kwargs_oneshot = {
+        'earliest_time': earliest_time,
+        'latest_time': latest_time,
+        'count': FETCH_LIMIT,
+        'offset': offset,
+    }
+    oneshotsearch_results = service.jobs.oneshot(search_query, **kwargs_oneshot)  # type: ignore
+    return [Notable(data=item) for item in results.ResultsReader(oneshotsearch_results)]
+
+
+def fetch_notables_in_time_slices(service, search_query, last_run_object, last_run, now):
+    """ Fetches the notables since the last run by splitting the time window into FETCH_TIME_SLICES time slices,
+    searched concurrently with at most MAX_CONCURRENT_FETCH_JOBS jobs.
+    A slice with more than FETCH_LIMIT notables is kept in the last run and continued from its offset in the next
+    fetch, before new slices are added. Notables found in previous fetches are skipped.
+
+    Args:
+        service (splunklib.client.Service): Splunk service object.
+        search_query (str): The fetch query.
+        last_run_object (dict): The last run object.
+        last_run (str): The time the previous fetch window ended at, in SPLUNK_TIME_FORMAT.
+        now (str): The current time, in SPLUNK_TIME_FORMAT.
+
+    Returns:
+        tuple: The fetched notables, the last run fields to update.
+    """
+    pending_slices = last_run_object.get('pending_slices', [])
+    if last_run_object.get('offset'):
+        # The previous fetch searched the entire window, continue it as a single slice.
+        pending_slices = [[last_run, now, last_run_object['offset']]]
+        last_run = now
+
+    time_slices = pending_slices[:FETCH_TIME_SLICES]
+    remaining_pending_slices = pending_slices[FETCH_TIME_SLICES:]
+    new_slices_count = FETCH_TIME_SLICES - len(time_slices)
+    if new_slices_count:
+        time_slices += split_fetch_window(last_run, now, new_slices_count)
+        last_run = now
+
+    pool = ThreadPool(max(min(MAX_CONCURRENT_FETCH_JOBS, len(time_slices)), 1))
+    try:
+        slices_notables = pool.map(lambda time_slice: fetch_notables_in_time_slice(service, search_query, time_slice),
+                                   time_slices)
+    finally:
+        pool.close()
+
+    found_ids = last_run_object.get('found_notable_ids', [])
+    found_ids_set = set(found_ids)
+    notables = []
+    continued_slices, continued_new_slices = [], []
+    for index, (time_slice, slice_notables) in enumerate(zip(time_slices, slices_notables)):
+        for notable in slice_notables:
+            if notable.custom_id not in found_ids_set:
+                found_ids_set.add(notable.custom_id)
+                found_ids.append(notable.custom_id)
+                notables.append(notable)
+
+        if len(slice_notables) >= FETCH_LIMIT:
+            earliest_time, latest_time, offset = time_slice
+            continued_slice = [earliest_time, latest_time, offset + len(slice_notables)]
+            if index < len(pending_slices):
+                continued_slices.append(continued_slice)
+            else:
+                continued_new_slices.append(continued_slice)
+
+    demisto.debug('Fetched {} notables in {} time slices'.format(len(notables), len(time_slices)))
+    updated_fetch_timeframe = {
+        'time': last_run,
+        'offset': 0,
+        'pending_slices': continued_slices + remaining_pending_slices + continued_new_slices,
+        'found_notable_ids': found_ids[-MAX_FOUND_NOTABLE_IDS:]
+    }
+    return notables, updated_fetch_timeframe
+
+
 def fetch_notables(service, cache_object=None, enrich_notables=False):
     demisto.debug("Fetching new notables")
     last_run_object = demisto.getLastRun()
@@ -112,13 +219,6 @@ def fetch_notables(service, cache_object=None, enrich_notables=False):
         start_time_for_fetch = current_time_for_fetch - timedelta(minutes=fetch_time_in_minutes)
         last_run = start_time_for_fetch.strftime(SPLUNK_TIME_FORMAT)
 
-    kwargs_oneshot = {
-        'earliest_time': last_run,
-        'latest_time': now,
-        'count': FETCH_LIMIT,
-        'offset': search_offset,
-    }
-
     searchquery_oneshot = dem_params['fetchQuery']
 
     if demisto.get(dem_params, 'extractFields'):
@@ -128,12 +228,15 @@ def fetch_notables(service, cache_object=None, enrich_notables=False):
             field_trimmed = field.strip()
             searchquery_oneshot = searchquery_oneshot + ' | eval ' + field_trimmed + '=' + field_trimmed
 
-    oneshotsearch_results = service.jobs.oneshot(searchquery_oneshot, **kwargs_oneshot)  # type: ignore
-    reader = results.ResultsReader(oneshotsearch_results)
-
-    notables = []
-    for item in reader:
-        notables.append(Notable(data=item))
+    if FETCH_TIME_SLICES > 1:
+        notables, updated_fetch_timeframe = fetch_notables_in_time_slices(service, searchquery_oneshot,
+                                                                          last_run_object, last_run, now)
+    else:
+        notables = fetch_notables_in_time_slice(service, searchquery_oneshot, [last_run, now, search_offset])
+        if len(notables) < FETCH_LIMIT:
+            updated_fetch_timeframe = {'time': now, 'offset': 0}
+        else:
+            updated_fetch_timeframe = {'time': last_run, 'offset': search_offset + FETCH_LIMIT}
 
     if not enrich_notables:
         incidents = [n.to_incident() for n in notables]
@@ -146,11 +249,6 @@ def fetch_notables(service, cache_object=None, enrich_notables=False):
             # want to add data to the integration context (which will ruin the logic of the cache object)
             last_run_object.update({DUMMY: DUMMY})
 
-    if len(notables) < FETCH_LIMIT:
-        updated_fetch_timeframe = {'time': now, 'offset': 0}
-    else:
-        updated_fetch_timeframe = {'time': last_run, 'offset': search_offset + FETCH_LIMIT}
-
     last_run_object.update(updated_fetch_timeframe)
     demisto.setLastRun(last_run_object)
 
@@ -1357,12 +1455,103 @@ class ResponseReaderWrapper(io.RawIOBase):
         return self.responseReader.read(n)
 
     def readinto(self, b):
-        sz = len(b)
-        data = self.responseReader.read(sz)
-        for idx, ch in enumerate(data):
-            b[idx] = ch
+        data = self.responseReader.read(len(b))
+        size = len(data)
+        memoryview(b)[:size] = data
+
+        return size
+
+
+class JSONResultsStreamReader(object):
+    """ Reads the results of a Splunk search requested with output_mode=json, similarly to results.ResultsReader.
+    Yields a results.Message for every search message and a dict for every result, decoding the results one by one
+    while the response is read in chunks, instead of loading the entire response.
+    The results are OrderedDicts, keeping the order of the fields as results.ResultsReader does.
+    """
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.decoder = json.JSONDecoder(object_pairs_hook=OrderedDict)
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def __iter__(self):
+        return self.parse_results()
+
+    def read_chunk(self):
+        if self.eof:
+            return False
+        chunk = self.stream.read(self.CHUNK_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
 
-        return len(data)
+    def next_char(self):
+        """ Consumes and returns the next non whitespace character, or an empty string at the end of the response. """
+        while True:
+            while self.pos < len(self.buffer):
+                char = self.buffer[self.pos]
+                self.pos += 1
+                if not char.isspace():
+                    return char
+            if not self.read_chunk():
+                return ''
+
+    def expect_char(self, expected):
+        char = self.next_char()
+        if char != expected:
+            raise ValueError('Failed parsing Splunk JSON results, expected "{}" but found "{}".'.format(expected, char))
+
+    def next_value(self):
+        if not self.next_char():
+            raise ValueError('Failed parsing Splunk JSON results, unexpected end of response.')
+        self.pos -= 1
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                # The value is not complete yet.
+                if not self.read_chunk():
+                    raise
+                continue
+            # A value ending with the buffer might continue in the next chunk, e.g. a number.
+            if end < len(self.buffer) or not self.read_chunk():
+                self.pos = end
+                return value
+
+    def parse_results(self):
+        self.expect_char('{')
+        while True:
+            char = self.next_char()
+            if char in ('}', ''):
+                return
+            if char == ',':
+                continue
+            self.pos -= 1
+            key = self.next_value()
+            self.expect_char(':')
+            if key == 'results':
+                self.expect_char('[')
+                while True:
+                    char = self.next_char()
+                    if char == ']':
+                        break
+                    if char == ',':
+                        continue
+                    if not char:
+                        raise ValueError('Failed parsing Splunk JSON results, unexpected end of response.')
+                    self.pos -= 1
+                    yield self.next_value()
+            elif key == 'messages':
+                for message in self.next_value():
+                    yield results.Message(message.get('type'), message.get('text'))
+            else:
+                self.next_value()
 
 
 def get_current_splunk_time(splunk_service):
@@ -1649,20 +1838,24 @@ def update_headers_from_field_names(search_result, chosen_fields):
     return headers
 
 
-def get_current_results_batch(search_job, batch_size, results_offset):
+def get_current_results_batch(search_job, batch_size, results_offset, output_mode='xml'):
     current_batch_kwargs = {
         "count": batch_size,
-        "offset": results_offset
+        "offset": results_offset,
+        "output_mode": output_mode
     }
 
     results_batch = search_job.results(**current_batch_kwargs)
     return results_batch
 
 
-def parse_batch_of_results(current_batch_of_results, max_results_to_add, app):
+def parse_batch_of_results(current_batch_of_results, max_results_to_add, app, output_mode='xml'):
     parsed_batch_results = []
     batch_dbot_scores = []
-    results_reader = results.ResultsReader(io.BufferedReader(ResponseReaderWrapper(current_batch_of_results)))
+    if output_mode == 'json':
+        results_reader = JSONResultsStreamReader(current_batch_of_results)
+    else:
+        results_reader = results.ResultsReader(io.BufferedReader(ResponseReaderWrapper(current_batch_of_results)))
     for item in results_reader:
         if isinstance(item, results.Message):
             if "Error in" in item.message:
@@ -1683,6 +1876,84 @@ def parse_batch_of_results(current_batch_of_results, max_results_to_add, app):
     return parsed_batch_results, batch_dbot_scores
 
 
+class SearchResultsFileWriter(object):
+    """ Writes the results of a Splunk search to a file batch by batch, as JSON lines or as CSV rows.
+    The CSV columns are the fields of the first written batch. Messages are written only as JSON lines.
+    """
+
+    def __init__(self, results_file, file_format):
+        self.results_file = results_file
+        self.file_format = file_format
+        self.csv_writer = None
+
+    def write(self, parsed_results):
+        if self.file_format != 'csv':
+            self.results_file.writelines(json.dumps(result) + '\n' for result in parsed_results)
+            return
+
+        rows = [result for result in parsed_results if isinstance(result, dict)]
+        if rows and not self.csv_writer:
+            fieldnames = []  # type: List[str]
+            for row in rows:
+                fieldnames.extend(field for field in row if field not in fieldnames)
+            self.csv_writer = csv.DictWriter(self.results_file, fieldnames, extrasaction='ignore')
+            self.csv_writer.writeheader()
+        for row in rows:
+            self.csv_writer.writerow({field: json.dumps(value) if isinstance(value, (list, dict)) else convert_to_str(value)
+                                      for field, value in row.items()})
+
+
+def stream_search_results_to_file(args, search_job, num_of_results_from_query, results_limit, batch_size, output_mode,
+                                  app):
+    """ Writes the results of a Splunk search to a file as they are parsed, batch by batch, while the next batch is
+    fetched, instead of keeping all of them in memory.
+
+    Returns:
+        tuple: The file entry, the first SEARCH_RESULTS_SUMMARY_LIMIT results, the number of results, the DBot scores.
+    """
+    file_format = args['results_file_format'].lower()
+    file_name = 'splunk_search_results_{}.{}'.format(search_job.sid, file_format)
+    file_id = demisto.uniqueFile()
+    summary_results = []  # type: List[Dict[str,Any]]
+    dbot_scores = {}  # type: Dict[str,Dict[str,Any]]
+    results_count = 0
+    results_offset = 0
+    next_batch = None
+    pool = ThreadPool(1)
+    try:
+        with open(demisto.investigation()['id'] + '_' + file_id, 'wb') as results_file:
+            writer = SearchResultsFileWriter(results_file, file_format)
+            if int(num_of_results_from_query) > 0 and results_limit > 0:
+                next_batch = pool.apply_async(get_current_results_batch,
+                                              (search_job, batch_size, results_offset, output_mode))
+            while next_batch:
+                current_batch_of_results = next_batch.get()
+                next_batch = None
+                results_offset += batch_size
+                if results_offset < int(num_of_results_from_query) and results_offset < results_limit:
+                    # Fetch the next batch while the current one is parsed.
+                    next_batch = pool.apply_async(get_current_results_batch,
+                                                  (search_job, batch_size, results_offset, output_mode))
+
+                parsed_batch_results, batch_dbot_scores = parse_batch_of_results(current_batch_of_results,
+                                                                                 results_limit - results_count, app,
+                                                                                 output_mode)
+                writer.write(parsed_batch_results)
+                results_count += len(parsed_batch_results)
+                summary_results.extend(parsed_batch_results[:SEARCH_RESULTS_SUMMARY_LIMIT - len(summary_results)])
+                dbot_scores.update((dbot_score['Indicator'], dbot_score) for dbot_score in batch_dbot_scores)
+                if results_count >= int(num_of_results_from_query) or results_count >= results_limit:
+                    break
+    finally:
+        if next_batch:
+            next_batch.get().close()
+        pool.close()
+
+    file_entry = {'Contents': '', 'ContentsFormat': formats['text'], 'Type': entryTypes['file'], 'File': file_name,
+                  'FileID': file_id}
+    return file_entry, summary_results, results_count, list(dbot_scores.values())
+
+
 def splunk_search_command(service):
     args = demisto.args()
 
@@ -1696,16 +1967,38 @@ def splunk_search_command(service):
         # In Splunk, a result limit of 0 means no limit.
         results_limit = float("inf")
     batch_size = int(demisto.args().get("batch_limit", 25000))
+    output_mode = demisto.args().get("output_mode", "xml")
+
+    if args.get('results_file_format'):
+        file_entry, summary_results, results_count, dbot_scores = stream_search_results_to_file(
+            args, search_job, num_of_results_from_query, results_limit, batch_size, output_mode,
+            search_kwargs.get('app', ''))
+        human_readable = build_search_human_readable(args, summary_results)
+        human_readable += '\nShowing {} out of {} results. All the results are in the {} file.'.format(
+            len(summary_results), results_count, file_entry['File'])
+        entry_context = {}
+        if args.get('update_context', "true") == "true" and dbot_scores:
+            entry_context['DBotScore'] = dbot_scores
+
+        demisto.results({
+            "Type": 1,
+            "Contents": summary_results,
+            "ContentsFormat": "json",
+            "EntryContext": entry_context,
+            "HumanReadable": human_readable
+        })
+        demisto.results(file_entry)
+        return
 
     results_offset = 0
     total_parsed_results = []  # type: List[Dict[str,Any]]
     dbot_scores = []  # type: List[Dict[str,Any]]
 
     while len(total_parsed_results) < int(num_of_results_from_query) and len(total_parsed_results) < results_limit:
-        current_batch_of_results = get_current_results_batch(search_job, batch_size, results_offset)
+        current_batch_of_results = get_current_results_batch(search_job, batch_size, results_offset, output_mode)
         max_results_to_add = results_limit - len(total_parsed_results)
         parsed_batch_results, batch_dbot_scores = parse_batch_of_results(current_batch_of_results, max_results_to_add,
-                                                                         search_kwargs.get('app', ''))
+                                                                         search_kwargs.get('app', ''), output_mode)
         total_parsed_results.extend(parsed_batch_results)
         dbot_scores.extend(batch_dbot_scores)
 
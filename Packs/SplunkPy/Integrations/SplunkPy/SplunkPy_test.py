@@ -489,6 +489,75 @@ def test_fetch_notables(mocker):
                                    "Recurring Malware Infection - Rule"
 
 
+@pytest.mark.parametrize('earliest_time, latest_time, slices_count, expected_slices', [
+    ('2021-01-01T00:00:00', '2021-01-01T00:00:10', 3, [['2021-01-01T00:00:00', '2021-01-01T00:00:03', 0],
+                                                       ['2021-01-01T00:00:03', '2021-01-01T00:00:06', 0],
+                                                       ['2021-01-01T00:00:06', '2021-01-01T00:00:10', 0]]),
+    ('2021-01-01T00:00:00', '2021-01-01T00:00:02', 5, [['2021-01-01T00:00:00', '2021-01-01T00:00:01', 0],
+                                                       ['2021-01-01T00:00:01', '2021-01-01T00:00:02', 0]]),
+    ('2021-01-01T00:00:00', '2021-01-01T00:00:00', 5, []),
+])
+def test_split_fetch_window(earliest_time, latest_time, slices_count, expected_slices):
+    assert splunk.split_fetch_window(earliest_time, latest_time, slices_count) == expected_slices
+
+
+def test_fetch_notables_in_time_slices(mocker):
+    """
+    Given:
+        - A fetch window split into 3 time slices, with a fetch limit of 2.
+        - A notable found in the previous fetch and a notable returned by two slices.
+
+    When:
+        - Fetching notables twice.
+
+    Then:
+        - Ensure the slices are searched, the found notables are skipped and the truncated slice is continued
+          from its offset in the next fetch, before new slices.
+    """
+    slices_notables = {
+        ('2021-01-01T00:00:00', 0): [{'event_id': '1'}, {'event_id': '2'}],
+        ('2021-01-01T00:00:02', 0): [{'event_id': '3'}],
+        ('2021-01-01T00:00:04', 0): [{'event_id': '3'}, {'event_id': '4'}],
+        ('2021-01-01T00:00:00', 2): [{'event_id': '5'}],
+        ('2021-01-01T00:00:04', 2): [],
+    }
+    searches = []
+
+    class Jobs:
+        def oneshot(self, query, **kwargs):
+            searches.append((kwargs['earliest_time'], kwargs['latest_time'], kwargs['offset']))
+            return slices_notables[(kwargs['earliest_time'], kwargs['offset'])]
+
+    class Service:
+        jobs = Jobs()
+
+    mocker.patch.object(splunk, 'FETCH_TIME_SLICES', 3)
+    mocker.patch.object(splunk, 'FETCH_LIMIT', 2)
+    mocker.patch('SplunkPy.results.ResultsReader', side_effect=lambda oneshot_results: oneshot_results)
+    mocker.patch.object(splunk.Notable, 'get_occurred', return_value='2021-01-01T00:00:00Z')
+
+    notables, last_run = splunk.fetch_notables_in_time_slices(Service(), 'search', {'found_notable_ids': ['2']},
+                                                              '2021-01-01T00:00:00', '2021-01-01T00:00:06')
+
+    assert sorted(searches) == [('2021-01-01T00:00:00', '2021-01-01T00:00:02', 0),
+                                ('2021-01-01T00:00:02', '2021-01-01T00:00:04', 0),
+                                ('2021-01-01T00:00:04', '2021-01-01T00:00:06', 0)]
+    assert [notable.id for notable in notables] == ['1', '3', '4']
+    assert last_run == {'time': '2021-01-01T00:00:06', 'offset': 0,
+                        'pending_slices': [['2021-01-01T00:00:00', '2021-01-01T00:00:02', 2],
+                                           ['2021-01-01T00:00:04', '2021-01-01T00:00:06', 2]],
+                        'found_notable_ids': ['2', '1', '3', '4']}
+
+    del searches[:]
+    notables, last_run = splunk.fetch_notables_in_time_slices(Service(), 'search', last_run,
+                                                              '2021-01-01T00:00:06', '2021-01-01T00:00:06')
+
+    assert sorted(searches) == [('2021-01-01T00:00:00', '2021-01-01T00:00:02', 2),
+                                ('2021-01-01T00:00:04', '2021-01-01T00:00:06', 2)]
+    assert [notable.id for notable in notables] == ['5']
+    assert last_run['pending_slices'] == []
+
+
 """ ========== Enriching Fetch Mechanism Tests ========== """
 
 
@@ -1070,3 +1139,153 @@ def test_build_search_human_readable(mocker):
     splunk.build_search_human_readable(args, results)
     headers = func_patch.call_args[0][1]
     assert headers == expected_headers
+
+
+def test_response_reader_wrapper_readinto():
+    """
+    Given:
+        A response of a Splunk search.
+
+    When:
+        Reading it through ResponseReaderWrapper, as done for results.ResultsReader.
+
+    Then:
+        Ensure the entire response is read as is.
+    """
+    from StringIO import StringIO
+    import io
+    response = '<results>' + ''.join('<result offset="{}"/>'.format(i) for i in range(10000)) + '</results>'
+
+    reader = io.BufferedReader(splunk.ResponseReaderWrapper(StringIO(response)))
+
+    assert ''.join(iter(lambda: reader.read(1000), '')) == response
+
+
+JSON_RESULTS = {
+    'preview': False,
+    'init_offset': 123456,
+    'messages': [{'type': 'INFO', 'text': 'Your timerange was substituted'}],
+    'fields': [{'name': 'host'}, {'name': 'count'}],
+    'results': [{'host': 'host{}'.format(i), 'count': str(i), 'tags': ['a', 'b, "c"'], 'raw': u'\u00e9v\u00e9nement'}
+                for i in range(50)],
+    'highlighted': {}
+}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64 * 1024])
+def test_json_results_stream_reader(mocker, chunk_size):
+    """
+    Given:
+        A response of a Splunk search requested with output_mode=json.
+
+    When:
+        Reading it with JSONResultsStreamReader in chunks of different sizes.
+
+    Then:
+        Ensure the messages and the results are returned in order, as results.ResultsReader does.
+    """
+    from StringIO import StringIO
+    mocker.patch.object(splunk.JSONResultsStreamReader, 'CHUNK_SIZE', chunk_size)
+    response = StringIO(json.dumps(JSON_RESULTS, indent=1))
+
+    parsed_results = list(splunk.JSONResultsStreamReader(response))
+
+    assert parsed_results == [splunk.results.Message('INFO', 'Your timerange was substituted')] + \
+        JSON_RESULTS['results']
+
+
+@pytest.mark.parametrize('response', ['{"results": [{"host": "a"}, {"host": ', '{"results": [{"host": "a"}', '[]'])
+def test_json_results_stream_reader_invalid_response(response):
+    """
+    Given:
+        A truncated or invalid response of a Splunk search requested with output_mode=json.
+
+    When:
+        Reading it with JSONResultsStreamReader.
+
+    Then:
+        Ensure a ValueError is raised.
+    """
+    from StringIO import StringIO
+
+    with pytest.raises(ValueError):
+        list(splunk.JSONResultsStreamReader(StringIO(response)))
+
+
+def test_parse_batch_of_results_json():
+    """
+    Given:
+        A batch of Splunk search results requested with output_mode=json.
+
+    When:
+        Parsing the batch as part of splunk-search.
+
+    Then:
+        Ensure the results are limited, the app is added and a DBot score is created per host.
+    """
+    from StringIO import StringIO
+    response = StringIO(json.dumps(JSON_RESULTS))
+
+    parsed_results, dbot_scores = splunk.parse_batch_of_results(response, 5, 'search', output_mode='json')
+
+    assert parsed_results[0] == 'Your timerange was substituted'
+    assert parsed_results[1] == dict(JSON_RESULTS['results'][0], app='search')
+    assert len(parsed_results) == 5
+    assert [score['Indicator'] for score in dbot_scores] == ['host0', 'host1', 'host2', 'host3']
+
+
+@pytest.mark.parametrize('results_file_format, expected_content', [
+    ('JSONL', ''.join('{{"host": "host{0}", "count": "{0}"}}\n'.format(i) for i in range(5))),
+    ('CSV', 'host,count\r\n' + ''.join('host{0},{0}\r\n'.format(i) for i in range(5))),
+])
+def test_splunk_search_command_results_file(mocker, tmpdir, results_file_format, expected_content):
+    """
+    Given:
+        A Splunk search with 5 results, retrieved in batches of 2.
+
+    When:
+        Running splunk-search with results_file_format.
+
+    Then:
+        Ensure all the results are written to the file, and the entry shows the first results.
+    """
+    from StringIO import StringIO
+    search_results = [OrderedDict([('host', 'host{}'.format(i)), ('count', str(i))]) for i in range(5)]
+    requested_batches = []
+
+    class Job:
+        sid = '123'
+
+        def __getitem__(self, key):
+            return '5'
+
+        def results(self, count, offset, output_mode):
+            requested_batches.append((offset, count))
+            return StringIO(json.dumps({'results': search_results[offset:offset + count]}))
+
+    class Jobs:
+        def create(self, query, **kwargs):
+            return Job()
+
+    class Service:
+        jobs = Jobs()
+
+    tmpdir.chdir()
+    mocker.patch.object(splunk, 'SEARCH_RESULTS_SUMMARY_LIMIT', 3)
+    mocker.patch.object(demisto, 'args', return_value={'query': 'index=main', 'event_limit': '0', 'batch_limit': '2',
+                                                       'output_mode': 'json',
+                                                       'results_file_format': results_file_format})
+    mocker.patch.object(demisto, 'uniqueFile', return_value='results_file')
+    mocker.patch.object(demisto, 'results')
+
+    splunk.splunk_search_command(Service())
+
+    summary_entry, file_entry = [call_args[0][0] for call_args in demisto.results.call_args_list]
+    assert sorted(requested_batches) == [(0, 2), (2, 2), (4, 2)]
+    assert summary_entry['Contents'] == search_results[:3]
+    assert 'Showing 3 out of 5 results. All the results are in the splunk_search_results_123.{} file.'.format(
+        results_file_format.lower()) in summary_entry['HumanReadable']
+    assert len(summary_entry['EntryContext']['DBotScore']) == 5
+    assert file_entry['File'] == 'splunk_search_results_123.{}'.format(results_file_format.lower())
+    with open('{}_results_file'.format(demisto.investigation()['id'])) as results_file:
+        assert results_file.read() == expected_content
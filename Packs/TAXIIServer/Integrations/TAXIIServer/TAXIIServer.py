@@ -5,10 +5,11 @@ from gevent.pywsgi import WSGIServer
 from urllib.parse import urlparse, ParseResult
 from tempfile import NamedTemporaryFile
 from base64 import b64decode
-from typing import Callable, List, Generator
+from typing import Callable, List, Generator, Iterator, Tuple, Union
 from ssl import SSLContext, SSLError, PROTOCOL_TLSv1_2
 from multiprocessing import Process
 from werkzeug.datastructures import Headers
+from collections import OrderedDict
 
 from libtaxii.messages_11 import (
     TAXIIMessage,
@@ -18,6 +19,7 @@ from libtaxii.messages_11 import (
     CollectionInformation,
     CollectionInformationResponse,
     PollRequest,
+    PollFulfillmentRequest,
     PollingServiceInstance,
     ServiceInstance,
     ContentBlock,
@@ -27,6 +29,7 @@ from libtaxii.constants import (
     MSG_COLLECTION_INFORMATION_REQUEST,
     MSG_DISCOVERY_REQUEST,
     MSG_POLL_REQUEST,
+    MSG_POLL_FULFILLMENT_REQUEST,
     SVC_DISCOVERY,
     SVC_COLLECTION_MANAGEMENT,
     SVC_POLL,
@@ -36,6 +39,7 @@ from cybox.core import Observable
 from requests.utils import requote_uri
 
 import functools
+import itertools
 import stix.core
 import stix.indicator
 import stix.extensions.marking.ais
@@ -59,6 +63,12 @@ PAGE_SIZE = 200
 APP: Flask = Flask('demisto-taxii')
 NAMESPACE_URI = 'https://www.paloaltonetworks.com/cortex'
 NAMESPACE = 'cortex'
+EPOCH = datetime(1970, 1, 1, tzinfo=pytz.utc)
+# The maximal total length of the cached content blocks, in characters
+CONTENT_BLOCKS_CACHE_MAX_SIZE = 100 * 1024 * 1024
+# Indicator ID to its modified time and its content block XML, from the least recently used
+CONTENT_BLOCKS_CACHE: OrderedDict = OrderedDict()
+CONTENT_BLOCKS_CACHE_SIZE = 0
 
 
 ''' Log Handler '''
@@ -81,7 +91,8 @@ class Handler:
 
 class TAXIIServer:
     def __init__(self, url_scheme: str, host: str, port: int, collections: dict, certificate: str, private_key: str,
-                 http_server: bool, credentials: dict, service_address: Optional[str] = None):
+                 http_server: bool, credentials: dict, service_address: Optional[str] = None,
+                 result_part_size: int = 0):
         """
         Class for a TAXII Server configuration.
         Args:
@@ -93,6 +104,9 @@ class TAXIIServer:
             private_key: The private key for SSL.
             http_server: Whether to use HTTP server (not SSL).
             credentials: The user credentials.
+            service_address: The service URL address to set in the responses.
+            result_part_size: The maximal number of indicators in a part of the poll results, 0 to return all of them
+                in one poll response.
         """
         self.url_scheme = url_scheme
         self.host = host
@@ -102,6 +116,7 @@ class TAXIIServer:
         self.private_key = private_key
         self.http_server = http_server
         self.service_address = service_address
+        self.result_part_size = result_part_size
         self.auth = None
         if credentials:
             self.auth = (credentials.get('identifier', ''), credentials.get('password', ''))
@@ -197,36 +212,46 @@ class TAXIIServer:
 
         return collection_info_response
 
-    def get_poll_response(self, taxii_message: PollRequest) -> Response:
+    def get_poll_response(self, taxii_message: Union[PollRequest, PollFulfillmentRequest]) -> Response:
         """
-        Handle poll request.
+        Handle poll request, or poll fulfillment request of a further part of the poll results.
         Args:
-            taxii_message: The poll request message.
+            taxii_message: The poll request or poll fulfillment request message.
 
         Returns:
             The poll response.
         """
-        if taxii_message.message_type != MSG_POLL_REQUEST:
+        if taxii_message.message_type == MSG_POLL_REQUEST:
+            exclusive_begin_time = taxii_message.exclusive_begin_timestamp_label
+            inclusive_end_time = taxii_message.inclusive_end_timestamp_label
+            result_part_number = 1
+        elif taxii_message.message_type == MSG_POLL_FULFILLMENT_REQUEST:
+            if not self.result_part_size:
+                raise ValueError('Invalid message, the poll results are not divided to parts')
+            exclusive_begin_time, inclusive_end_time = parse_result_id(taxii_message.result_id)
+            result_part_number = int(taxii_message.result_part_number)
+        else:
             raise ValueError('Invalid message, invalid Message Type')
 
         taxii_feeds = list(self.collections.keys())
         collection_name = taxii_message.collection_name
-        exclusive_begin_time = taxii_message.exclusive_begin_timestamp_label
-        inclusive_end_time = taxii_message.inclusive_end_timestamp_label
 
         return self.stream_stix_data_feed(taxii_feeds, taxii_message.message_id, collection_name,
-                                          exclusive_begin_time, inclusive_end_time)
+                                          exclusive_begin_time, inclusive_end_time, result_part_number)
 
     def stream_stix_data_feed(self, taxii_feeds: list, message_id: str, collection_name: str,
-                              exclusive_begin_time: datetime, inclusive_end_time: datetime) -> Response:
+                              exclusive_begin_time: datetime, inclusive_end_time: datetime,
+                              result_part_number: int = 1) -> Response:
         """
         Get the indicator query results in STIX data feed format.
+        The indicators are searched page by page while the response is streamed.
         Args:
             taxii_feeds: The available taxii feeds according to the collections.
             message_id: The taxii message ID.
             collection_name: The collection name to get the indicator query from.
             exclusive_begin_time: The query exclusive begin time.
             inclusive_end_time: The query inclusive end time.
+            result_part_number: The part of the results to return, when they are divided to parts.
 
         Returns:
             Stream of STIX indicator data feed.
@@ -243,13 +268,23 @@ class TAXIIServer:
             Streams the STIX indicators as XML string.
 
             """
+            indicator_query = self.collections[str(collection_name)]
+            offset = (result_part_number - 1) * self.result_part_size
+            total, indicators = find_indicators_by_time_frame(indicator_query, exclusive_begin_time, inclusive_end_time,
+                                                              offset, self.result_part_size)
+            more = bool(self.result_part_size) and total > offset + self.result_part_size
+            result_id = ''
+            if self.result_part_size:
+                result_id = f' result_id="{create_result_id(exclusive_begin_time, inclusive_end_time)}"'
+
             # yield the opening tag of the Poll Response
             response = '<taxii_11:Poll_Response xmlns:taxii="http://taxii.mitre.org/messages/taxii_xml_binding-1"' \
                        ' xmlns:taxii_11="http://taxii.mitre.org/messages/taxii_xml_binding-1.1" ' \
                        'xmlns:tdq="http://taxii.mitre.org/query/taxii_default_query-1"' \
                        f' message_id="{generate_message_id()}"' \
                        f' in_response_to="{message_id}"' \
-                       f' collection_name="{collection_name}" more="false" result_part_number="1"> ' \
+                       f' collection_name="{collection_name}" more="{str(more).lower()}"{result_id}' \
+                       f' result_part_number="{result_part_number}"> ' \
                        f'<taxii_11:Inclusive_End_Timestamp>{inclusive_end_time.isoformat()}' \
                        '</taxii_11:Inclusive_End_Timestamp>'
 
@@ -260,17 +295,9 @@ class TAXIIServer:
             yield response
 
             # yield the content blocks
-            indicator_query = self.collections[str(collection_name)]
-
-            for indicator in find_indicators_by_time_frame(indicator_query, exclusive_begin_time, inclusive_end_time):
+            for indicator in indicators:
                 try:
-                    stix_xml_indicator = get_stix_indicator(indicator).to_xml(ns_dict={NAMESPACE_URI: NAMESPACE})
-                    content_block = ContentBlock(
-                        content_binding=CB_STIX_XML_11,
-                        content=stix_xml_indicator
-                    )
-
-                    content_xml = content_block.to_xml().decode('utf-8')
+                    content_xml = get_content_block_xml(indicator)
                     yield f'{content_xml}\n'
                 except Exception as e:
                     handle_long_running_error(f'Failed parsing indicator to STIX: {e}')
@@ -611,6 +638,44 @@ def get_stix_indicator(indicator: dict) -> stix.core.STIXPackage:
     return stix_package
 
 
+def get_content_block_xml(indicator: dict) -> str:
+    """
+    Convert a Demisto indicator to a TAXII content block of the STIX indicator.
+    The content blocks are cached by the indicator ID, and serialized again only if the indicator was modified.
+    Args:
+        indicator: The Demisto indicator.
+
+    Returns:
+        The content block as XML string.
+    """
+    global CONTENT_BLOCKS_CACHE_SIZE
+    indicator_id = indicator.get('id')
+    modified = indicator.get('modified')
+    cached = CONTENT_BLOCKS_CACHE.get(indicator_id) if indicator_id else None
+    if cached and cached[0] == modified:
+        CONTENT_BLOCKS_CACHE.move_to_end(indicator_id)
+        return cached[1]
+
+    stix_xml_indicator = get_stix_indicator(indicator).to_xml(ns_dict={NAMESPACE_URI: NAMESPACE})
+    content_block = ContentBlock(
+        content_binding=CB_STIX_XML_11,
+        content=stix_xml_indicator
+    )
+    content_xml = content_block.to_xml().decode('utf-8')
+
+    if indicator_id and modified:
+        if cached:
+            CONTENT_BLOCKS_CACHE_SIZE -= len(cached[1])
+        CONTENT_BLOCKS_CACHE[indicator_id] = (modified, content_xml)
+        CONTENT_BLOCKS_CACHE.move_to_end(indicator_id)
+        CONTENT_BLOCKS_CACHE_SIZE += len(content_xml)
+        while CONTENT_BLOCKS_CACHE_SIZE > CONTENT_BLOCKS_CACHE_MAX_SIZE:
+            _, (_, evicted_xml) = CONTENT_BLOCKS_CACHE.popitem(last=False)
+            CONTENT_BLOCKS_CACHE_SIZE -= len(evicted_xml)
+
+    return content_xml
+
+
 ''' HELPER FUNCTIONS '''
 
 
@@ -722,16 +787,19 @@ def get_collections(params: dict = demisto.params()) -> dict:
     return collections
 
 
-def find_indicators_by_time_frame(indicator_query: str, begin_time: datetime, end_time: datetime) -> list:
+def find_indicators_by_time_frame(indicator_query: str, begin_time: datetime, end_time: datetime, offset: int = 0,
+                                  limit: int = 0) -> Tuple[int, Iterator[dict]]:
     """
     Find indicators according to a query and begin time/end time.
     Args:
         indicator_query: The indicator query.
         begin_time: The exclusive begin time.
         end_time: The inclusive end time.
+        offset: The number of indicators to skip.
+        limit: The maximal number of indicators to return, 0 for all of them.
 
     Returns:
-        Indicator query results from Demisto.
+        The total number of indicators which match the query, and the indicator query results from Demisto.
     """
 
     if indicator_query:
@@ -749,29 +817,75 @@ def find_indicators_by_time_frame(indicator_query: str, begin_time: datetime, en
         indicator_query += f'sourcetimestamp:<="{tz_end_time}"'
     demisto.info(f'Querying indicators by: {indicator_query}')
 
-    return find_indicators_loop(indicator_query)
+    return find_indicators_loop(indicator_query, offset, limit)
 
 
-def find_indicators_loop(indicator_query: str):
+def find_indicators_loop(indicator_query: str, offset: int = 0, limit: int = 0) -> Tuple[int, Iterator[dict]]:
     """
     Find indicators in a loop according to a query.
+    Only the first page is searched before returning, and the next pages are searched while the results are consumed.
     Args:
         indicator_query: The indicator query.
+        offset: The number of indicators to skip.
+        limit: The maximal number of indicators to return, 0 for all of them.
 
     Returns:
-        Indicator query results from Demisto.
+        The total number of indicators which match the query, and the indicator query results from Demisto.
     """
-    iocs: List[dict] = []
-    total_fetched = 0
-    last_found_len = PAGE_SIZE
-    search_indicators = IndicatorsSearcher()
+    search_indicators = IndicatorsSearcher(page=offset // PAGE_SIZE)
+
+    def search_page() -> List[dict]:
+        return search_indicators.search_indicators_by_version(query=indicator_query, size=PAGE_SIZE).get('iocs') or []
+
+    def iter_pages(fetched_iocs: List[dict]) -> Iterator[List[dict]]:
+        yield fetched_iocs
+        while len(fetched_iocs) == PAGE_SIZE:
+            fetched_iocs = search_page()
+            yield fetched_iocs
 
-    while last_found_len == PAGE_SIZE:
-        fetched_iocs = search_indicators.search_indicators_by_version(query=indicator_query, size=PAGE_SIZE).get('iocs')
-        iocs.extend(fetched_iocs)
-        last_found_len = len(fetched_iocs)
-        total_fetched += last_found_len
-    return iocs
+    iocs = itertools.chain.from_iterable(iter_pages(search_page()))
+    start = offset % PAGE_SIZE
+    return search_indicators.total or 0, itertools.islice(iocs, start, start + limit if limit else None)
+
+
+def create_result_id(begin_time: Optional[datetime], end_time: datetime) -> str:
+    """
+    Create the result ID of poll results which are divided to parts, from the time frame of the poll.
+    The parts are requested by the result ID, so they are all taken from the same time frame.
+    Args:
+        begin_time: The exclusive begin time.
+        end_time: The inclusive end time.
+
+    Returns:
+        The result ID.
+    """
+    def to_microseconds(time: Optional[datetime]) -> str:
+        if not time:
+            return ''
+        if not time.tzinfo:
+            time = time.replace(tzinfo=pytz.utc)
+        return str((time - EPOCH) // timedelta(microseconds=1))
+
+    return f'{to_microseconds(begin_time)}-{to_microseconds(end_time)}'
+
+
+def parse_result_id(result_id: str) -> Tuple[Optional[datetime], datetime]:
+    """
+    Get the time frame of the poll from the result ID.
+    Args:
+        result_id: The result ID, as created by create_result_id.
+
+    Returns:
+        The exclusive begin time and the inclusive end time.
+    """
+    try:
+        begin_time, end_time = [EPOCH + timedelta(microseconds=int(time)) if time else None
+                                for time in str(result_id).split('-')]
+    except ValueError:
+        raise ValueError('Invalid message, unknown result ID')
+    if not end_time:
+        raise ValueError('Invalid message, unknown result ID')
+    return begin_time, end_time
 
 
 def taxii_make_response(taxii_message: TAXIIMessage):
@@ -940,8 +1054,10 @@ def main():
         scheme = 'https'
 
     service_address = params.get('service_address')
+    result_part_size = arg_to_number(params.get('result_part_size'),
+                                     arg_name='Maximal Number of Indicators in a Poll Response') or 0
     SERVER = TAXIIServer(scheme, str(host_name), port, collections,
-                         certificate, private_key, http_server, credentials, service_address)
+                         certificate, private_key, http_server, credentials, service_address, result_part_size)
 
     demisto.debug(f'Command being called is {command}')
     commands = {
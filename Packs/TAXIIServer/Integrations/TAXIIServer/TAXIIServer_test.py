@@ -372,7 +372,7 @@ def test_find_indicators_by_time_frame(mocker):
     import pytz
     from TAXIIServer import find_indicators_by_time_frame
 
-    def find_indicators(indicator_query):
+    def find_indicators(indicator_query, offset, limit):
         if indicator_query == INDICATOR_QUERY:
             return 'yep'
         return 'nope'
@@ -398,9 +398,11 @@ def test_find_indicators_loop(mocker):
     mocker.patch.object(demisto, 'searchIndicators', return_value=json.loads(IP_INDICATORS))
 
     # Arrange
-    indicators = find_indicators_loop('q')
+    total, indicators = find_indicators_loop('q')
+    indicators = list(indicators)
 
     # Assert
+    assert total == 1
     assert len(indicators) == 1
     assert indicators[0]['value'] == '52.218.100.20'
 
@@ -451,3 +453,132 @@ def test_get_url(mocker, request_headers, url_scheme, expected):
     if request_headers:
         mocker.patch('TAXIIServer.get_calling_context', return_value={'IntegrationInstance': 'eyy'})
     assert taxii_server.get_url(request_headers) == expected
+
+
+def test_find_indicators_loop__lazy(mocker):
+    """
+    Given:
+        - 7 indicators which match the query, searched in pages of 3 indicators.
+
+    When:
+        - Finding 3 indicators, after skipping the first 2 of them.
+
+    Then:
+        - Ensure the requested indicators are returned with the total number of indicators.
+        - Ensure the pages are searched only while the indicators are consumed, and not after the limit.
+    """
+    from TAXIIServer import find_indicators_loop
+    search_indicators = mocker.patch.object(demisto, 'searchIndicators',
+                                            side_effect=create_search_indicators([f'1.1.1.{i}' for i in range(7)]))
+    mocker.patch('TAXIIServer.PAGE_SIZE', 3)
+
+    total, indicators = find_indicators_loop('q', offset=2, limit=3)
+    assert total == 7
+    assert search_indicators.call_count == 1
+    assert next(indicators)['value'] == '1.1.1.2'
+    assert search_indicators.call_count == 1
+    assert [indicator['value'] for indicator in indicators] == ['1.1.1.3', '1.1.1.4']
+    assert search_indicators.call_count == 2
+
+
+def test_get_poll_response__result_parts(mocker):
+    """
+    Given:
+        - A collection of 5 indicators, and a server which divides the poll results to parts of 2 indicators.
+
+    When:
+        - Polling the collection, and then requesting the further parts of the results by poll fulfillment requests.
+
+    Then:
+        - Ensure each part includes the next indicators, and that more parts are reported until the last part.
+        - Ensure the further parts are searched in the time frame of the poll.
+    """
+    import datetime
+    import pytz
+    from libtaxii.messages_11 import PollRequest, PollFulfillmentRequest, get_message_from_xml
+    import TAXIIServer
+    values = [f'1.1.1.{i}' for i in range(5)]
+    search_indicators = mocker.patch.object(demisto, 'searchIndicators', side_effect=create_search_indicators(values))
+    mocker.patch.object(demisto, 'info')
+    mocker.patch('TAXIIServer.PAGE_SIZE', 3)
+    taxii_server = TAXIIServer.TAXIIServer(
+        url_scheme='http', host='host', port=9000, collections={'ips': 'type:IP'},
+        certificate='', private_key='', http_server=False, credentials={}, result_part_size=2
+    )
+    end_time = datetime.datetime(2020, 2, 20, 11, 32, 32, 644224, tzinfo=pytz.utc)
+    taxii_message = PollRequest(message_id='1', collection_name='ips', inclusive_end_timestamp_label=end_time,
+                                poll_parameters=PollRequest.PollParameters())
+    poll_responses = []
+    with TAXIIServer.APP.test_request_context():
+        while True:
+            response = taxii_server.get_poll_response(taxii_message)
+            poll_response = get_message_from_xml(response.get_data())
+            poll_responses.append(poll_response)
+            if not poll_response.more:
+                break
+            taxii_message = PollFulfillmentRequest(message_id='2', collection_name='ips',
+                                                   result_id=poll_response.result_id,
+                                                   result_part_number=poll_response.result_part_number + 1)
+
+    assert [response.result_part_number for response in poll_responses] == [1, 2, 3]
+    assert [len(response.content_blocks) for response in poll_responses] == [2, 2, 1]
+    content = ''.join(block.content.decode('utf-8') for response in poll_responses
+                      for block in response.content_blocks)
+    assert all(value in content for value in values)
+    assert all(call[1]['query'].endswith('sourcetimestamp:<="2020-02-20T11:32:32 +0000"')
+               for call in search_indicators.call_args_list)
+
+
+def create_search_indicators(values: list):
+    """
+    Create a mock of demisto.searchIndicators, which returns IP indicators of the given values.
+    """
+    ioc = json.loads(IP_INDICATORS)['iocs'][0]
+    iocs = [dict(ioc, id=str(i), value=value) for i, value in enumerate(values)]
+
+    def search_indicators(size, page=None, searchAfter=None, **kwargs):
+        start = searchAfter[0] if searchAfter else page * size
+        end = start + size
+        return {'iocs': iocs[start:end], 'total': len(iocs), 'searchAfter': [end] if end < len(iocs) else None}
+
+    return search_indicators
+
+
+def test_get_content_block_xml__cache(mocker):
+    """
+    Given:
+        - IP indicators, and a content blocks cache which is bounded to the size of 2 content blocks.
+
+    When:
+        - Converting the indicators to content blocks several times, and after an indicator was modified.
+
+    Then:
+        - Ensure an indicator is serialized again only if it was modified or evicted from the cache.
+        - Ensure the least recently used content block is evicted when the cache is full.
+    """
+    import TAXIIServer
+    ioc = json.loads(IP_INDICATORS)['iocs'][0]
+    indicators = [dict(ioc, id=str(i), value=f'1.1.1.{i}') for i in range(3)]
+    mocker.patch.object(TAXIIServer, 'CONTENT_BLOCKS_CACHE', TAXIIServer.OrderedDict())
+    mocker.patch.object(TAXIIServer, 'CONTENT_BLOCKS_CACHE_SIZE', 0)
+    get_stix_indicator = mocker.spy(TAXIIServer, 'get_stix_indicator')
+
+    content_xml = TAXIIServer.get_content_block_xml(indicators[0])
+    assert '1.1.1.0' in content_xml
+    mocker.patch.object(TAXIIServer, 'CONTENT_BLOCKS_CACHE_MAX_SIZE', len(content_xml) * 2 + 10)
+    assert TAXIIServer.get_content_block_xml(indicators[0]) == content_xml
+    assert get_stix_indicator.call_count == 1
+
+    TAXIIServer.get_content_block_xml(indicators[1])
+    TAXIIServer.get_content_block_xml(indicators[0])
+    assert get_stix_indicator.call_count == 2
+
+    # indicator 1 is the least recently used, so it is evicted
+    TAXIIServer.get_content_block_xml(indicators[2])
+    assert list(TAXIIServer.CONTENT_BLOCKS_CACHE) == ['0', '2']
+    assert get_stix_indicator.call_count == 3
+
+    modified_indicator = dict(indicators[0], modified='2021-02-19T17:45:07.468975+02:00', value='1.1.1.10')
+    assert '1.1.1.10' in TAXIIServer.get_content_block_xml(modified_indicator)
+    assert get_stix_indicator.call_count == 4
+    assert TAXIIServer.CONTENT_BLOCKS_CACHE_SIZE == sum(len(xml) for _, xml in TAXIIServer.CONTENT_BLOCKS_CACHE.values())
@@ -10,13 +10,19 @@ For example to run a simple script which sends a log entry to the server via cal
 echo '{"script": "demisto.log(\"this is an example entry log\")", "integration": false, "native": false}' | \
 docker run --rm -i -v `pwd`:/work -w /work demisto/python3:3.8.6.12176 python Utils/_script_docker_python_loop_example.py
 
+Scripts are compiled once and their code objects are reused when the same script runs again in the container.
+Heavy modules are imported once when the container starts, set PYTHON_LOOP_PREIMPORT_MODULES to a comma separated
+list of modules to change them.
+
 """
 
+import hashlib
 import os
 import threading
 import sys
 import json
 import traceback
+from collections import OrderedDict
 
 if sys.version_info[0] < 3:
     import Queue as queue
@@ -402,6 +408,48 @@ print = demisto_print
 ###CODE_HERE###
 '''
 
+# modules which are imported once when the container starts, so scripts importing them do not pay for it on every run.
+# can be configured with a comma separated list in the PYTHON_LOOP_PREIMPORT_MODULES environment variable.
+DEFAULT_PREIMPORT_MODULES = 'requests,dateparser,pandas'
+
+# the maximum number of compiled scripts kept in memory
+MAX_CACHED_CODE_OBJECTS = 32
+
+__code_cache = OrderedDict()
+
+
+def preimport_modules():
+    modules = os.environ.get('PYTHON_LOOP_PREIMPORT_MODULES', DEFAULT_PREIMPORT_MODULES)
+    for module in modules.split(','):
+        module = module.strip()
+        if not module:
+            continue
+        try:
+            # only loads the module to sys.modules, scripts still need to import it to their own namespace
+            __import__(module)
+        except Exception:
+            # the module is not installed in this docker image
+            pass
+
+
+# compiles the script with its template, or returns the code object of a previous run of the same script.
+# code objects are immutable, so reusing them does not share any state between runs.
+def get_compiled_code(code_string, is_integ_script):
+    if not isinstance(code_string, bytes):
+        code_string = code_string.encode('utf-8')
+    code_hash = hashlib.sha256(code_string).hexdigest() + ('-integration' if is_integ_script else '-script')
+
+    code = __code_cache.pop(code_hash, None)
+    if code is None:
+        template = integ_template_code if is_integ_script else template_code
+        complete_code = template.replace('###CODE_HERE###', code_string.decode('utf-8'))
+        code = compile(complete_code, '<string>', 'exec')
+        if len(__code_cache) >= MAX_CACHED_CODE_OBJECTS:
+            __code_cache.popitem(last=False)
+    __code_cache[code_hash] = code
+    return code
+
+
 # rollback file system to its previous state
 # delete home dir and tmp dir
 
@@ -452,6 +500,8 @@ def rollback_system():
         os.environ[key] = backup_env_vars[key]
 
 
+preimport_modules()
+
 while True:
     contextString = do_ping_pong()
     if contextString == '':
@@ -464,15 +514,11 @@ while True:
     contextJSON.pop('script', None)
 
     is_integ_script = contextJSON['integration']
-    complete_code = ''
-    if is_integ_script:
-        complete_code = integ_template_code.replace('###CODE_HERE###', code_string)
-    else:
-        complete_code = template_code.replace('###CODE_HERE###', code_string)
 
     try:
-        code = compile(complete_code, '<string>', 'exec')
+        code = get_compiled_code(code_string, is_integ_script)
 
+        # every run gets its own new globals, so nothing defined by one script leaks to the next one
         sub_globals = {
             '__readWhileAvailable': __readWhileAvailable,
             'context': contextJSON,